@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import json
+import argparse
+import tempfile
+import subprocess
+import numpy
+from concurrent.futures import ThreadPoolExecutor
+
+def eprint(*args, **kwargs):
+  print(*args, file=sys.stderr, **kwargs)
+
+
+parser = argparse.ArgumentParser(description=
+ 'Estimates rotation axis of the CT scan from several pairs of 180-degree separated projections'
+ ' and several rows of them. Estimates are combined robustly, accounting for the tilt of the axis.'
+ ' The result "centre tilt confidence" is printed in the last line of the standart output:'
+ ' centre is the deviation of the axis from the centre of the image at its middle row,'
+ ' tilt is the slope of the axis in degrees and confidence is a number between 0 and 1.')
+parser.add_argument('volume', type=str,
+                    help='HDF5 volume of projections in the form file:container.')
+parser.add_argument('-a', '--ark', type=int, required=True,
+                    help='Number of projections constituting 180 degree ark.')
+parser.add_argument('-p', '--pairs', type=int, default=5,
+                    help='Number of 180-degree pairs to evaluate.')
+parser.add_argument('-r', '--rows', type=int, default=5,
+                    help='Number of row bands to evaluate in each pair.')
+parser.add_argument('-R', '--band', type=int, default=64,
+                    help='Height of each row band in pixels. Full height is used if 0.')
+parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                    help='Number of concurrent ctas processes.')
+parser.add_argument('-c', '--cache', type=str, default='.imbl-cor.cache',
+                    help='File to cache results in. Use empty string to disable caching.')
+parser.add_argument('-o', '--output', type=str, default='',
+                    help='Save superimposition of the first pair of projections into given image.')
+parser.add_argument('-v', '--verbose', action='store_true',
+                    help='Report individual estimates.')
+args = parser.parse_args()
+
+
+vfile, _, vdata = args.volume.partition(':')
+if not os.path.exists(vfile):
+  eprint(f"Error! Non existing input file \"{vfile}\".")
+  sys.exit(1)
+
+outed = subprocess.run(['h5ls', f'{vfile}/{vdata.strip("/")}'], capture_output=True, text=True,
+                       env=dict(os.environ, HDF5_USE_FILE_LOCKING='FALSE')).stdout
+try:
+  zs, ys, xs = ( int(dim) for dim in outed.split('{')[1].split('}')[0].split(',') )
+except Exception:
+  eprint(f"Error! Can't read shape of the volume \"{args.volume}\".")
+  sys.exit(1)
+
+if args.ark >= zs:
+  eprint(f"Error! Not enough projections {zs} to form 180 degree ark of {args.ark} projections.")
+  sys.exit(1)
+
+# pairs are spread evenly over all available first projections, rows over the height
+nofPairs = max(1, min(args.pairs, zs - args.ark))
+firsts = sorted(set( int(idx) for idx in numpy.linspace(0, zs - args.ark - 1, nofPairs) ))
+band = min(args.band, ys) if args.band > 0 else ys
+nofRows = max(1, min(args.rows, ys // band))
+rows = sorted(set( int(row) for row in numpy.linspace(0, ys - band, nofRows) ))
+
+
+stat = os.stat(vfile)
+cacheKey = f"{os.path.realpath(vfile)}:{vdata} {stat.st_size} {stat.st_mtime_ns}" \
+           f" {args.ark} {firsts} {rows} {band}"
+cache = {}
+if args.cache:
+  try:
+    with open(args.cache) as cfile:
+      cache = json.load(cfile)
+  except Exception:
+    cache = {}
+  if cacheKey in cache and not args.output:
+    if args.verbose:
+      eprint(f"Using cached rotation centre for {vfile}.")
+    print(cache[cacheKey])
+    sys.exit(0)
+
+
+def extract(idx, row, tmpdir):
+  # Row band of a single projection. Pairs of 360-degree scans may share projections: each band is
+  # extracted once, before the estimates, so that no two processes write the same file.
+  if band == ys:
+    return f"{args.volume}:{idx}"
+  image = os.path.join(tmpdir, f"P{idx}_R{row}.tif")
+  if subprocess.run(['ctas', 'v2v', f"{args.volume}:{idx}", '-c', f",{row}:{row+band}", '-o', image],
+                    capture_output=True).returncode:
+    return None
+  return image
+
+def estimate(first, row):
+  images = [ bands.get((idx, row)) for idx in (first, first + args.ark) ]
+  if None in images:
+    return None
+  command = ['ctas', 'ax', *images]
+  if args.output and first == firsts[0] and row == rows[len(rows)//2]:
+    command += ['-o', args.output]
+  res = subprocess.run(command, capture_output=True, text=True)
+  try:
+    return float(res.stdout.strip().split()[-1])
+  except Exception:
+    return None
+
+extracts = sorted(set( (idx, row) for first in firsts for idx in (first, first + args.ark) for row in rows ))
+tasks = [ (first, row) for first in firsts for row in rows ]
+steps = ( 0 if band == ys else len(extracts) ) + len(tasks)
+print(f"Starting process ({steps} steps): searching for rotation centre.", flush=True)
+bands = {}
+estimates = []
+with tempfile.TemporaryDirectory(prefix='imblcor_', dir='/dev/shm' if os.path.isdir('/dev/shm') else None) \
+     as tmpdir, ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+  done = 0
+  for key, image in zip(extracts, executor.map(lambda key: extract(*key, tmpdir), extracts)):
+    if band != ys:
+      done += 1
+      print(f"{done}/{steps}", flush=True)
+    if image is None and args.verbose:
+      eprint(f"Failed to extract rows {key[1]}-{key[1] + band} of projection {key[0]}.")
+    bands[key] = image
+  for (first, row), res in zip(tasks, executor.map(lambda tsk: estimate(*tsk), tasks)):
+    done += 1
+    print(f"{done}/{steps}", flush=True)
+    if args.verbose:
+      eprint(f"Pair {first}-{first + args.ark}, rows {row}-{row + band}: "
+             + ("failed" if res is None else f"{res:.2f}"))
+    if res is not None:
+      estimates.append((row + band / 2, res))
+
+if not estimates:
+  eprint("Error! All estimates of the rotation centre failed.")
+  sys.exit(1)
+
+
+# reject outliers by the median absolute deviation and fit axis over the height
+ypos = numpy.array([ est[0] for est in estimates ])
+cors = numpy.array([ est[1] for est in estimates ])
+spread = max(1.4826 * numpy.median(numpy.abs(cors - numpy.median(cors))), 0.5)
+good = numpy.abs(cors - numpy.median(cors)) <= 3 * spread
+slope = 0.0
+centre = float(numpy.median(cors[good]))
+if len(set(ypos[good])) > 1:
+  slope, intercept = numpy.polyfit(ypos[good], cors[good], 1)
+  centre = intercept + slope * ys / 2
+  residuals = cors[good] - (intercept + slope * ypos[good])
+else:
+  residuals = cors[good] - centre
+sigma = 1.4826 * numpy.median(numpy.abs(residuals)) if len(residuals) > 1 else 1.0
+confidence = good.sum() / len(estimates) / (1.0 + sigma)
+tilt = numpy.degrees(numpy.arctan(slope))
+if args.verbose:
+  eprint(f"Used {good.sum()} of {len(estimates)} estimates: centre {centre:.2f}, tilt {tilt:.4f} deg,"
+         f" spread {sigma:.2f} px, confidence {confidence:.2f}.")
+
+result = f"{centre:.2f} {tilt:.4f} {confidence:.2f}"
+if args.cache:
+  cache[cacheKey] = result
+  try:
+    with open(args.cache, 'w') as cfile:
+      json.dump(cache, cfile, indent=1)
+  except Exception:
+    eprint(f"Warning! Could not save cache into \"{args.cache}\".")
+print(result)
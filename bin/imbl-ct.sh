@@ -0,0 +1,345 @@
+#!/bin/bash
+
+EXEPATH="$(dirname "$(realpath "$0")" )"
+PATH="$EXEPATH:$PATH"
+
+printhelp() {
+  echo "Usage: $0 [OPTIONS] <input> <output> [-- CTAS_OPTIONS]"
+  echo "  Performs CT reconstruction splitting the range of sinograms into shards"
+  echo "  which are reconstructed by concurrent ctas ct processes."
+  echo "  <input>   HDF5 volume of projections in the form file:container."
+  echo "            Sinograms are read along its y axis."
+  echo "  <output>  Either HDF5 file:container or mask of TIFF files containing '@'."
+  echo "  CTAS_OPTIONS are passed to each 'ctas ct' process as they are."
+  echo "OPTIONS:"
+  echo "  -n INT       Number of shards. Default: 4 per concurrent job; the surplus"
+  echo "               is used to balance the load between jobs and hosts."
+  echo "  -j INT       Number of concurrent jobs on each host. Default: 1."
+  echo "  -S HOSTS     Comma-separated list of hosts to run shards on over ssh. Use ':' for"
+  echo "               the localhost. Output directory must be shared between the hosts."
+  echo "  -r INT       Number of attempts to re-run failed shard. Default: 2."
+  echo "  -y INT:INT   Range of sinograms to reconstruct. Default: all."
+  echo "  -O INT       Index of the output slice for the first sinogram in the range."
+  echo "               Default: same as the index of the sinogram."
+  echo "  -Y INT       Number of slices in the output volume. Default: number of sinograms."
+  echo "  -p           Only prepare the output for the geometry given by the options and exit."
+  echo "  -x           Ignore the run journal: reconstruct all shards even if some of them were"
+  echo "               completed by a previous run with the same parameters, inputs and output."
+  echo "  -B LIST      Benchmark: reconstruct into temporary output with each of the"
+  echo "               comma-separated shard numbers and report timing."
+  echo "  -v           Be verbose to show progress."
+  echo "  -h           Prints this help."
+}
+
+chkint () {
+  if ! [ "$1" -eq "$1" ] 2>/dev/null ; then
+    echo "ERROR! String \"$1\" given by option $2 is not an integer." >&2
+    exit 1
+  fi
+}
+
+chkpos () {
+  chkint "$1" "$2"
+  if (( $1 < 1 )) ; then
+    echo "ERROR! Value $1 given by option $2 is not positive." >&2
+    exit 1
+  fi
+}
+
+shards=""
+jobs=1
+hosts=""
+retries=2
+yrange=""
+oOffset=""
+oSize=""
+bench=""
+useJournal=true
+reuse=false
+prepareOnly=false
+jHash=""
+beverbose=false
+while getopts "n:j:S:r:y:O:Y:pxB:hv" opt ; do
+  case $opt in
+    n)  shards=$OPTARG ; chkpos "$shards" "-$opt" ;;
+    j)  jobs=$OPTARG ; chkpos "$jobs" "-$opt" ;;
+    S)  hosts=$OPTARG ;;
+    r)  retries=$OPTARG ; chkint "$retries" "-$opt" ;;
+    y)  yrange=$OPTARG ;;
+    O)  oOffset=$OPTARG ; chkint "$oOffset" "-$opt" ;;
+    Y)  oSize=$OPTARG ; chkpos "$oSize" "-$opt" ;;
+    p)  prepareOnly=true ;;
+    x)  useJournal=false ;;
+    B)  bench=$OPTARG
+        for bshards in $( tr ',' ' ' <<< "$bench" ) ; do
+          chkpos "$bshards" "-$opt"
+        done
+        ;;
+    v)  beverbose=true ;;
+    h)  printhelp ; exit 1 ;;
+    \?) echo "ERROR! Invalid option: -$OPTARG" >&2 ; exit 1 ;;
+    :)  echo "ERROR! Option -$OPTARG requires an argument." >&2 ; exit 1 ;;
+  esac
+done
+shift $(( $OPTIND - 1 ))
+
+if [ -z "$1" ] || [ -z "$2" ] ; then
+  echo "ERROR! No input or output was given." >&2
+  printhelp >&2
+  exit 1
+fi
+inVol="$1"
+outVol="$2"
+shift 2
+if [ "$1" == "--" ] ; then
+  shift
+fi
+ctArgs="$*"
+
+inFile="${inVol%%:*}"
+inData="${inVol#*:}"
+if [ ! -e "$inFile" ] ; then
+  echo "ERROR! Non existing input file: \"$inFile\"" >&2
+  exit 1
+fi
+read z y x <<< $( HDF5_USE_FILE_LOCKING=FALSE h5ls "$inFile/$inData" \
+                    | sed -n 's/.*{\([0-9]*\), \([0-9]*\), \([0-9]*\)}.*/\1 \2 \3/p' )
+if [ -z "$x" ] ; then
+  echo "ERROR! Can't read shape of the input volume \"$inVol\"." >&2
+  exit 1
+fi
+
+firstY=0
+lastY=$y
+if [ -n "$yrange" ] ; then
+  IFS=':' read firstY lastY <<< "$yrange"
+  chkint "$firstY" "-y"
+  chkint "$lastY" "-y"
+  if (( $firstY < 0  ||  $lastY > $y  ||  $firstY >= $lastY )) ; then
+    echo "ERROR! Range $yrange is outside of the [0, $y) range of sinograms." >&2
+    exit 1
+  fi
+fi
+nofY=$(( $lastY - $firstY ))
+if [ -z "$oOffset" ] ; then
+  oOffset=$firstY
+fi
+if [ -z "$oSize" ] ; then
+  oSize=$y
+fi
+if (( $oOffset < 0  ||  $oOffset + $nofY > $oSize )) ; then
+  echo "ERROR! Output slices $oOffset to $(( $oOffset + $nofY )) do not fit into $oSize slices of the output." >&2
+  exit 1
+fi
+
+nofHosts=1
+sshArg=""
+if [ -n "$hosts" ] ; then
+  nofHosts=$( tr ',' ' ' <<< "$hosts" | wc -w )
+  sshArg="-S $hosts --workdir $PWD"
+fi
+
+
+# Prints type of the dataset $1 in the form file:container.
+typeof() {
+  HDF5_USE_FILE_LOCKING=FALSE h5ls -v "${1%%:*}/${1#*:}" 2> /dev/null | sed -n 's/^ *Type: *//p'
+}
+
+
+# Creates blank dataset $1 of $2 slices $x by $x in the form file:container.
+blank() {
+  tifForSize="$(mktemp --tmpdir imblct_XXXXXX.tif)"
+  convert -size ${x}x${x} -colorspace gray canvas:black "$tifForSize"  &&
+    ctas v2v "$tifForSize" -o "$1::$2"
+  bres=$?
+  rm -f "$tifForSize"
+  return $bres
+}
+
+
+# Makes sure HDF5 output $1 holds dataset shared by all shards with the geometry of this run.
+# Shards write into it concurrently, so it must be contiguous, uncompressed and of the type
+# of the blank dataset. Existing output which is not is removed and created anew; created is
+# set then.
+created=false
+prepareOutput() {
+  cOut="$1"
+  cFile="${cOut%%:*}"
+  cData="${cOut#*:}"
+  if [ -e "$cFile" ] ; then
+    oShape=$( HDF5_USE_FILE_LOCKING=FALSE h5ls "$cFile/$cData" 2> /dev/null \
+                | sed -n 's/.*{\([0-9]*\), \([0-9]*\), \([0-9]*\)}.*/\1 \2 \3/p' )
+    refFile="$(mktemp --tmpdir imblct_XXXXXX.hdf)"
+    rm -f "$refFile"
+    blank "$refFile:$cData" 1 > /dev/null 2>&1
+    refType="$(typeof "$refFile:$cData")"
+    rm -f "$refFile"
+    if [ "$oShape" != "$oSize $x $x" ] ; then
+      echo "WARNING! Existing output $cOut does not have shape $oSize x $x x $x. Creating it anew." >&2
+      rm -f "$cFile"
+    elif HDF5_USE_FILE_LOCKING=FALSE h5ls -v "$cFile/$cData" 2> /dev/null | grep -q -e 'Chunks:' -e 'Filter' ; then
+      echo "WARNING! Existing output $cOut is chunked or compressed. Creating it anew." >&2
+      rm -f "$cFile"
+    elif [ "$(typeof "$cOut")" != "$refType" ] ; then
+      echo "WARNING! Existing output $cOut is not of type $refType. Creating it anew." >&2
+      rm -f "$cFile"
+    fi
+  fi
+  if [ ! -e "$cFile" ] ; then # pre-create dataset shared by all shards
+    if ! blank "$cOut" "$oSize" ; then
+      echo "ERROR! Could not create output volume $cOut." >&2
+      return 1
+    fi
+    created=true
+  fi
+  return 0
+}
+
+
+# Prints "start count output_start" of the shards
+shardlist() {
+  nshards=$1
+  if (( $nshards > $nofY )) ; then
+    nshards=$nofY
+  fi
+  for (( shard=0 ; shard < $nshards ; shard++ )) ; do
+    sstart=$(( $firstY + $shard * $nofY / $nshards ))
+    send=$(( $firstY + ($shard + 1) * $nofY / $nshards ))
+    echo "$sstart $(( $send - $sstart )) $(( $sstart - $firstY + $oOffset ))"
+  done
+}
+
+
+# Prints shards which are not recorded in the journal as completed with the same hash.
+pendinglist() {
+  while read sstart scount ostart ; do
+    if $reuse && imbl-journal.sh check ct "$jHash" "$sstart+$scount" ; then
+      echo "Shard $sstart+$scount was reconstructed by previous run. Skipping." >&2
+    else
+      echo "$sstart $scount $ostart"
+    fi
+  done < <( shardlist "$1" )
+}
+
+
+# Reconstructs all shards into given output. Returns non-zero if any of the shards failed.
+# Shards are recorded in the journal if jHash is set.
+reconstruct() {
+  nshards="$1"
+  cOut="$2"
+  joblog="$(mktemp --tmpdir imblct_XXXXXX.log)"
+
+  if [[ "$cOut" == *@* ]] ; then
+    oDir="$(dirname "$cOut")"
+    oName="$(basename "$cOut")"
+    outStr="$oDir/.shard_{3}/$oName"
+    mkdir -p "$oDir"
+  else
+    outStr="$cOut:{3}+{2}"
+  fi
+
+  toExec="ctas ct $inVol:y{1}+{2} -o $outStr $ctArgs"
+  if $beverbose ; then
+    echo "Reconstructing $nofY sinograms in $nshards shards on $nofHosts host(s) by $jobs job(s) each:"
+    echo "  $toExec"
+  fi
+  if [ -n "$jHash" ] ; then
+    jrnl="$EXEPATH/imbl-journal.sh"
+    toExec="$jrnl start ct $jHash {1}+{2} && $toExec && $jrnl done ct $jHash {1}+{2}"
+  fi
+  pending="$( pendinglist "$nshards" )"
+  mkShard="mkdir -p $( [[ "$cOut" == *@* ]] && echo "$oDir/.shard_{3}" || echo . )"
+  failed=""
+  if [ -z "$pending" ] ; then
+    echo "All shards were reconstructed by previous run(s)."
+  elif (( $( wc -l <<< "$pending" ) == 1 )) && [ -z "$hosts" ] ; then # no need for GNU parallel
+    read sstart scount ostart <<< "$pending"
+    shardExec="$( sed -e "s:{1}:$sstart:g" -e "s:{2}:$scount:g" -e "s:{3}:$ostart:g" <<< "$mkShard && $toExec" )"
+    if ! eval "$shardExec" ; then
+      failed="$sstart+$scount"
+    fi
+  elif ! command -v parallel &> /dev/null ; then
+    echo "ERROR! GNU parallel is required for sharded reconstruction." >&2
+    return 1
+  else
+    echo "$pending" |
+      parallel --colsep ' ' --eta -j "$jobs" --retries "$retries" --joblog "$joblog" $sshArg \
+        "$mkShard && $toExec"
+    failed=$( tail -n +2 "$joblog" | awk -F'\t' '$7 != 0 { print $NF }' | sed 's:.*y\([0-9]*\)+\([0-9]*\).*:\1+\2:' )
+  fi
+  rm -f "$joblog"
+  if [ -n "$failed" ] ; then
+    echo "ERROR! Following shards failed after $retries retries: $(echo $failed)." >&2
+    return 1
+  fi
+
+  if [[ "$cOut" == *@* ]] ; then # move shards into single numbered series
+    nlen=${#oSize}
+    oPrefix="${oName%%@*}"
+    oSuffix="${oName#*@}"
+    while read sstart scount ostart ; do
+      sdir="$oDir/.shard_$ostart"
+      if [ ! -d "$sdir" ] ; then # moved by previous run
+        continue
+      fi
+      ls "$sdir" | while read sfile ; do
+        sidx="${sfile#$oPrefix}"
+        sidx="${sidx%$oSuffix}"
+        mv "$sdir/$sfile" "$oDir/$oPrefix$( printf "%0${nlen}i" $(( 10#$sidx + $ostart )) )$oSuffix"
+      done
+      rmdir "$sdir"
+    done < <( shardlist "$nshards" )
+  fi
+  return 0
+}
+
+
+if [ -n "$bench" ] ; then
+  benchDir="$(mktemp -d --tmpdir="$PWD" .imblct_bench_XXXXXX)"
+  echo "# shards seconds speedup"
+  baseTime=""
+  for bshards in $( tr ',' ' ' <<< "$bench" ) ; do
+    startTime=$(date +%s.%N)
+    if ! reconstruct "$bshards" "$benchDir/rec_$bshards/rec_@.tif" > /dev/null ; then
+      echo "ERROR! Benchmark failed for $bshards shards." >&2
+      rm -rf "$benchDir"
+      exit 1
+    fi
+    runTime=$( echo "$(date +%s.%N) - $startTime" | bc )
+    if [ -z "$baseTime" ] ; then
+      baseTime=$runTime
+    fi
+    printf "%i %.2f %.2f\n" "$bshards" "$runTime" "$( echo "$baseTime / $runTime" | bc -l )"
+    rm -rf "$benchDir/rec_$bshards"
+  done
+  rm -rf "$benchDir"
+  exit 0
+fi
+
+if [ -z "$shards" ] ; then
+  shards=$(( 4 * $jobs * $nofHosts ))
+fi
+oFile="${outVol%%:*}"
+if [[ "$outVol" == *@* ]] ; then
+  oFile="$(dirname "$outVol")"
+fi
+if [[ "$outVol" == *@* ]] ; then
+  if [ ! -d "$oFile" ] ; then
+    mkdir -p "$oFile" && created=true
+  fi
+elif ! prepareOutput "$outVol" ; then
+  exit 1
+fi
+if $prepareOnly ; then
+  exit 0
+fi
+reuse=false
+if $useJournal && [ -e "$oFile" ] && ! $created ; then # only then shards of previous runs can be reused
+  reuse=true
+fi
+# identity of the output makes sure shards are skipped only if they are in this very file
+jHash=$( imbl-journal.sh hash "$inVol" $ctArgs "out=$outVol" "offset=$oOffset" "size=$oSize" \
+                              "outid=$(imbl-journal.sh ident "$oFile")" )
+reconstruct "$shards" "$outVol"
+exit $?
+
@@ -0,0 +1,186 @@
+#!/bin/bash
+
+EXEPATH="$(dirname "$(realpath "$0")" )"
+PATH="$EXEPATH:$PATH"
+
+printhelp() {
+  echo "Usage: $0 [OPTIONS] <input> <output> [-- CTAS_OPTIONS]"
+  echo "  Performs ring filtering, phase retrieval and CT reconstruction in a single pass,"
+  echo "  streaming blocks of sinogram rows through the stages. Input is read and output is"
+  echo "  written only once. The stages of ctas exchange data through files, so each block"
+  echo "  passes through an interim HDF5 file, see -t and -T. It is kept in memory when the"
+  echo "  fastest scratch tier is RAM-backed (/dev/shm) and has space for the block."
+  echo "  <input>   HDF5 volume of projections in the form file:container."
+  echo "  <output>  Either HDF5 file:container or mask of TIFF files containing '@'."
+  echo "  CTAS_OPTIONS are passed to 'ctas ct' as they are."
+  echo "OPTIONS:"
+  echo "  -b INT       Number of sinogram rows in a block. Default: 256."
+  echo "  -H INT       Number of rows added on each side of the block to avoid edge"
+  echo "               artefacts of the phase retrieval. Default: 64 with phase, 0 otherwise."
+  echo "  -R INT       Ring filter size. Default: no ring filter."
+  echo "  -P STRING    Options of 'ctas ipc' for phase retrieval. Default: no phase retrieval."
+  echo "  -A           Apply ring filter after phase retrieval. By default it is before."
+  echo "  -j INT       Number of concurrent CT jobs for each block. Default: 1."
+  echo "  -S HOSTS     Comma-separated list of hosts to run CT jobs on. See imbl-ct.sh."
+  echo "  -t PATH      Directory for the interim blocks. Default: the fastest scratch tier with"
+  echo "               space for a block, see imbl-scratch.sh, or the current directory."
+  echo "  -T FILE      Interim block volume, removed when done. Default: temporary file in the"
+  echo "               directory given by -t."
+  echo "  -x           Ignore the run journal: process all blocks even if some of them were"
+  echo "               completed by a previous run with the same parameters, inputs and output."
+  echo "  -v           Be verbose to show progress."
+  echo "  -h           Prints this help."
+}
+
+chkint () {
+  if ! [ "$1" -eq "$1" ] 2>/dev/null ; then
+    echo "ERROR! String \"$1\" given by option $2 is not an integer." >&2
+    exit 1
+  fi
+}
+
+chkpos () {
+  chkint "$1" "$2"
+  if (( $1 < 1 )) ; then
+    echo "ERROR! Value $1 given by option $2 is not positive." >&2
+    exit 1
+  fi
+}
+
+block=256
+halo=""
+ring=0
+phase=""
+ringAfter=false
+jobs=1
+hosts=""
+tmpdir=""
+blkVol=""
+useJournal=true
+beverbose=false
+while getopts "b:H:R:P:Aj:S:t:T:xhv" opt ; do
+  case $opt in
+    b)  block=$OPTARG ; chkpos "$block" "-$opt" ;;
+    H)  halo=$OPTARG ; chkint "$halo" "-$opt" ;;
+    R)  ring=$OPTARG ; chkint "$ring" "-$opt" ;;
+    P)  phase=$OPTARG ;;
+    A)  ringAfter=true ;;
+    j)  jobs=$OPTARG ; chkpos "$jobs" "-$opt" ;;
+    S)  hosts=$OPTARG ;;
+    t)  tmpdir=$OPTARG ;;
+    T)  blkVol=$OPTARG ;;
+    x)  useJournal=false ;;
+    v)  beverbose=true ;;
+    h)  printhelp ; exit 1 ;;
+    \?) echo "ERROR! Invalid option: -$OPTARG" >&2 ; exit 1 ;;
+    :)  echo "ERROR! Option -$OPTARG requires an argument." >&2 ; exit 1 ;;
+  esac
+done
+shift $(( $OPTIND - 1 ))
+
+if [ -z "$1" ] || [ -z "$2" ] ; then
+  echo "ERROR! No input or output was given." >&2
+  printhelp >&2
+  exit 1
+fi
+inVol="$1"
+outVol="$2"
+shift 2
+if [ "$1" == "--" ] ; then
+  shift
+fi
+ctArgs="$*"
+
+inFile="${inVol%%:*}"
+inData="${inVol#*:}"
+if [ ! -e "$inFile" ] ; then
+  echo "ERROR! Non existing input file: \"$inFile\"" >&2
+  exit 1
+fi
+read z y x <<< $( HDF5_USE_FILE_LOCKING=FALSE h5ls "$inFile/$inData" \
+                    | sed -n 's/.*{\([0-9]*\), \([0-9]*\), \([0-9]*\)}.*/\1 \2 \3/p' )
+if [ -z "$x" ] ; then
+  echo "ERROR! Can't read shape of the input volume \"$inVol\"." >&2
+  exit 1
+fi
+if [ -z "$halo" ] ; then
+  halo=$( [ -n "$phase" ] && echo 64 || echo 0 )
+fi
+
+oFile="${outVol%%:*}"
+if [[ "$outVol" == *@* ]] ; then
+  oFile="$(dirname "$outVol")"
+fi
+reuse=false
+if $useJournal && [ -e "$oFile" ] ; then # only then blocks of previous runs can be reused
+  reuse=true
+fi
+if ! imbl-ct.sh -p -Y "$y" "$inVol" "$outVol" ; then
+  exit 1
+fi
+# identity of the output makes sure blocks are skipped only if they are in this very file
+jHash=$( imbl-journal.sh hash "$inVol" "block=$block" "halo=$halo" "ring=$ring" "phase=$phase" \
+                              "after=$ringAfter" $ctArgs "out=$outVol" \
+                              "outid=$(imbl-journal.sh ident "$oFile")" )
+
+if [ -z "$blkVol" ] ; then
+  if [ -z "$tmpdir" ] ; then
+    tmpdir="$(imbl-scratch.sh pick $(( 4 * $x * $z * ( $block + 2 * $halo ) )))"
+  fi
+  blkVol="$(mktemp --tmpdir="${tmpdir:-.}" imblfused_XXXXXX.hdf)"
+fi
+trap 'rm -f "$blkVol"' EXIT
+
+applyRing() {
+  if (( $ring > 0 )) ; then
+    ctas ring -R "$ring" "$blkVol:/data:y"
+  fi
+}
+
+applyPhase() {
+  if [ -n "$phase" ] ; then
+    ctas ipc "$blkVol:/data" -e $phase
+  fi
+}
+
+nofBlocks=$(( ( $y + $block - 1 ) / $block ))
+echo "Starting process ($nofBlocks steps): fused reconstruction."
+for (( blk=0 ; blk < $nofBlocks ; blk++ )) ; do
+  bstart=$(( $blk * $block ))
+  bend=$(( $bstart + $block > $y ? $y : $bstart + $block ))
+  hstart=$(( $bstart - $halo < 0 ? 0 : $bstart - $halo ))
+  hend=$(( $bend + $halo > $y ? $y : $bend + $halo ))
+  if $reuse && imbl-journal.sh check fused "$jHash" "$bstart+$(( $bend - $bstart ))" ; then
+    echo "Rows $bstart to $bend were reconstructed by previous run. Skipping." >&2
+    echo "$(( $blk + 1 ))/$nofBlocks"
+    continue
+  fi
+  imbl-journal.sh start fused "$jHash" "$bstart+$(( $bend - $bstart ))"
+  if $beverbose ; then
+    echo "Processing rows $bstart to $bend (read $hstart to $hend)." >&2
+  fi
+  rm -f "$blkVol"
+  if ! ctas v2v "$inVol" -c ,$hstart:$hend -o "$blkVol:/data" ; then
+    echo "ERROR! Failed to read block of rows $hstart to $hend from $inVol." >&2
+    exit 1
+  fi
+  if $ringAfter ; then
+    applyPhase && applyRing
+  else
+    applyRing && applyPhase
+  fi
+  if (($?)) ; then
+    echo "ERROR! Failed to filter block of rows $hstart to $hend." >&2
+    exit 1
+  fi
+  if ! IMBLJOURNAL=/dev/null imbl-ct.sh -x -j "$jobs" $( [ -n "$hosts" ] && echo "-S $hosts" || echo "-n $jobs" ) -y $(( $bstart - $hstart )):$(( $bend - $hstart )) \
+                  -O "$bstart" -Y "$y" "$blkVol:/data" "$outVol" -- $ctArgs > /dev/null ; then
+    echo "ERROR! Failed to reconstruct block of rows $bstart to $bend." >&2
+    exit 1
+  fi
+  imbl-journal.sh done fused "$jHash" "$bstart+$(( $bend - $bstart ))"
+  echo "$(( $blk + 1 ))/$nofBlocks"
+done
+echo "Successfully finished fused reconstruction."
+exit 0
+
@@ -0,0 +1,229 @@
+#!/bin/bash
+
+EXEPATH="$(dirname "$(realpath "$0")" )"
+PATH="$EXEPATH:$PATH"
+
+printhelp() {
+  echo "Usage: $0 [OPTIONS]"
+  echo "  Converts TIFF frames of the initiated sample into HDF5 files, one per label, so that"
+  echo "  stitching reads ranges of frames from few files instead of opening each frame."
+  echo "  Run in the directory with the init file. Frames are read by concurrent ctas v2v"
+  echo "  processes, each writing its batch into a file of its own; the batches are then copied"
+  echo "  one by one into the pre-created volume by a single writer. The volume is merged in the"
+  echo "  fastest scratch tier, see imbl-scratch.sh, and written into the output directory once,"
+  echo "  with the chunked layout of the stitched volume, see imbl-repack.sh. Labels whose frames"
+  echo "  did not change since the last ingest are skipped. Init file is updated to use the HDF5"
+  echo "  files in place of the frames. Nothing is done for HDF5 acquisitions."
+  echo "OPTIONS:"
+  echo "  -o PATH      Directory for the HDF5 files. Default: <output>/ingest."
+  echo "  -j INT       Number of concurrent readers. Default: number of CPUs."
+  echo "  -n INT       Number of frames in a batch. Default: 256."
+  echo "  -k Z,Y       Layout of the HDF5 files: chunks of Z frames and Y rows spanning the whole"
+  echo "               width, as given to imbl-stitch.sh -k. Z=0 gives contiguous layout, merged"
+  echo "               in place. Default: 32,8."
+  echo "  -x           Ignore the run journal: re-ingest even if the frames are unchanged."
+  echo "  -v           Be verbose to show progress."
+  echo "  -h           Prints this help."
+}
+
+chkint () {
+  if ! [ "$1" -eq "$1" ] 2>/dev/null || (( $1 < 1 )) ; then
+    echo "ERROR! String \"$1\" given by option $2 is not a positive integer." >&2
+    exit 1
+  fi
+}
+
+outDir=""
+jobs=$(nproc)
+batch=256
+layout="32,8"
+useJournal=true
+beverbose=false
+allopts="$@"
+while getopts "o:j:n:k:xhv" opt ; do
+  case $opt in
+    o)  outDir=$OPTARG ;;
+    j)  jobs=$OPTARG ; chkint "$jobs" "-$opt" ;;
+    n)  batch=$OPTARG ; chkint "$batch" "-$opt" ;;
+    k)  layout=$OPTARG ;;
+    x)  useJournal=false ;;
+    v)  beverbose=true ;;
+    h)  printhelp ; exit 1 ;;
+    \?) echo "ERROR! Invalid option: -$OPTARG" >&2 ; exit 1 ;;
+    :)  echo "ERROR! Option -$OPTARG requires an argument." >&2 ; exit 1 ;;
+  esac
+done
+shift $(( $OPTIND - 1 ))
+IFS=',:' read chunkZ chunkY <<< "$layout"
+if ! [ "$chunkZ" -ge 0 ] 2>/dev/null ; then
+  echo "ERROR! String \"$layout\" given by option -k is not a layout Z,Y." >&2
+  exit 1
+fi
+
+initfile=".initstitch"
+if [ ! -e "$initfile" ] ; then
+  echo "ERROR! Non existing init path: \"$initfile\"" >&2
+  exit 1
+fi
+format="TIFF" # default
+hpath=""
+source "$initfile"
+
+if [ -n "$subdirs" ] ; then
+  for subd in $filemask ; do
+    if $beverbose ; then
+      echo "Ingesting subdirectory $subd ... "
+    fi
+    if ! ( cd "$subd" && $0 $allopts ) ; then
+      exit 1
+    fi
+  done
+  exit 0
+fi
+
+if [ "$format" == "HDF5" ] ; then
+  if $beverbose ; then
+    echo "Acquisition is in HDF5 format: nothing to ingest."
+  fi
+  exit 0
+fi
+hpath="$( realpath -m "${outDir:-$opath/ingest}" )"
+if ! mkdir -p "$hpath" ; then
+  echo "ERROR! Could not create directory $hpath for ingested frames." >&2
+  exit 1
+fi
+journal="$hpath/.imbl-journal"
+
+# single scan of the input directory: name, size and modification time of the frames
+listing="$(mktemp --tmpdir imblingest_XXXXXX)"
+find "$ipath" -maxdepth 1 -name 'SAMPLE*_T*.tif' -printf '%f %s %T@\n' > "$listing"
+export ipath lst chunks
+
+# HDF5 files are not safe for concurrent writers: each batch goes to a file of its own.
+ingestBatch() {
+  files=$( tail -n +$(( $1 + 1 )) "$lst" | head -n $2 | cut -d' ' -f 2 | sed "s:^:$ipath/:" )
+  if ! ctas v2v -o "$chunks/$1.hdf:/data" $files > /dev/null ; then
+    echo "ERROR! Failed to ingest frames $1+$2 into $chunks/$1.hdf." >&2
+    return 1
+  fi
+  echo "$1"
+}
+export -f ingestBatch
+
+# Removes the volume merged apart from the output, releasing its space in scratch.
+dropMerged() {
+  if [ -n "$scratchName" ] ; then
+    imbl-scratch.sh clean "$scratchName"
+  elif [ "$merged" != "$h5" ] ; then
+    rm -f "$merged"
+  fi
+}
+
+imagemask="$(echo $filemask | sed 's: :\n:g' | sed -r 's ^(.+) _\1 g')"
+while read imgm ; do
+  lbl=$( sed -e 's:_$::g' -e 's:^_::g' <<< $imgm )
+  if [ -z "$lbl" ] ; then
+    lbl="single"
+  fi
+  h5="$hpath/SAMPLE${imgm}.hdf"
+  lst="$hpath/.frames${imgm}"
+  chunks="$hpath/.batches${imgm}"
+  awk -v pre="SAMPLE${imgm}_T" 'index($1, pre) == 1 {
+         idx = substr($1, length(pre) + 1)
+         sub(/\.tif$/, "", idx)
+         if ( idx ~ /^[0-9]+$/ ) print idx + 0, $1, $2, $3
+       }' "$listing" | sort -n -k1,1 > "$lst"
+  nofFrames=$( wc -l < "$lst" )
+  if (( ! $nofFrames )) ; then
+    echo "ERROR! No frames of label $lbl found in $ipath." >&2
+    rm -f "$listing"
+    exit 1
+  fi
+  if (( $(head -n 1 "$lst" | cut -d' ' -f 1) != 0  ||  $(tail -n 1 "$lst" | cut -d' ' -f 1) != $nofFrames - 1 )) ; then
+    echo "ERROR! Frames of label $lbl in $ipath are not numbered continuously from 0." >&2
+    rm -f "$listing"
+    exit 1
+  fi
+
+  jHash=$( imbl-journal.sh hash "$ipath" "$lbl" "$(sha1sum < "$lst")" )
+  if $useJournal && imbl-journal.sh -j "$journal" -f "$h5" check ingest "$jHash" "$lbl" ; then
+    if $beverbose ; then
+      echo "Frames of label $lbl are ingested into $h5 and unchanged. Skipping."
+    fi
+    continue
+  fi
+  imbl-journal.sh -j "$journal" start ingest "$jHash" "$lbl"
+
+  if (( ! $width || ! $hight )) ; then
+    read width hight <<< $(identify "$ipath/$(head -n 1 "$lst" | cut -d' ' -f 2)" \
+                           | cut -d' ' -f 3 | sed 's/x/ /g')
+  fi
+  # merged contiguous in scratch, then written into storage once with the chunked layout
+  merged="$h5"
+  scratchName=""
+  if (( $chunkZ > 0 )) ; then
+    scratchName="ingest${imgm}.hdf"
+    merged="$(imbl-scratch.sh pick $(( 4 * $width * $hight * $nofFrames )) "$scratchName")"
+    if [ -z "$merged" ] ; then
+      scratchName=""
+      merged="$hpath/.merged${imgm}.hdf"
+    fi
+  fi
+  tifForSize="$hpath/.for_size.tif"
+  if ! convert -size ${width}x${hight} -colorspace gray -depth 8 canvas: "$tifForSize" ||
+     ! ctas v2v "$tifForSize" -o "$merged:/data::$nofFrames" ; then
+    echo "ERROR! Could not create volume $merged for ingested frames." >&2
+    dropMerged
+    rm -f "$tifForSize" "$listing"
+    exit 1
+  fi
+  rm -f "$tifForSize"
+
+  nofBatches=$(( ( $nofFrames + $batch - 1 ) / $batch ))
+  if $beverbose ; then
+    echo "Ingesting $nofFrames frames of label $lbl into $h5 by $jobs concurrent readers."
+  fi
+  echo "Starting process ($(( 2 * $nofBatches )) steps): ingesting frames of label $lbl."
+  rm -rf "$chunks"
+  mkdir -p "$chunks"
+  batches="$( for (( start=0 ; start < $nofFrames ; start+=$batch )) ; do
+                echo "$start $(( $nofFrames - $start < $batch ? $nofFrames - $start : $batch ))"
+              done )"
+  xargs -P "$jobs" -n 2 bash -c 'ingestBatch "$@"' _ <<< "$batches" \
+    | awk -v total=$(( 2 * $nofBatches )) '{ print NR "/" total ; fflush() }'
+  failed=${PIPESTATUS[0]}
+  step=$nofBatches
+  while (( ! $failed )) && read start count ; do
+    if ! ctas v2v "$chunks/$start.hdf:/data" -o "$merged:/data:$start+$count" > /dev/null ; then
+      echo "ERROR! Failed to copy frames $start+$count into $merged." >&2
+      failed=1
+    fi
+    echo "$(( ++step ))/$(( 2 * $nofBatches ))"
+  done <<< "$batches"
+  rm -rf "$chunks"
+  if [ "$merged" != "$h5" ] ; then
+    if (( ! $failed )) && $beverbose ; then
+      echo "Writing $h5 with layout $layout."
+    fi
+    if (( ! $failed )) && ! imbl-repack.sh -k "$layout" "$merged:/data" "$h5:/data" ; then
+      failed=1
+    fi
+    dropMerged
+  fi
+  if (( $failed )) ; then
+    echo "ERROR! Failed to ingest frames of label $lbl." >&2
+    rm -f "$listing"
+    exit 1
+  fi
+  imbl-journal.sh -j "$journal" -f "$h5" done ingest "$jHash" "$lbl"
+done <<< "$imagemask"
+rm -f "$listing"
+
+# stitching reads ingested files instead of the frames
+sed -i -e '/^hpath=/d' -e '/^hformat=/d' "$initfile"
+echo "hpath=\"$hpath\"" >> "$initfile"
+echo "hformat=\"HDF5\"" >> "$initfile"
+if $beverbose ; then
+  echo "Frames are ingested into $hpath."
+fi
+exit 0
@@ -0,0 +1,115 @@
+#!/bin/bash
+
+printhelp() {
+  echo "Usage: $0 [OPTIONS] COMMAND [ARGS]"
+  echo "  Maintains journal of the processing stages completed in the current directory."
+  echo "  Each record holds the stage, processed item (sub-range of projections or slices)"
+  echo "  and the hash of parameters and inputs which produced it."
+  echo "COMMANDS:"
+  echo "  hash ARGS...               Prints hash of the arguments. Arguments which are existing"
+  echo "                             files are represented by the hash of their content or, if"
+  echo "                             they are larger than 64MiB, by their size and modification time."
+  echo "  ident PATH                 Prints identity of the file: it persists while the file is"
+  echo "                             modified in place, but changes when it is replaced."
+  echo "  start STAGE HASH [ITEM]    Records start of the stage."
+  echo "  done STAGE HASH [ITEM]     Records completion of the stage."
+  echo "  check STAGE HASH [ITEM]    Exits with zero status only if the last record of the stage"
+  echo "                             is its completion with the same hash."
+  echo "  list [STAGE]               Prints records of all or given stage."
+  echo "  clear [STAGE]              Removes records of all or given stage."
+  echo "  ITEM defaults to 'all'."
+  echo "OPTIONS:"
+  echo "  -j PATH      Journal file. Default: \$IMBLJOURNAL if set, .imbl-journal otherwise."
+  echo "  -f PATH      Product file of the stage: its size and modification time are recorded"
+  echo "               on completion and must be same on check."
+  echo "  -h           Prints this help."
+}
+
+journal="${IMBLJOURNAL:-.imbl-journal}"
+product=""
+while getopts "j:f:h" opt ; do
+  case $opt in
+    j)  journal=$OPTARG ;;
+    f)  product=$OPTARG ;;
+    h)  printhelp ; exit 1 ;;
+    \?) echo "ERROR! Invalid option: -$OPTARG" >&2 ; exit 1 ;;
+    :)  echo "ERROR! Option -$OPTARG requires an argument." >&2 ; exit 1 ;;
+  esac
+done
+shift $(( $OPTIND - 1 ))
+
+command="$1"
+stage="$2"
+hash="$3"
+item="${4:-all}"
+
+identity() {
+  if [ -n "$product" ] ; then
+    stat -L -c '%s:%y' "${product%%:*}" 2> /dev/null || echo "none"
+  else
+    echo "-"
+  fi
+}
+
+case "$command" in
+  hash)
+    shift
+    for arg in "$@" ; do
+      afile="${arg%%:*}"
+      if [ -f "$afile" ] ; then
+        if (( $(stat -L -c '%s' "$afile") > 64 * 1024 * 1024 )) ; then
+          echo "$(realpath "$afile") $(stat -L -c '%s:%y' "$afile")"
+        else
+          sha1sum < "$afile"
+        fi
+      fi
+      echo "$arg"
+    done | sha1sum | cut -d' ' -f1
+    ;;
+  ident)
+    stat -L -c '%d:%i:%W' "${stage%%:*}" 2> /dev/null || echo "none"
+    ;;
+  start|done)
+    if [ -z "$hash" ] ; then
+      echo "ERROR! No stage or hash given." >&2
+      exit 1
+    fi
+    printf "%s\t%s\t%s\t%s\t%s\t%s\n" "$(date +%FT%T)" "$command" "$stage" "$item" "$hash" \
+      "$( [ "$command" == "done" ] && identity || echo - )" >> "$journal"
+    ;;
+  check)
+    if [ -z "$hash" ] ; then
+      echo "ERROR! No stage or hash given." >&2
+      exit 1
+    fi
+    if [ ! -e "$journal" ] ; then
+      exit 1
+    fi
+    read status lhash lident <<< $( awk -F'\t' -v st="$stage" -v it="$item" \
+                                      '$3 == st && $4 == it { rec = $2 " " $5 " " $6 } END { print rec }' \
+                                      "$journal" )
+    [ "$status" == "done" ] && [ "$lhash" == "$hash" ] && [ "$lident" == "$(identity)" ]
+    exit $?
+    ;;
+  list)
+    if [ -e "$journal" ] ; then
+      awk -F'\t' -v st="$stage" 'st == "" || $3 == st' "$journal"
+    fi
+    ;;
+  clear)
+    if [ -e "$journal" ] ; then
+      if [ -z "$stage" ] ; then
+        rm -f "$journal"
+      else
+        awk -F'\t' -v st="$stage" '$3 != st' "$journal" > "$journal.tmp" && mv "$journal.tmp" "$journal"
+      fi
+    fi
+    ;;
+  *)
+    echo "ERROR! Unknown command \"$command\"." >&2
+    printhelp >&2
+    exit 1
+    ;;
+esac
+exit 0
+
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import argparse
+import numpy
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'share', 'imblproc'))
+from tileimg import readTiff, findTiles, prepareTile, composite
+from stitchgeom import parsePair, parseCrop, stitchGeometry
+
+def eprint(*args, **kwargs):
+  print(*args, file=sys.stderr, **kwargs)
+
+
+parser = argparse.ArgumentParser(description=
+ 'Registers tiles exported by "imbl-stitch.sh -e" to find stitching origins. Offsets between'
+ ' neighbouring tiles and between the direct and flipped halves of the 360-degree scan are found'
+ ' by phase correlation on image pyramids with sub-pixel refinement. Estimates from all projections'
+ ' and tile pairs are combined robustly. Each found origin is printed in a separate line'
+ ' "OPTION X Y confidence", where OPTION is the option of imbl-stitch.sh it is for: g, G or f.'
+ ' Tiles are rotated, cropped and binned as in the stitching, so the origins are in binned pixels.')
+parser.add_argument('prefix', type=str, nargs='?', default='tmp/TILE_',
+                    help='Prefix of the exported tiles <prefix><projection>_<tile>.tif.')
+parser.add_argument('-n', '--tiles', type=int, default=0,
+                    help='Number of the tiles in the direct half. Default: all tiles, or half if -F.')
+parser.add_argument('-s', '--second-size', type=int, default=0,
+                    help='Number of the tile groups in the second stitch, same as in ctas proj.')
+parser.add_argument('-F', '--flip', action='store_true',
+                    help='Tiles of the flipped half follow the direct ones: find flip origin.')
+parser.add_argument('-g', '--origin', type=str, default="0,0",
+                    help='Origin of the first stitch used if it cannot be registered.')
+parser.add_argument('-G', '--second-origin', type=str, default="0,0",
+                    help='Origin of the second stitch used if it cannot be registered.')
+parser.add_argument('-c', '--crop', type=str, default="",
+                    help='Crop of the tiles T,L,B,R or L-R,T-B, same as in imbl-stitch.sh.')
+parser.add_argument('-b', '--binn', type=str, default="1",
+                    help='Binning factor(s) X[,Y] of the tiles, same as in imbl-stitch.sh.')
+parser.add_argument('-r', '--rotate', type=float, default=0.0,
+                    help='Rotation of the tiles in degrees, same as in imbl-stitch.sh.')
+parser.add_argument('-C', '--coarse', type=int, default=256,
+                    help='Size of the coarsest level of the image pyramid.')
+parser.add_argument('-P', '--peaks', type=int, default=8,
+                    help='Number of the strongest correlation peaks to verify on the coarsest level.')
+parser.add_argument('-O', '--overlap', type=float, default=0.05,
+                    help='Minimal overlap of the registered images as a fraction of their area.')
+parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                    help='Number of concurrent registrations.')
+parser.add_argument('-v', '--verbose', action='store_true',
+                    help='Report individual estimates.')
+args = parser.parse_args()
+
+
+tiles = findTiles(args.prefix)
+if not tiles:
+  eprint(f"Error! No exported tiles {args.prefix}*.tif found.")
+  sys.exit(1)
+total = min(len(files) for files in tiles.values())
+nofSt = args.tiles if args.tiles > 0 else total // 2 if args.flip else total
+if nofSt < 1 or nofSt * (2 if args.flip else 1) > total:
+  eprint(f"Error! Not enough exported tiles {total} for {nofSt} tiles" + (" in each half." if args.flip else "."))
+  sys.exit(1)
+inner = nofSt // args.second_size if args.second_size > 1 else nofSt
+
+images = {}
+def load(fileName):
+  image = prepareTile(readTiff(fileName), parseCrop(args.crop), parsePair(args.binn, (1, 1)), args.rotate)
+  good = numpy.isfinite(image)
+  image[~good] = numpy.mean(image[good]) if good.any() else 0
+  images[fileName] = image
+with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+  try:
+    list(executor.map(load, [ fl for files in tiles.values() for fl in files[:nofSt * (2 if args.flip else 1)] ]))
+  except (OSError, ValueError) as err:
+    eprint(f"Error! Failed to read tiles: {err}")
+    sys.exit(1)
+
+
+def taper(image, part=0.02):
+  # zero mean image with its edges smoothly suppressed to avoid artefacts of the periodic transform
+  image = image - image.mean()
+  for axis, size in enumerate(image.shape):
+    edge = max(1, int(size * part))
+    ramp = numpy.ones(size)
+    ramp[:edge] = ramp[-edge:][::-1] = 0.5 - 0.5 * numpy.cos(numpy.pi * numpy.arange(edge) / edge)
+    image = image * ( ramp[:, None] if axis == 0 else ramp[None, :] )
+  return image
+
+def correlate(first, second):
+  # phase correlation, regularised not to amplify the noise at frequencies without signal
+  spec = numpy.fft.rfft2(taper(first)) * numpy.conj(numpy.fft.rfft2(taper(second)))
+  power = numpy.abs(spec)
+  return numpy.fft.irfft2(spec / (power + 0.1 * power.mean() + 1e-12), first.shape)
+
+def wrap(idx, size):
+  return idx - size if idx > size // 2 else idx
+
+def overlap(first, second, dx, dy):
+  # parts of the images which overlap if the second is placed at (dx, dy) of the first
+  hight, width = first.shape
+  ys, ye = max(0, dy), min(hight, hight + dy)
+  xs, xe = max(0, dx), min(width, width + dx)
+  if ye - ys < 2 or xe - xs < 2:
+    return None, None
+  return first[ys:ye, xs:xe], second[ys-dy:ye-dy, xs-dx:xe-dx]
+
+def similarity(first, second):
+  first = first - first.mean()
+  second = second - second.mean()
+  norm = numpy.sqrt((first * first).sum() * (second * second).sum())
+  return float((first * second).sum() / norm) if norm > 0 else 0.0
+
+def downsample(image):
+  hight, width = (image.shape[0] // 2) * 2, (image.shape[1] // 2) * 2
+  return 0.25 * ( image[0:hight:2, 0:width:2] + image[1:hight:2, 0:width:2]
+                + image[0:hight:2, 1:width:2] + image[1:hight:2, 1:width:2] )
+
+def subpixel(lo, md, hi):
+  # vertex of the parabola through three equidistant points
+  denom = lo - 2 * md + hi
+  return 0.0 if denom >= 0 else max(-0.5, min(0.5, 0.5 * (lo - hi) / denom))
+
+def refine(first, second, dx, dy, radius=2):
+  # best integer position around (dx, dy) by similarity of the overlaps
+  scores = numpy.full((2 * radius + 1, 2 * radius + 1), -1.0)
+  for iy in range(2 * radius + 1):
+    for ix in range(2 * radius + 1):
+      ofirst, osecond = overlap(first, second, dx + ix - radius, dy + iy - radius)
+      if ofirst is not None:
+        scores[iy, ix] = similarity(ofirst, osecond)
+  iy, ix = numpy.unravel_index(numpy.argmax(scores), scores.shape)
+  return dx + ix - radius, dy + iy - radius, scores, iy, ix
+
+def register(first, second):
+  # Returns position (dx, dy) of the second image in the coordinate system of the first one and
+  # similarity of their overlap, or None if no acceptable overlap was found.
+  pyramid = [(first, second)]
+  while max(pyramid[-1][0].shape) > args.coarse and min(pyramid[-1][0].shape) >= 32:
+    pyramid.append(( downsample(pyramid[-1][0]), downsample(pyramid[-1][1]) ))
+  # coarse level: strongest peaks and their aliases are judged by the overlap similarity
+  cfirst, csecond = pyramid[-1]
+  hight, width = cfirst.shape
+  surface = correlate(cfirst, csecond)
+  best = None
+  for peak in numpy.argsort(surface, axis=None)[::-1][:args.peaks]:
+    py, px = numpy.unravel_index(peak, surface.shape)
+    for dy in set((py, py - hight)):
+      for dx in set((px, px - width)):
+        if (hight - abs(dy)) * (width - abs(dx)) < args.overlap * hight * width:
+          continue
+        ofirst, osecond = overlap(cfirst, csecond, dx, dy)
+        if ofirst is not None and (best is None or similarity(ofirst, osecond) > best[0]):
+          best = (similarity(ofirst, osecond), dx, dy)
+  if best is None:
+    return None
+  _, dx, dy = best
+  # refinement on the finer levels and sub-pixel position from the similarity around the best one
+  dx, dy, scores, iy, ix = refine(cfirst, csecond, dx, dy, 1)
+  for level in reversed(range(len(pyramid) - 1)):
+    dx, dy, scores, iy, ix = refine(*pyramid[level], 2 * dx, 2 * dy)
+  if scores[iy, ix] < -0.5:
+    return None
+  sx = subpixel(*scores[iy, ix-1:ix+2]) if 0 < ix < scores.shape[1] - 1 else 0.0
+  sy = subpixel(*scores[iy-1:iy+2, ix]) if 0 < iy < scores.shape[0] - 1 else 0.0
+  return dx + sx, dy + sy, float(scores[iy, ix])
+
+
+def combine(estimates):
+  # reject outliers by the median absolute deviation in both coordinates
+  ests = numpy.array(estimates)
+  good = numpy.ones(len(ests), dtype=bool)
+  spreads = []
+  for col in 0, 1:
+    med = numpy.median(ests[:, col])
+    spread = max(1.4826 * numpy.median(numpy.abs(ests[:, col] - med)), 0.5)
+    good &= numpy.abs(ests[:, col] - med) <= 3 * spread
+    spreads.append(spread)
+  xval, yval = ests[good, 0].mean(), ests[good, 1].mean()
+  sigma = max(numpy.std(ests[good, 0]), numpy.std(ests[good, 1])) if good.sum() > 1 else 1.0
+  confidence = good.sum() / len(ests) / (1.0 + sigma) * max(0.0, numpy.median(ests[good, 2]))
+  return xval, yval, confidence, good.sum()
+
+
+tasks = []
+for proj, files in tiles.items():
+  for half in range(2 if args.flip else 1):
+    offset = half * nofSt
+    for idx in range(nofSt):
+      if (idx % inner) + 1 < inner:
+        tasks.append(("g", proj, files[offset + idx], files[offset + idx + 1]))
+      if idx + inner < nofSt:
+        tasks.append(("G", proj, files[offset + idx], files[offset + idx + inner]))
+nofSteps = len(tasks) + ( len(tiles) if args.flip else 0 )
+print(f"Starting process ({nofSteps} steps): registering tiles.", flush=True)
+
+found = {}
+origins = { "g": parsePair(args.origin), "G": parsePair(args.second_origin) }
+step = 0
+def report(tasks, results):
+  global step
+  for (opt, proj, *_), res in zip(tasks, results):
+    step += 1
+    print(f"{step}/{nofSteps}", flush=True)
+    if args.verbose:
+      eprint(f"Origin -{opt}, projection {proj}: " +
+             ("failed" if res is None else f"{res[0]:.2f},{res[1]:.2f} similarity {res[2]:.2f}"))
+    if res is not None:
+      found.setdefault(opt, []).append(res)
+
+with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+  report(tasks, executor.map(lambda tsk: register(images[tsk[2]], images[tsk[3]]), tasks))
+  results = {}
+  for opt in "g", "G":
+    if opt in found:
+      results[opt] = combine(found[opt])
+      origins[opt] = results[opt][:2]
+  if args.flip:
+    # whole direct and mirrored flipped images are registered with the found tile origins
+    hight, width = images[tiles[next(iter(tiles))][0]].shape
+    geom = stitchGeometry((width, hight), nofSt, origins["g"], args.second_size, origins["G"])
+    def flipped(files):
+      return register(composite([ images[fl] for fl in files[:nofSt] ], geom),
+                      composite([ images[fl] for fl in files[nofSt:2*nofSt] ], geom)[:, ::-1])
+    ftasks = [ ("f", proj, files) for proj, files in tiles.items() ]
+    report(ftasks, executor.map(lambda tsk: flipped(tsk[2]), ftasks))
+    if "f" in found:
+      results["f"] = combine(found["f"])
+
+if not results:
+  eprint("Error! All registrations failed.")
+  sys.exit(1)
+for opt, (xval, yval, confidence, used) in results.items():
+  if args.verbose:
+    eprint(f"Origin -{opt}: used {used} of {len(found[opt])} estimates: {xval:.2f},{yval:.2f},"
+           f" confidence {confidence:.2f}.")
+  print(f"{opt} {xval:.2f} {yval:.2f} {confidence:.2f}")
@@ -0,0 +1,192 @@
+#!/bin/bash
+
+EXEPATH="$(dirname "$(realpath "$0")" )"
+PATH="$EXEPATH:$PATH"
+
+printhelp() {
+  echo "Usage: $0 [OPTIONS] <input> [output]"
+  echo "  Rewrites HDF5 volume of projections with the chunked layout tuned for both writing"
+  echo "  projection by projection and reading sinograms, optionally compressed. Data is streamed"
+  echo "  through h5repack; compressed volumes are read by any HDF5 reader transparently."
+  echo "  <input>   HDF5 volume in the form file:container."
+  echo "  [output]  HDF5 volume in the form file:container. Default: replace the input."
+  echo "OPTIONS:"
+  echo "  -k Z,Y       Chunk size in projections and rows; chunks span the whole width."
+  echo "               Z=0 gives contiguous layout. Default: 32,8."
+  echo "  -b INT       Size of the copy buffer of h5repack (H5TOOLS_BUFSIZE) in MiB: amount of data"
+  echo "               read and written at once. Default: 512."
+  echo "  -z MODE      Compression: none (default), lossless - byte shuffle followed by fast"
+  echo "               deflate, or lossy[=DIGITS] - floating point values are quantised to"
+  echo "               given number of decimal digits (default 4) and deflated. Requires chunks."
+  echo "               Compression runs in the single thread of h5repack: a slow pass over the"
+  echo "               whole volume, which is read and written once more if rewritten in place."
+  echo "  -B LIST      Benchmark: colon-separated list of layouts given as in -k option. The input"
+  echo "               is rewritten next to itself with each of them and extraction of sinograms"
+  echo "               is timed together with the compression ratio. Nothing is changed."
+  echo "  -n INT       Number of sinograms, evenly spread over the volume, extracted in benchmark."
+  echo "               Default: 8."
+  echo "  -v           Be verbose to show progress."
+  echo "  -h           Prints this help."
+}
+
+chkint () {
+  if ! [ "$1" -eq "$1" ] 2>/dev/null ; then
+    echo "ERROR! String \"$1\" given by option $2 is not an integer." >&2
+    exit 1
+  fi
+}
+
+chunks="32,8"
+bufSize=512
+compress="none"
+bench=""
+nofSinos=8
+beverbose=false
+while getopts "k:b:z:B:n:hv" opt ; do
+  case $opt in
+    k)  chunks=$OPTARG ;;
+    b)  bufSize=$OPTARG ; chkint "$bufSize" "-$opt" ;;
+    z)  compress=$OPTARG ;;
+    B)  bench=$OPTARG ;;
+    n)  nofSinos=$OPTARG ; chkint "$nofSinos" "-$opt" ;;
+    v)  beverbose=true ;;
+    h)  printhelp ; exit 1 ;;
+    \?) echo "ERROR! Invalid option: -$OPTARG" >&2 ; exit 1 ;;
+    :)  echo "ERROR! Option -$OPTARG requires an argument." >&2 ; exit 1 ;;
+  esac
+done
+shift $(( $OPTIND - 1 ))
+
+if [ -z "$1" ] ; then
+  echo "ERROR! No input was given." >&2
+  printhelp >&2
+  exit 1
+fi
+inVol="$1"
+outVol="${2:-$1}"
+inFile="${inVol%%:*}"
+inData="${inVol#*:}"
+outFile="${outVol%%:*}"
+outData="${outVol#*:}"
+if [ ! -e "$inFile" ] ; then
+  echo "ERROR! Non existing input file: \"$inFile\"" >&2
+  exit 1
+fi
+if [ "$inData" != "$outData" ] ; then
+  echo "ERROR! Container can't be renamed: \"$inData\" and \"$outData\" differ." >&2
+  exit 1
+fi
+if ! command -v h5repack &> /dev/null ; then
+  echo "ERROR! h5repack is required to change layout of HDF5 volumes." >&2
+  exit 1
+fi
+export HDF5_USE_FILE_LOCKING=FALSE
+read z y x <<< $( h5ls "$inFile/$inData" \
+                    | sed -n 's/.*{\([0-9]*\), \([0-9]*\), \([0-9]*\)}.*/\1 \2 \3/p' )
+if [ -z "$x" ] ; then
+  echo "ERROR! Can't read shape of the input volume \"$inVol\"." >&2
+  exit 1
+fi
+export H5TOOLS_BUFSIZE=$(( $bufSize * 1024 * 1024 ))
+
+filters=""
+case "$compress" in
+  none)     ;;
+  lossless) filters="-f $inData:SHUF -f $inData:GZIP=1" ;;
+  lossy*)   digits="${compress#lossy}"
+            digits="${digits#=}"
+            chkint "${digits:=4}" "-z"
+            filters="-f $inData:SOFF=$digits,DS -f $inData:GZIP=1"
+            ;;
+  *)        echo "ERROR! Unknown compression \"$compress\" given by option -z." >&2
+            exit 1
+            ;;
+esac
+
+
+# Prints h5repack layout argument for Z,Y chunks.
+layoutof() {
+  IFS=',:' read cz cy <<< "$1"
+  chkint "$cz" "-k"
+  chkint "${cy:=$cz}" "-k"
+  if (( $cz <= 0 )) && [ -n "$filters" ] ; then
+    echo "ERROR! Compression requires chunked layout." >&2
+    exit 1
+  elif (( $cz <= 0 )) ; then
+    echo "$inData:CONTI"
+  else
+    echo "$inData:CHUNK=$(( $cz < $z ? $cz : $z ))x$(( $cy < $y ? ( $cy > 0 ? $cy : 1 ) : $y ))x$x"
+  fi
+}
+
+
+# Rewrites $1 into $2 with layout $3 and compression filters.
+repack() {
+  if $beverbose ; then
+    echo "Rewriting ${x}x${y}x${z} volume $1 with layout $3:"
+    echo "  h5repack -l $3 $filters $1 $2"
+  fi
+  h5repack -l "$3" $filters "$1" "$2"
+}
+
+
+# Prints ratio of the sizes of the files $1 and $2.
+ratio() {
+  printf "%.2f" "$( echo "$(stat -c %s "$1") / $(stat -c %s "$2")" | bc -l )"
+}
+
+
+if [ -n "$bench" ] ; then
+  benchDir="$(mktemp -d --tmpdir="$(dirname "$(realpath "$inFile")")" .imblrepack_bench_XXXXXX)"
+  echo "# layout write_seconds read_seconds seconds_per_sinogram compression_ratio"
+  for blayout in $( tr ':' ' ' <<< "$bench" ) ; do
+    if ! layout="$(layoutof "$blayout")" ; then
+      rm -rf "$benchDir"
+      exit 1
+    fi
+    benchFile="$benchDir/layout.hdf"
+    startTime=$(date +%s.%N)
+    if ! repack "$inFile" "$benchFile" "$layout" > /dev/null ; then
+      echo "ERROR! Benchmark failed for layout $blayout." >&2
+      rm -rf "$benchDir"
+      exit 1
+    fi
+    writeTime=$( echo "$(date +%s.%N) - $startTime" | bc )
+    startTime=$(date +%s.%N)
+    for (( sino=0 ; sino < $nofSinos ; sino++ )) ; do
+      sidx=$(( $nofSinos > 1 ? $sino * ($y - 1) / ($nofSinos - 1) : $y / 2 ))
+      if ! ctas v2v "$benchFile:$inData:y$sidx" -o "$benchDir/sino.tif" > /dev/null ; then
+        echo "ERROR! Failed to extract sinogram $sidx with layout $blayout." >&2
+        rm -rf "$benchDir"
+        exit 1
+      fi
+    done
+    readTime=$( echo "$(date +%s.%N) - $startTime" | bc )
+    printf "%s %.2f %.2f %.3f %s\n" "$blayout" "$writeTime" "$readTime" \
+           "$( echo "$readTime / $nofSinos" | bc -l )" "$(ratio "$inFile" "$benchFile")"
+    rm -f "$benchFile" "$benchDir/sino.tif"
+  done
+  rm -rf "$benchDir"
+  exit 0
+fi
+
+if ! layout="$(layoutof "$chunks")" ; then
+  exit 1
+fi
+inSize=$(stat -c %s "$inFile")
+startTime=$(date +%s.%N)
+# written next to the output and renamed only on success, so that a failure leaves the output as it was
+tmpFile="$(mktemp --tmpdir="$(dirname "$(realpath -m "$outFile")")" .imblrepack_XXXXXX.hdf)"
+if ! repack "$inFile" "$tmpFile" "$layout" || ! mv "$tmpFile" "$outFile" ; then
+  echo "ERROR! Failed to write $outVol with layout $layout." >&2
+  rm -f "$tmpFile"
+  exit 1
+fi
+if [ -n "$filters" ] || $beverbose ; then
+  runTime=$( echo "$(date +%s.%N) - $startTime" | bc )
+  outSize=$(stat -c %s "$outFile")
+  echo "Written $outVol: $(numfmt --to=iec <<< $outSize)B of $(numfmt --to=iec <<< $inSize)B," \
+       "compression ratio $( printf "%.2f" "$( echo "$inSize / $outSize" | bc -l )" )," \
+       "$(numfmt --to=iec <<< $( echo "$inSize / ($runTime + 0.001)" | bc ))B/s in $( printf "%.1f" $runTime )s."
+fi
+exit 0
@@ -0,0 +1,249 @@
+#!/bin/bash
+
+EXEPATH="$(dirname "$(realpath "$0")" )"
+PATH="$EXEPATH:$PATH"
+
+printhelp() {
+  echo "Usage: $0 [OPTIONS] <command> [ARGS]"
+  echo "  Places interim volumes of the sample (clean, phase-filtered and reconstructed) into scratch"
+  echo "  tiers: directories on file systems of different speed, e.g. /dev/shm, local disk and network"
+  echo "  storage. Each volume goes into the fastest tier with enough free space. Tiers are ordered"
+  echo "  by the bandwidth measured with the bench command, or as listed if not measured."
+  echo "COMMANDS:"
+  echo "  pick SIZE [NAME]  Prints path of the interim volume NAME of SIZE bytes in the fastest tier"
+  echo "                    with enough space, or nothing if none fits. Copies of NAME left in"
+  echo "                    other tiers are removed. Without NAME prints the tier directory."
+  echo "                    Space of NAME is reserved until the volume is written, so that"
+  echo "                    concurrent picks do not promise the same free space twice."
+  echo "  where NAME        Prints path of the existing interim volume NAME, or its path in the"
+  echo "                    fastest tier if it does not exist."
+  echo "  clean [NAME...]   Removes given interim volumes of the sample, or all of them, from all tiers."
+  echo "  bench             Measures write and read bandwidths of the tiers and stores them for pick."
+  echo "OPTIONS:"
+  echo "  -t LIST      Colon-separated list of tier directories."
+  echo "               Default: \$IMBLSCRATCH or /dev/shm:\${TMPDIR:-/tmp}."
+  echo "  -d PATH      Directory of the sample. Default: current directory."
+  echo "  -p INT       Percentage of the free space of a tier allowed for use. Default: 80."
+  echo "  -s INT       Size of the benchmark file in MiB. Default: 1024."
+  echo "  -r INT       Seconds a reservation is kept while its volume is smaller than reserved."
+  echo "               Default: 21600."
+  echo "  -v           Be verbose to show progress."
+  echo "  -h           Prints this help."
+}
+
+chkint () {
+  if ! [ "$1" -eq "$1" ] 2>/dev/null || (( $1 < 0 )) ; then
+    echo "ERROR! String \"$1\" given by $2 is not a non-negative integer." >&2
+    exit 1
+  fi
+}
+
+tiers="${IMBLSCRATCH:-/dev/shm:${TMPDIR:-/tmp}}"
+sdir="."
+percent=80
+benchSize=1024
+reserveTime=21600
+beverbose=false
+while getopts "t:d:p:s:r:hv" opt ; do
+  case $opt in
+    t)  tiers=$OPTARG ;;
+    d)  sdir=$OPTARG ;;
+    p)  percent=$OPTARG ; chkint "$percent" "option -$opt" ;;
+    s)  benchSize=$OPTARG ; chkint "$benchSize" "option -$opt" ;;
+    r)  reserveTime=$OPTARG ; chkint "$reserveTime" "option -$opt" ;;
+    v)  beverbose=true ;;
+    h)  printhelp ; exit 1 ;;
+    \?) echo "ERROR! Invalid option: -$OPTARG" >&2 ; exit 1 ;;
+    :)  echo "ERROR! Option -$OPTARG requires an argument." >&2 ; exit 1 ;;
+  esac
+done
+shift $(( $OPTIND - 1 ))
+
+cmd="$1"
+shift
+benchFile="${XDG_CACHE_HOME:-$HOME/.cache}/imblproc/scratch-bench"
+prefix="imblproc_$(realpath -m "$sdir" | sed 's / _ g')_"
+
+
+# Prints tiers, one per line, fastest first.
+ordered() {
+  idx=0
+  tr ':' '\n' <<< "$tiers" | grep -v '^$' | while read tier ; do
+    bw=""
+    if [ -e "$benchFile" ] ; then
+      bw=$( awk -v tier="$tier" '{ dir = $0 ; sub(/^[^ ]+ [^ ]+ /, "", dir) }
+                                 dir == tier { print ( $1 < $2 ? $1 : $2 ) }' "$benchFile" | tail -n 1 )
+    fi
+    echo "${bw:-0} $idx $tier"
+    idx=$(( $idx + 1 ))
+  done | sort -s -k1,1gr -k2,2n | cut -d' ' -f 3-
+}
+
+
+# Prints space in bytes allowed for use in tier $1; memory backed tiers are limited by available RAM.
+capacity() {
+  avail=$( df -B1 --output=avail "$1" 2> /dev/null | tail -n 1 )
+  if [ "$(df --output=fstype "$1" 2> /dev/null | tail -n 1)" == "tmpfs" ] ; then
+    memSize=$(free -bw | sed 's:  *: :g' | cut -d' ' -f 8 | sed '2q;d')
+    if (( $memSize < ${avail:-0} )) ; then
+      avail=$memSize
+    fi
+  fi
+  echo $(( ${avail:-0} * $percent / 100 ))
+}
+
+
+# Reservations of the tier $1 are lines "bytes epoch path" of the volumes being written, changed
+# only under the lock of the tier. Prints bytes reserved but not yet allocated, dropping the
+# reservations of path $2 (to be replaced) and those which are complete or stale.
+reserved() {
+  resFile="$1/.imblscratch_reserved"
+  if [ ! -e "$resFile" ] ; then
+    echo 0
+    return
+  fi
+  now=$(date +%s)
+  total=0
+  while read rsize rtime rpath ; do
+    used=0
+    if [ -e "$rpath" ] ; then
+      used=$(( $(stat -c '%b * %B' "$rpath") ))
+    fi
+    if [ "$rpath" == "$2" ] || (( $used >= $rsize || $now - $rtime > $reserveTime )) ; then
+      continue
+    fi
+    echo "$rsize $rtime $rpath" >&3
+    total=$(( $total + $rsize - $used ))
+  done < "$resFile" 3> "$resFile.tmp"
+  mv "$resFile.tmp" "$resFile"
+  echo $total
+}
+
+
+case "$cmd" in
+
+  pick)
+    size="$1"
+    name="$2"
+    chkint "$size" "size"
+    picked=""
+    while read tier ; do
+      if [ ! -d "$tier" ] || [ ! -w "$tier" ] ; then
+        continue
+      fi
+      exec {lockFd}> "$tier/.imblscratch_lock"
+      flock "$lockFd"
+      space=$(( $(capacity "$tier") - $(reserved "$tier" "$tier/$prefix$name") ))
+      if [ -n "$name" ] && [ -e "$tier/$prefix$name" ] ; then # will be replaced
+        space=$(( $space + $(stat -c %s "$tier/$prefix$name") ))
+      fi
+      if $beverbose ; then
+        echo "Tier $tier: $(numfmt --to=iec <<< $space)B available for $(numfmt --to=iec <<< $size)B." >&2
+      fi
+      if (( $size <= $space )) ; then
+        picked="$tier"
+        if [ -n "$name" ] ; then
+          echo "$size $(date +%s) $tier/$prefix$name" >> "$tier/.imblscratch_reserved"
+        fi
+      fi
+      exec {lockFd}>&-
+      if [ -n "$picked" ] ; then
+        break
+      fi
+    done <<< "$(ordered)"
+    if [ -z "$picked" ] ; then
+      exit 0
+    fi
+    if [ -z "$name" ] ; then
+      echo "$picked"
+      exit 0
+    fi
+    while read tier ; do
+      if [ "$tier" != "$picked" ] ; then
+        rm -f "$tier/$prefix$name"
+      fi
+    done <<< "$(ordered)"
+    echo "$picked/$prefix$name"
+    ;;
+
+  where)
+    name="$1"
+    if [ -z "$name" ] ; then
+      echo "ERROR! No name of the interim volume given." >&2
+      exit 1
+    fi
+    first=""
+    while read tier ; do
+      if [ -e "$tier/$prefix$name" ] ; then
+        echo "$tier/$prefix$name"
+        exit 0
+      fi
+      first="${first:-$tier/$prefix$name}"
+    done <<< "$(ordered)"
+    echo "$first"
+    ;;
+
+  clean)
+    while read tier ; do
+      if [ -z "$1" ] ; then
+        rm -f "$tier/$prefix"*
+      fi
+      for name in "$@" ; do
+        rm -f "$tier/$prefix$name"
+      done
+      if [ -e "$tier/.imblscratch_reserved" ] ; then # reservations of the removed volumes
+        exec {lockFd}> "$tier/.imblscratch_lock"
+        flock "$lockFd"
+        awk -v pre="$tier/$prefix" -v names="$*" '
+              { rpath = $0 ; sub(/^[^ ]+ [^ ]+ /, "", rpath) }
+              index(rpath, pre) != 1 { print ; next }
+              names == "" { next }
+              { split(names, nms, " ") ; for ( n in nms ) if ( rpath == pre nms[n] ) next ; print }' \
+          "$tier/.imblscratch_reserved" > "$tier/.imblscratch_reserved.tmp" &&
+          mv "$tier/.imblscratch_reserved.tmp" "$tier/.imblscratch_reserved"
+        exec {lockFd}>&-
+      fi
+    done <<< "$(ordered)"
+    ;;
+
+  bench)
+    mkdir -p "$(dirname "$benchFile")"
+    echo "# tier write_MiB/s read_MiB/s"
+    tr ':' '\n' <<< "$tiers" | grep -v '^$' | while read tier ; do
+      if [ ! -d "$tier" ] || [ ! -w "$tier" ] ; then
+        echo "WARNING! Tier $tier is not a writable directory. Skipping." >&2
+        continue
+      fi
+      if (( $(capacity "$tier") < $benchSize * 1024 * 1024 )) ; then
+        echo "WARNING! Not enough space in tier $tier for the benchmark. Skipping." >&2
+        continue
+      fi
+      testFile="$tier/.imblscratch_bench_$$"
+      startTime=$(date +%s.%N)
+      dd if=/dev/zero of="$testFile" bs=1M count=$benchSize conv=fdatasync status=none
+      writeTime=$( echo "$(date +%s.%N) - $startTime" | bc )
+      startTime=$(date +%s.%N)
+      if ! dd if="$testFile" of=/dev/null bs=1M iflag=direct status=none 2> /dev/null ; then
+        dd if="$testFile" of=/dev/null bs=1M status=none # no direct I/O on tmpfs
+      fi
+      readTime=$( echo "$(date +%s.%N) - $startTime" | bc )
+      rm -f "$testFile"
+      wbw=$( echo "$benchSize / ($writeTime + 0.001)" | bc )
+      rbw=$( echo "$benchSize / ($readTime + 0.001)" | bc )
+      echo "$tier $wbw $rbw"
+      if [ -e "$benchFile" ] ; then
+        awk -v tier="$tier" '{ dir = $0 ; sub(/^[^ ]+ [^ ]+ /, "", dir) } dir != tier' "$benchFile" \
+          > "$benchFile.tmp" && mv "$benchFile.tmp" "$benchFile"
+      fi
+      echo "$wbw $rbw $tier" >> "$benchFile"
+    done
+    ;;
+
+  *)
+    echo "ERROR! Unknown command \"$cmd\"." >&2
+    printhelp >&2
+    exit 1
+    ;;
+
+esac
+exit 0
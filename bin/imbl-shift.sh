@@ -25,6 +25,10 @@ printhelp() {
   echo "  -R FLOAT     Rotate projections."
   echo "  -I str       Type of gap fill algorithm: NO(default), NS, AT, AM"
   echo "  -t INT       Test mode: keeps intermediate images for the given projection."
+  echo "  -P           Form projections of the direct and flipped halves concurrently. The output"
+  echo "               is created first and each half writes its own projections into it."
+  echo "  -V           Verify concurrent formation: repeat it serially into temporary volume and"
+  echo "               compare the two with h5diff. Implies -P."
   echo "  -v           Be verbose to show progress."
   echo "  -h           Prints this help."
 }
@@ -102,8 +106,10 @@ rotate=0
 fill=""
 testme=""
 beverbose=false
+concurrent=false
+verify=false
 allargs=""
-while getopts "b:B:d:D:m:M:g:f:F:s:e:c:a:C:R:I:t:hv" opt ; do
+while getopts "b:B:d:D:m:M:g:f:F:s:e:c:a:C:R:I:t:PVhv" opt ; do
   allargs=" $allargs -$opt $OPTARG"
   case $opt in
     b)  bgO=$OPTARG;;
@@ -157,6 +163,10 @@ while getopts "b:B:d:D:m:M:g:f:F:s:e:c:a:C:R:I:t:hv" opt ; do
         ;;
     I)  fill="$OPTARG";;
     t)  testme="$OPTARG";;
+    P)  concurrent=true;;
+    V)  concurrent=true
+        verify=true
+        ;;
     v)  beverbose=true;;
     h)  printhelp ; exit 1 ;;
     \?) echo "ERROR! Invalid option: -$OPTARG" >&2 ; exit 1 ;;
@@ -262,35 +272,13 @@ if [ -z "$shiftX" ] || [ -z "$shiftY" ] ; then
 fi
 
 
-roundToInt() {
-  printf "%.0f\n" "$1"
-}
-
-abs() {
-  echo "${1/#-}"
-}
-
-maxNum() {
-  echo -e "$1" | tr -d ' ' | sort -n | tail -1
-}
-
-minNum() {
-  echo -e "$1" | tr -d ' ' | sort -n | head -1
-}
-
-centshift=$( roundToInt $(echo " 2 * $cent - $shiftX " | bc) )
-norgx=$(  maxNum "0 \n $shiftX \n $centshift" )
-norgxD=$( minNum "0 \n $shiftX" )
-norgxF=$( minNum "0 \n $centshift" )
-nendx=$(  minNum "0 \n $shiftX \n $centshift" )
-nendxD=$( maxNum "0 \n $shiftX" )
-nendxF=$( maxNum "0 \n $centshift" )
-
-cropTB=$(abs "$shiftY")
-cropD="$(($norgx-$norgxD+$cropL))-$(($nendxD-$nendx+$cropR)),$(($cropTB+$cropT))-$(($cropTB+$cropB))"
-cropF="$(($norgx-$norgxF+$cropL))-$(($nendxF-$nendx+$cropR)),$(($cropTB+$cropT))-$(($cropTB+$cropB))"
-spshD="$shiftX,$shiftY"
-spshF="$centshift,$shiftY"
+# crops and shifts of the direct (D) and flipped (F) halves: centshift, cropD, cropF, spshD, spshF
+if ! geom="$( python3 "$EXEPATH/../share/imblproc/stitchgeom.py" shift \
+                --shift="$shiftX,$shiftY" --centre="$cent" --crop="$cropT,$cropL,$cropB,$cropR" )" ; then
+  echo "Failed to compute geometry of the shift-in-scan." >&2
+  exit 1
+fi
+eval "$geom"
 argD="-C $cropD -g $spshD"
 argF="-C $cropF -f $spshF"
 
@@ -299,7 +287,9 @@ doStitch() {
   stO=$(($firstO+$1))
   stS=$(($firstS+$2))
   outStr=""
-  if [ -n "$testme" ] ; then
+  if [ -n "$5" ] ; then
+    outStr="$5"
+  elif [ -n "$testme" ] ; then
     outStr="T${testme}_O${stO}_S${stS}__${outVol}"
   else
     outStr="$outVol:$1+$3,$end"
@@ -313,23 +303,124 @@ doStitch() {
   eval $toExec
 }
 
+
+# Runs both halves (arguments of doStitch separated by '--') concurrently. Output lines are
+# prefixed by the half and progress of the two is merged into single counter over all projections.
+doConcurrent() {
+  runF=( "${@:1:4}" )
+  runD=( "${@:6:4}" )
+  runHalf() {
+    set -o pipefail
+    doStitch "${@:2}" | awk -v RS='[\r\n]+' -v tag="$1" '{ print tag, $0 ; fflush() }'
+  }
+  if $beverbose ; then
+    echo "Starting process ($(( ${runF[2]} + ${runD[2]} )) steps): forming projections of both halves concurrently."
+  fi
+  (
+    runHalf flipped "${runF[@]}" &
+    pidF=$!
+    runHalf direct "${runD[@]}" &
+    pidD=$!
+    wait $pidF
+    rcF=$?
+    wait $pidD
+    rcD=$?
+    if (( $rcF )) ; then
+      echo "ERROR! Forming projections of the flipped half failed with exit code $rcF." >&2
+    fi
+    if (( $rcD )) ; then
+      echo "ERROR! Forming projections of the direct half failed with exit code $rcD." >&2
+    fi
+    (( ! $rcF && ! $rcD ))
+  ) | awk -v countF="${runF[2]}" -v countD="${runD[2]}" -v verbose=$beverbose '
+      { tag = $1 ; line = substr($0, length(tag) + 2) }
+      line ~ /^[0-9]+\/[0-9]+$/ {
+        split(line, prg, "/")
+        done[tag] = prg[1] / prg[2]
+        step = int(countF * done["flipped"] + countD * done["direct"])
+        if ( verbose == "true" && step > last ) {
+          last = step
+          print step "/" countF + countD
+          fflush()
+        }
+        next
+      }
+      line ~ /Starting process|Successfully finished|DONE/ { next }
+      { print "[" tag "] " line ; fflush() }'
+  return ${PIPESTATUS[0]}
+}
+
+
 if (( $delta == 0 )) ; then
   doStitch 0 0 $(( end + 1 )) "$argD"
+  exit $?
 elif (( $delta <= $piark  )) ; then
-  doStitch 0      $(($piark - $delta)) $delta                 "$argF"
-  doStitch $delta 0                    $(($end - $delta + 1)) "$argD"
+  halfF=( 0      $(($piark - $delta)) $delta                 "$argF" )
+  halfD=( $delta 0                    $(($end - $delta + 1)) "$argD" )
 else
   tailO=$(( 2*$piark - $delta ))
   tailS=$(( $end - $tailO ))
-  doStitch 0      $tailO               $tailS           "$argD"
-  doStitch $tailS $(( $end - $piark )) $(( tailO + 1 )) "$argF"
+  halfD=( 0      $tailO               $tailS           "$argD" )
+  halfF=( $tailS $(( $end - $piark )) $(( tailO + 1 )) "$argF" )
 fi
 
-exit $?
-
-
-
-
+if ! $concurrent || [ -n "$testme" ] ; then
+  if (( $delta <= $piark  )) ; then
+    doStitch "${halfF[@]}" && doStitch "${halfD[@]}"
+  else
+    doStitch "${halfD[@]}" && doStitch "${halfF[@]}"
+  fi
+  exit $?
+fi
 
+# The output is created by forming the first projection of the longer half alone, exactly as
+# the serial formation creates it. The rest of both halves then write their own disjoint
+# projections of the same contiguous dataset concurrently, as the shards of imbl-ct.sh do.
+outFile="${outVol%%:*}"
+outData="${outVol#*:}"
+export HDF5_USE_FILE_LOCKING=FALSE
+runF=( "${halfF[@]}" )
+runD=( "${halfD[@]}" )
+if (( ${halfF[2]} > ${halfD[2]} )) ; then
+  firstRun=( "${halfF[0]}" "${halfF[1]}" 1 "${halfF[3]}" )
+  runF=( $(( ${halfF[0]} + 1 )) $(( ${halfF[1]} + 1 )) $(( ${halfF[2]} - 1 )) "${halfF[3]}" )
+else
+  firstRun=( "${halfD[0]}" "${halfD[1]}" 1 "${halfD[3]}" )
+  runD=( $(( ${halfD[0]} + 1 )) $(( ${halfD[1]} + 1 )) $(( ${halfD[2]} - 1 )) "${halfD[3]}" )
+fi
+if $beverbose ; then
+  echo "Creating output $outVol by forming its projection ${firstRun[0]}."
+fi
+if ! doStitch "${firstRun[@]}" > /dev/null ; then
+  echo "ERROR! Could not create output volume $outVol." >&2
+  exit 1
+fi
+if ! doConcurrent "${runF[@]}" -- "${runD[@]}" ; then
+  exit 1
+fi
 
+if $verify ; then
+  serialFile="$(mktemp --tmpdir="$(dirname "$outFile")" .imblshift_serial_XXXXXX.hdf)"
+  rm -f "$serialFile" # ctas creates it
+  if $beverbose ; then
+    echo "Repeating serially into $serialFile to verify the result."
+  fi
+  serialVol="$serialFile:$outData"
+  (
+    outVol="$serialVol"
+    doStitch "${halfF[@]}" > /dev/null && doStitch "${halfD[@]}" > /dev/null
+  )
+  vrc=$?
+  if (( $vrc )) ; then
+    echo "ERROR! Serial formation for verification failed." >&2
+  elif ! h5diff -q "$outFile" "$serialFile" "$outData" "$outData" ; then
+    echo "ERROR! Concurrent and serial formation differ." >&2
+    vrc=1
+  elif $beverbose ; then
+    echo "Concurrent and serial formation are identical."
+  fi
+  rm -f "$serialFile"
+  exit $vrc
+fi
 
+exit 0
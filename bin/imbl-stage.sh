@@ -0,0 +1,196 @@
+#!/bin/bash
+
+EXEPATH="$(dirname "$(realpath "$0")" )"
+PATH="$EXEPATH:$PATH"
+
+printhelp() {
+  echo "Usage: $0 [OPTIONS]"
+  echo "  Copies raw input files of the initiated sample into local scratch directory, so that"
+  echo "  stitching reads them locally instead of over the network. Run in the directory with"
+  echo "  the init file. Files are copied concurrently and verified by size and modification"
+  echo "  time: stitching uses the copy only if all files of the sample are staged and unchanged."
+  echo "  Least recently used samples are evicted if the scratch space is insufficient."
+  echo "  The scratch directory is remembered in the .imbl-stage file, apart from the init file,"
+  echo "  so that staging does not make the initiation or stitching look outdated."
+  echo "OPTIONS:"
+  echo "  -d PATH      Scratch directory. Default: \$IMBLSTAGE."
+  echo "  -b INT       Space in GiB available for staged samples. Default: all but 10% of"
+  echo "               the file system of the scratch directory."
+  echo "  -j INT       Number of concurrent copies. Default: 4."
+  echo "  -q           Query: prints directory with the staged copy if it is complete and up to"
+  echo "               date. Nothing is copied."
+  echo "  -c           Clean: removes staged copy of the sample."
+  echo "  -v           Be verbose to show progress."
+  echo "  -h           Prints this help."
+}
+
+chkint () {
+  if ! [ "$1" -eq "$1" ] 2>/dev/null || (( $1 < 1 )) ; then
+    echo "ERROR! String \"$1\" given by option $2 is not a positive integer." >&2
+    exit 1
+  fi
+}
+
+scratch="$IMBLSTAGE"
+budget=""
+jobs=4
+query=false
+clean=false
+beverbose=false
+allopts="$@"
+while getopts "d:b:j:qchv" opt ; do
+  case $opt in
+    d)  scratch=$OPTARG ;;
+    b)  budget=$OPTARG ; chkint "$budget" "-$opt" ;;
+    j)  jobs=$OPTARG ; chkint "$jobs" "-$opt" ;;
+    q)  query=true ;;
+    c)  clean=true ;;
+    v)  beverbose=true ;;
+    h)  printhelp ; exit 1 ;;
+    \?) echo "ERROR! Invalid option: -$OPTARG" >&2 ; exit 1 ;;
+    :)  echo "ERROR! Option -$OPTARG requires an argument." >&2 ; exit 1 ;;
+  esac
+done
+shift $(( $OPTIND - 1 ))
+
+initfile=".initstitch"
+stagefile=".imbl-stage"
+if [ ! -e "$initfile" ] ; then
+  echo "ERROR! Non existing init path: \"$initfile\"" >&2
+  exit 1
+fi
+format="TIFF" # default
+hpath=""
+stage=""
+source "$initfile"
+if [ -e "$stagefile" ] ; then
+  source "$stagefile"
+fi
+scratch="${scratch:-$stage}"
+if [ -z "$scratch" ] ; then
+  $query && exit 0
+  echo "ERROR! No scratch directory given." >&2
+  exit 1
+fi
+
+if [ -n "$subdirs" ] ; then
+  $query && exit 0
+  for subd in $filemask ; do
+    if $beverbose ; then
+      echo "Staging subdirectory $subd ... "
+    fi
+    if ! ( cd "$subd" && $0 $allopts ) ; then
+      exit 1
+    fi
+  done
+  exit 0
+fi
+
+# source of the frames: ingested HDF5 files if any, the acquisition otherwise
+src="$ipath"
+if [ -n "$hpath" ] && [ -d "$hpath" ] ; then
+  src="$hpath"
+  format="$hformat"
+fi
+src="$(realpath "$src")"
+dst="$(realpath -m "$scratch")/$(basename "$src")_$(sha1sum <<< "$src" | cut -c1-12)"
+
+if $clean ; then
+  rm -rf "$dst"
+  rm -f "$stagefile"
+  exit 0
+fi
+
+# Prints "name size mtime" of the sample files in directory $1
+listing() {
+  if [ ! -d "$1" ] ; then
+    return
+  fi
+  echo $filemask | sed 's: :\n:g' | sed -r 's ^(.+) _\1 g' | while read imgm ; do
+    if [ "$format" == "HDF5" ] ; then
+      find "$1" -maxdepth 1 -name "SAMPLE${imgm}.hdf" -printf '%f %s %T@\n'
+    else
+      find "$1" -maxdepth 1 -name "SAMPLE${imgm}_T*.tif" -printf '%f %s %T@\n'
+    fi
+  done | sort
+}
+
+srcList="$(listing "$src")"
+if [ -z "$srcList" ] ; then
+  $query && exit 0
+  echo "ERROR! No sample files found in $src." >&2
+  exit 1
+fi
+missing="$( comm -23 <(echo "$srcList") <(listing "$dst") )"
+
+if $query ; then
+  if [ -z "$missing" ] ; then
+    touch "$dst/.used"
+    echo "$dst"
+  fi
+  exit 0
+fi
+
+if ! mkdir -p "$dst" ; then
+  echo "ERROR! Could not create scratch directory $dst." >&2
+  exit 1
+fi
+touch "$dst/.used"
+stageLine="stage=\"$(realpath "$scratch")\""
+if [ "$stageLine" != "$(cat "$stagefile" 2> /dev/null)" ] ; then
+  echo "$stageLine" > "$stagefile"
+fi
+if [ -z "$missing" ] ; then
+  if $beverbose ; then
+    echo "All files are staged in $dst and up to date."
+  fi
+  exit 0
+fi
+
+# evict least recently used samples until the missing files fit
+need=$( awk '{ sum += $2 } END { print sum + 0 }' <<< "$missing" )
+if [ -z "$budget" ] ; then
+  budget=$(( $(df -B1 --output=size "$dst" | tail -n 1) * 9 / 10 ))
+else
+  budget=$(( $budget * 1024 * 1024 * 1024 ))
+fi
+used=$( du -sb "$scratch" | cut -f 1 )
+while (( $used + $need > $budget )) ; do
+  lru="$( for sdir in "$scratch"/*/ ; do
+            sdir="${sdir%/}"
+            if [ "$sdir" != "$dst" ] && [ -e "$sdir/.used" ] ; then
+              echo "$(stat -c %Y "$sdir/.used") $sdir"
+            fi
+          done | sort -n | head -n 1 | cut -d' ' -f 2- )"
+  if [ -z "$lru" ] ; then
+    echo "ERROR! Not enough space in $scratch to stage $(numfmt --to=iec <<< $need)B." >&2
+    exit 1
+  fi
+  if $beverbose ; then
+    echo "Evicting least recently used staged sample $lru."
+  fi
+  rm -rf "$lru"
+  used=$( du -sb "$scratch" | cut -f 1 )
+done
+
+nofFiles=$( wc -l <<< "$missing" )
+if $beverbose ; then
+  echo "Staging $nofFiles files, $(numfmt --to=iec <<< $need)B, from $src into $dst by $jobs concurrent copies."
+fi
+echo "Starting process ($nofFiles steps): staging input files."
+cut -d' ' -f 1 <<< "$missing" \
+  | xargs -P "$jobs" -I{} bash -c 'cp -p "$1/$3" "$2/$3.part" && mv "$2/$3.part" "$2/$3" && echo "$3"' _ "$src" "$dst" {} \
+  | awk -v total=$nofFiles '{ print NR "/" total ; fflush() }'
+if (( ${PIPESTATUS[1]} )) ; then
+  echo "ERROR! Failed to stage some of the files into $dst." >&2
+  rm -f "$dst"/*.part
+  exit 1
+fi
+if [ -n "$( comm -23 <(echo "$srcList") <(listing "$dst") )" ] ; then
+  echo "ERROR! Staged files differ from the source: it was probably modified while copying." >&2
+  exit 1
+fi
+if $beverbose ; then
+  echo "Staged input files in $dst."
+fi
+exit 0
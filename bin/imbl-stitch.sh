@@ -15,7 +15,8 @@ printhelp() {
   echo "  -G X,Y            Origin of the second stitch (in 2D scans)."
   echo "  -f X,Y            Origin of the flip-and-stitch (in 360deg scans)."
   echo "     X and Y numbers are  the origin of the second image in the coordinate system of"
-  echo "     the first one. Same as produced by the pairwise-stitching plugin of ImageJ."
+  echo "     the first one. Same as produced by the pairwise-stitching plugin of ImageJ or"
+  echo "     by imbl-register.py from the tiles exported with -e."
   echo "  -c T,L,B,R        Crop source images."
   echo "  -C T,L,B,R        Crop final image."
   echo "     T, L, B and R numbers give cropping from the edges of the images:"
@@ -34,8 +35,23 @@ printhelp() {
   echo "  -M INT            Last projection to be processed."
   echo "  -d                Does not perform flat field correction on the images."
   echo "  -t INT            Test mode: keeps intermediate images for the projection in tmp."
-  echo "  -s                Don't save stitched volume in storage (if created in memory)."
-  echo "  -w                Don't wipe stitched volume from memory."
+  echo "  -e INT            Export flat-field corrected tiles of given number of projections evenly"
+  echo "                    spread over the processed range into tmp/TILE_<projection>_<tile>.tif"
+  echo "                    to register stitching origins or preview the stitching. Tiles are not"
+  echo "                    rotated, cropped or binned; tiles of the flipped half follow the"
+  echo "                    direct ones and are not flipped. Nothing is stitched."
+  echo "  -s                Don't save stitched volume in storage (if created in scratch)."
+  echo "  -w                Don't wipe stitched volume from scratch. See imbl-scratch.sh."
+  echo "  -k Z,Y            Layout of the stitched volume in storage: chunks of Z projections and"
+  echo "                    Y rows spanning the whole width, which makes reading of sinograms"
+  echo "                    much faster. Contiguous if not given. Applied while the volume formed"
+  echo "                    in scratch is copied to storage; volume formed directly in storage"
+  echo "                    stays contiguous, as ctas writes it. See imbl-repack.sh."
+  echo "  -Z                Compress stitched volume in storage losslessly. Implies -k 32,8"
+  echo "                    unless other chunks are given. Applies as -k does, in a slow"
+  echo "                    single-threaded pass of h5repack."
+  echo "  -x                Ignore the run journal: re-stitch even if the stitched volume is"
+  echo "                    up to date with the parameters and inputs."
   echo "  -v                Be verbose to show progress."
   echo "  -h                Prints this help."
 }
@@ -52,6 +68,25 @@ projfile=".projections"
 initfile=".initstitch"
 chkf "$initfile" init
 source "${initfile}"
+stage=""
+if [ -e .imbl-stage ] ; then # written by imbl-stage.sh
+  source .imbl-stage
+fi
+if [ -n "$hpath" ] ; then # frames ingested into HDF5 by imbl-ingest.sh
+  if [ -d "$hpath" ] ; then
+    ipath="$hpath"
+    format="$hformat"
+    H5data="/data"
+  else
+    echo "WARNING! Directory $hpath with ingested frames does not exist. Reading original frames." >&2
+  fi
+fi
+if [ -n "$stage" ] ; then # input copied into local scratch by imbl-stage.sh
+  staged="$(imbl-stage.sh -q)"
+  if [ -n "$staged" ] ; then
+    ipath="$staged"
+  fi
+fi
 
 nofSt=$(wc -w <<< $filemask )
 if (( $nofSt == 0 )) ; then
@@ -73,15 +108,20 @@ origin="0,0"
 originSecond="0,0"
 originFlip="0,0"
 testme=""
+exportTiles=0
 ffcorrection=true
 stParam=""
+ffParam=""
 minProj=0
 maxProj=$(( $pjs - 1 ))
 volStore=true # save in storage
 volWipe=true # wipe from memory
+chunks="" # layout in storage: contiguous if empty
+compress="none"
+useJournal=true
 beverbose=false
 
-while getopts "i:Fg:G:f:c:C:r:b:z:m:M:E:n:N:dt:swhv" opt ; do
+while getopts "i:Fg:G:f:c:C:r:b:z:m:M:E:n:N:dt:e:swk:Zxhv" opt ; do
   case $opt in
     i)  gmask=$OPTARG;;
     F)  fill=false;;
@@ -132,13 +172,25 @@ while getopts "i:Fg:G:f:c:C:r:b:z:m:M:E:n:N:dt:swhv" opt ; do
     d)  ffcorrection=false ;;
     s)  volStore=false ;;
     w)  volWipe=false ;;
+    k)  chunks=$OPTARG ;;
+    Z)  compress="lossless" ;;
+    x)  useJournal=false ;;
     t)  testme="$OPTARG" ;;
+    e)  exportTiles=$OPTARG
+        if [ ! "$exportTiles" -eq "$exportTiles" ] 2> /dev/null || (( $exportTiles < 1 )) ; then
+          echo "ERROR! -e argument \"$exportTiles\" is not a positive integer." >&2
+          exit 1
+        fi
+        ;;
     v)  beverbose=true ;;
     h)  printhelp ; exit 1 ;;
     \?) echo "ERROR! Invalid option: -$OPTARG" >&2 ; exit 1 ;;
     :)  echo "ERROR! Option -$OPTARG requires an argument." >&2 ; exit 1 ;;
   esac
 done
+if [ "$compress" != "none" ] && [ -z "$chunks" ] ; then
+  chunks="32,8"
+fi
 
 
 if [ -z "$PROCRECURSIVE" ] ; then
@@ -147,7 +199,7 @@ fi
 
 if [ -n "$subdirs" ] ; then
 
-  if [ -n "$testme" ] ; then
+  if [ -n "$testme" ] || (( $exportTiles )) ; then
     echo "ERROR! Multiple sub-samples processing cannot be done in test mode." >&2
     echo "       cd into one of the following sub-sample directories and test there:" >&2
     for subd in $filemask ; do
@@ -184,24 +236,27 @@ export PROCRECURSIVE=true
 
 
 
-if (( $nofSt > 1 )) ; then
-  stParam="$stParam --origin $origin"
-  if (( $secondsize > 1 )) ; then
-    stParam="$stParam --second-origin $originSecond"
-    stParam="$stParam --second-size $secondsize"
-  fi
+# stitching options of ctas proj and the predicted volume come from the geometry model shared with the UI
+geomParam="$width,$hight -n $nofSt -g=$origin -c=$crop -C=$cropFinal -b $binn -z $zinn"
+if (( $secondsize > 1 )) ; then
+  geomParam="$geomParam -G=$originSecond -s $secondsize"
 fi
-
 if (( $fshift >= 1 )) ; then
   nofSt=$(( 2 * $nofSt ))
   pjs=$(( $pjs - $fshift ))
-  stParam="$stParam --flip-origin $originFlip"
+  geomParam="$geomParam -f=$originFlip"
 fi
 if (( maxProj >= $pjs  )) ; then
   maxProj=$(( $pjs - 1 ))
 fi
 ppjs=$(( $maxProj - $minProj + 1 ))
 nlen=${#ppjs}
+if ! geom="$( python3 "$EXEPATH/../share/imblproc/stitchgeom.py" stitch --options $geomParam -p $ppjs )" ; then
+  echo "Failed to compute geometry of the stitching." >&2
+  exit 1
+fi
+{ read -r geomOpts ; read gz gy gx gbytes ; } <<< "$geom"
+stParam="$stParam $geomOpts"
 
 if $beverbose ; then
   stParam="$stParam --verbose "
@@ -210,16 +265,19 @@ fi
 imgbg="$opath/bg.tif"
 if [ -e "$imgbg" ]  &&  $ffcorrection ; then
   stParam="$stParam --bg $imgbg"
+  ffParam="$ffParam --bg $imgbg"
 fi
 
 imgdf="$opath/df.tif"
 if [ -e "$imgdf" ]  &&  $ffcorrection ; then
   stParam="$stParam --df $imgdf"
+  ffParam="$ffParam --df $imgdf"
 fi
 
 imggf="$opath/gf.tif"
 if [ -e "$imggf" ]  &&  $ffcorrection ; then
   stParam="$stParam --dg $imggf"
+  ffParam="$ffParam --dg $imggf"
 fi
 
 imgms="$gmask"
@@ -295,6 +353,51 @@ if (( $(wc -w <<< "$filemask") > 1 )) ; then # purely for easy reading
 fi
 rm .idxs*o .idxs*f 2> /dev/null
 
+if (( $exportTiles )) ; then
+  if ! mkdir -p "tmp" ; then
+    echo "Could not create output sub-directory $(realpath "tmp"). Aborting."  >&2
+    exit 1
+  fi
+  rm -f tmp/TILE_*
+  exportProjs="$( for (( idx=0 ; idx < $exportTiles ; idx++ )) ; do # evenly spread over the range
+                    echo $(( $exportTiles > 1 ? $idx * ($ppjs - 1) / ($exportTiles - 1) : ($ppjs - 1) / 2 ))
+                  done | uniq )"
+  nofExp=$(( $(wc -w <<< $exportProjs) * $nofSt ))
+  echo "Starting process ($nofExp steps): exporting tiles."
+  step=0
+  for proj in $exportProjs ; do
+    for (( tile=0 ; tile < $nofSt ; tile++ )) ; do
+      tileOut="$( cut -d' ' -f $(( $tile + 1 )) "$idxsallf" \
+                  | ctas proj $ffParam --output "tmp/EXPORT_${tile}_@.tif" --test $proj | tail -n 1 )"
+      read tz ty tx tileFile <<< "$tileOut"
+      if [ -z "$tileFile" ] || ! mv "$tileFile" "tmp/TILE_${proj}_${tile}.tif" ; then
+        echo "ERROR! Failed to export tile $tile of projection $proj." >&2
+        exit 1
+      fi
+      step=$(( $step + 1 ))
+      echo "$step/$nofExp"
+    done
+  done
+  if $beverbose ; then
+    echo "Exported $nofSt tiles of projections" $exportProjs "into $(realpath tmp)."
+  fi
+  exit 0
+fi
+
+if [ -z "$testme" ] ; then
+  jProduct="clean.hdf"
+  jPlace="$jProduct"
+  if ! $volWipe && ! $volStore ; then # kept only in scratch, in whichever tier it fitted
+    jProduct="$(imbl-scratch.sh where clean.hdf)"
+    jPlace="scratch"
+  fi
+  jHash=$( imbl-journal.sh hash ${stParam/--verbose /} "$initfile" "$projfile" "$idxsallf" "product=$jPlace" )
+  if $useJournal && imbl-journal.sh -f "$jProduct" check stitch "$jHash" ; then
+    echo "Stitched volume $jProduct is up to date with the parameters and inputs. Skipping."
+    exit 0
+  fi
+  imbl-journal.sh start stitch "$jHash"
+fi
 
 if ! mkdir -p "tmp" ; then
   echo "Could not create output sub-directory $(realpath "tmp"). Aborting."  >&2
@@ -320,24 +423,25 @@ if [ -z "$x" ] ; then
   echo "ERROR! Test failed." >&2
   exit 1
 fi
+if $beverbose ; then
+  echo "Stitched volume ${x}x${y}x${z}, expected ${gx}x${gy}x${gz} $(numfmt --to=iec <<< ${gbytes:-0})B."
+fi
+if [ "$gx $gy $gz" != "$x $y $z" ] ; then
+  echo "WARNING! Geometry model disagrees with ctas proj. Using the latter." >&2
+fi
 
 cleanPath="clean.hdf"
-if ( ! $volWipe || ! $volStore ) ; then # create file in memory
+if ( ! $volWipe || ! $volStore ) ; then # create file in the fastest scratch tier
   volSize=$(( 4 * $x * $y * $z ))
   hVolSize="${x}x${y}x${z} $(numfmt --to=iec <<< $volSize)B"
-  memSize=$(free -bw | sed 's:  *: :g' | cut -d' ' -f 8 | sed '2q;d')
-  if (( $volSize > $( echo " scale=0 ; $memSize * 4 / 5 " | bc )  )) ; then
-    echo "WARNING! Not enough available memory $(numfmt --to=iec <<< $memSize)B to allow" \
-         " processing $hVolSize volume. Will use file storage for interim data, what can" \
-         " be significantly slower."  >&2
+  tpnm="$(imbl-scratch.sh $( $beverbose && echo "-v" ) pick $volSize $cleanPath)"
+  if [ -z "$tpnm" ] ; then
+    echo "WARNING! No scratch tier has space to allow processing $hVolSize volume." \
+         " Will use file storage for interim data, what can be significantly slower."  >&2
   else
-    crFilePrefix="/dev/shm/imblproc_$(realpath $PWD | sed 's / _ g')_"
-    #flfix=$( basename "$testOFl" | sed 's '${tstfl}'[0-9]*  g' )
-    #flfix="${flfix%.*}"
-    #tpnm="${crFilePrefix}clean${flfix}.hdf"
-    tpnm="${crFilePrefix}${cleanPath}"
+    crFilePrefix="${tpnm%$cleanPath}"
     if $beverbose ; then
-      echo "Creating in memory interim file $tpnm for $hVolSize volume."
+      echo "Creating interim file $tpnm for $hVolSize volume."
     fi
     tifForSize="${crFilePrefix}for_size.tif"
     if ! convert -size ${x}x${y} -colorspace gray -depth 8 canvas: "$tifForSize" \
@@ -352,7 +456,7 @@ if ( ! $volWipe || ! $volStore ) ; then # create file in memory
          fi
        )
     then
-      echo "WARNING! Could not create or allocate in memory interim file $tpnm for" \
+      echo "WARNING! Could not create or allocate interim file $tpnm for" \
            " $hVolSize volume. Will use file storage for interim data, what can be" \
            " significantly slower." >&2
       rm -rf "$crFilePrefix"*
@@ -373,24 +477,45 @@ if $beverbose ; then
   echo "Starting frame formation in $PWD."
   echo "  ctas proj $stParam $outParam < $idxsallf"
 fi
-ctas proj $stParam $outParam < "$idxsallf"  ||
-  ( echo "There was an error executing:" >&2
-    echo -e "ctas proj $stParam $outParam < $idxsallf"  >&2
-    echo -e "Removing incomplete file(s): ${outFile%.*}"'*'  >&2
-    rm "${outFile%.*}"'*'
-    exit 1 )
+if ! ctas proj $stParam $outParam < "$idxsallf" ; then
+  echo "There was an error executing:" >&2
+  echo -e "ctas proj $stParam $outParam < $idxsallf"  >&2
+  echo -e "Removing incomplete file(s): ${outFile%.*}"'*'  >&2
+  rm "${outFile%.*}"'*'
+  exit 1
+fi
+
+# Copies stitched volume into storage, re-chunked if requested.
+store() {
+  if [ -n "$chunks" ] ; then
+    rpParam="$( $beverbose && echo "-v" ) -k $chunks -z $compress"
+    if imbl-repack.sh $rpParam "$1:/data" "$2:/data" ; then
+      return 0
+    fi
+    echo "WARNING! Failed to write stitched volume with chunked layout or compressed." \
+         " Keeping it contiguous and uncompressed." >&2
+  fi
+  cp "$1" "$2"
+}
 
 
-if [ -n "$crFilePrefix" ] ; then # file is in memory
+if [ -n "$crFilePrefix" ] ; then # file is in scratch
   #trgnm="$opath/clean.hdf"
   if $volWipe || $volStore; then
     if $beverbose ; then
-      echo "Copying in-memory interim file $cleanPath to $PWD/clean.hdf."
+      echo "Copying interim file $cleanPath to $PWD/clean.hdf."
     fi
-    cp "$cleanPath" "clean.hdf"
+    store "$cleanPath" "clean.hdf"
     if $volWipe ; then
       rm "$cleanPath"
     fi
   fi
+elif [ -n "$chunks" ] && $beverbose ; then # file is in storage: not rewritten again
+  echo "Stitched volume was formed directly in storage: its layout stays contiguous."
+fi
+
+if [ "$jPlace" == "scratch" ] ; then
+  jProduct="$cleanPath"
 fi
+imbl-journal.sh -f "$jProduct" done stitch "$jHash"
 
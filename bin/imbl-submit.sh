@@ -0,0 +1,114 @@
+#!/bin/bash
+
+printhelp() {
+  echo "Usage: $0 [OPTIONS] [-- SBATCH_OPTIONS] < JOB_BODY"
+  echo "  Submits shell commands read from the standard input as a batch job to the SLURM"
+  echo "  scheduler and waits for its completion. Standard output and error of the job are"
+  echo "  streamed back as they grow; exit status of the job becomes the exit status of the script."
+  echo "  The job is cancelled if the script is interrupted or terminated."
+  echo "  SBATCH_OPTIONS are passed to sbatch as they are to request resources."
+  echo "OPTIONS:"
+  echo "  -J NAME      Name of the job. Default: imblproc."
+  echo "  -l PATH      Directory for job scripts and logs. Default: .imbl-jobs"
+  echo "  -p SECONDS   Interval between polls of the job state. Default: 5."
+  echo "  -v           Be verbose to report job state changes."
+  echo "  -h           Prints this help."
+}
+
+jobName="imblproc"
+logDir=".imbl-jobs"
+poll=5
+beverbose=false
+while getopts "J:l:p:hv" opt ; do
+  case $opt in
+    J)  jobName=$OPTARG ;;
+    l)  logDir=$OPTARG ;;
+    p)  poll=$OPTARG ;;
+    v)  beverbose=true ;;
+    h)  printhelp ; exit 1 ;;
+    \?) echo "ERROR! Invalid option: -$OPTARG" >&2 ; exit 1 ;;
+    :)  echo "ERROR! Option -$OPTARG requires an argument." >&2 ; exit 1 ;;
+  esac
+done
+shift $(( $OPTIND - 1 ))
+if [ "$1" == "--" ] ; then
+  shift
+fi
+
+for tool in sbatch squeue sacct scancel ; do
+  if ! command -v $tool &> /dev/null ; then
+    echo "ERROR! Scheduler command \"$tool\" is not available." >&2
+    exit 1
+  fi
+done
+
+if ! mkdir -p "$logDir" ; then
+  echo "ERROR! Could not create directory $logDir for batch jobs." >&2
+  exit 1
+fi
+jobScript="$(mktemp --tmpdir="$logDir" job_XXXXXX.sh)"
+echo "#!/bin/bash" > "$jobScript"
+cat >> "$jobScript"
+if (( $(wc -l < "$jobScript") < 2 )) ; then
+  echo "ERROR! Empty job body." >&2
+  rm -f "$jobScript"
+  exit 1
+fi
+
+jobId=$( sbatch --parsable -J "$jobName" --chdir="$PWD" \
+                -o "$logDir/%j.out" -e "$logDir/%j.err" "$@" "$jobScript" | cut -d';' -f1 )
+if [ -z "$jobId" ] ; then
+  echo "ERROR! Failed to submit batch job." >&2
+  exit 1
+fi
+echo "Submitted batch job $jobId: $jobName."
+
+tailPids=""
+finish() {
+  if [ -n "$tailPids" ] ; then
+    kill $tailPids 2> /dev/null
+  fi
+}
+trap finish EXIT
+trap 'echo "Cancelling batch job $jobId." >&2 ; scancel "$jobId" ; exit 1' INT TERM
+
+lastState=""
+while true ; do
+  state=$( squeue -h -j "$jobId" -o %T 2> /dev/null )
+  if [ -z "$state" ] ; then
+    break
+  fi
+  if [ "$state" != "$lastState" ] ; then
+    if $beverbose ; then
+      echo "Batch job $jobId is $state."
+    fi
+    if [ "$state" == "RUNNING" ] && [ -z "$tailPids" ] ; then
+      touch "$logDir/$jobId.out" "$logDir/$jobId.err"
+      tail -n +1 -F "$logDir/$jobId.out" 2> /dev/null &
+      tailPids="$!"
+      tail -n +1 -F "$logDir/$jobId.err" >&2 2> /dev/null &
+      tailPids="$tailPids $!"
+    fi
+    lastState="$state"
+  fi
+  sleep "$poll" &
+  wait $!
+done
+
+if [ -z "$tailPids" ] ; then # job was too short to catch it running
+  cat "$logDir/$jobId.out" 2> /dev/null
+  cat "$logDir/$jobId.err" >&2 2> /dev/null
+else
+  sleep 1 # let tail catch up
+fi
+
+IFS='|' read state exitCode <<< "$( sacct -n -X -P -j "$jobId" -o State,ExitCode 2> /dev/null | head -n 1 )"
+exitCode="${exitCode%%:*}"
+if $beverbose ; then
+  echo "Batch job $jobId finished as ${state:-UNKNOWN} with exit code ${exitCode:-unknown}."
+fi
+if [ "$state" == "COMPLETED" ] ; then
+  exit 0
+fi
+exit $(( ${exitCode:-1} ? ${exitCode:-1} : 1 ))
+
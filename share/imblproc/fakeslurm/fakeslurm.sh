@@ -0,0 +1,126 @@
+#!/bin/bash
+
+# Emulates sbatch, squeue, sacct and scancel of the SLURM scheduler on the localhost
+# to test batch submission without a cluster. Jobs start immediately in the background.
+# Prepend directory of this script to PATH to use it. State is kept in $FAKESLURM_DIR.
+
+stateDir="${FAKESLURM_DIR:-/tmp/fakeslurm_$(id -un)}"
+mkdir -p "$stateDir"
+tool="$(basename "$0")"
+
+case "$tool" in
+
+  sbatch)
+    jobName="job"
+    outLog="slurm-%j.out"
+    errLog=""
+    chdir="$PWD"
+    parsable=false
+    while [ -n "$1" ] ; do
+      case "$1" in
+        --parsable) parsable=true ;;
+        -J) jobName="$2" ; shift ;;
+        -o) outLog="$2" ; shift ;;
+        -e) errLog="$2" ; shift ;;
+        --job-name=*) jobName="${1#*=}" ;;
+        --output=*) outLog="${1#*=}" ;;
+        --error=*) errLog="${1#*=}" ;;
+        --chdir=*) chdir="${1#*=}" ;;
+        -*) ;; # resource requests are ignored
+        *) break ;;
+      esac
+      shift
+    done
+    if [ ! -f "$1" ] ; then
+      echo "sbatch: error: Unable to open file $1" >&2
+      exit 1
+    fi
+    jobId=$(( $(cat "$stateDir/last" 2> /dev/null || echo 1000) + 1 ))
+    echo "$jobId" > "$stateDir/last"
+    outLog="${outLog//%j/$jobId}"
+    errLog="${errLog//%j/$jobId}"
+    echo "$jobName" > "$stateDir/$jobId.name"
+    echo "PENDING" > "$stateDir/$jobId.state"
+    cp "$1" "$stateDir/$jobId.sh"
+    # own session to cancel the whole process group
+    setsid bash -c '
+      cd "$1"
+      echo "RUNNING" > "$2.state"
+      if [ -n "$4" ] ; then
+        bash "$2.sh" > "$3" 2> "$4"
+      else
+        bash "$2.sh" > "$3" 2>&1
+      fi
+      code=$?
+      if [ "$(cat "$2.state")" == "RUNNING" ] ; then
+        echo "$code" > "$2.exit"
+        echo $( (( $code )) && echo FAILED || echo COMPLETED ) > "$2.state"
+      fi
+    ' fakeslurm "$chdir" "$stateDir/$jobId" "$outLog" "$errLog" < /dev/null &> /dev/null &
+    echo "$!" > "$stateDir/$jobId.pid"
+    if $parsable ; then
+      echo "$jobId"
+    else
+      echo "Submitted batch job $jobId"
+    fi
+    ;;
+
+  squeue)
+    jobs=""
+    header=true
+    while [ -n "$1" ] ; do
+      case "$1" in
+        -h|--noheader) header=false ;;
+        -j) jobs="$2" ; shift ;;
+        --jobs=*) jobs="${1#*=}" ;;
+        -o) shift ;;
+      esac
+      shift
+    done
+    if [ -z "$jobs" ] ; then
+      jobs=$( ls "$stateDir" | sed -n 's:\.state$::p' )
+    fi
+    if $header ; then
+      echo "STATE"
+    fi
+    for jobId in $( tr ',' ' ' <<< "$jobs" ) ; do
+      state="$(cat "$stateDir/$jobId.state" 2> /dev/null)"
+      if [ "$state" == "PENDING" ] || [ "$state" == "RUNNING" ] ; then
+        echo "$state"
+      fi
+    done
+    ;;
+
+  sacct)
+    jobs=""
+    while [ -n "$1" ] ; do
+      case "$1" in
+        -j) jobs="$2" ; shift ;;
+        --jobs=*) jobs="${1#*=}" ;;
+      esac
+      shift
+    done
+    for jobId in $( tr ',' ' ' <<< "$jobs" ) ; do
+      if [ -e "$stateDir/$jobId.state" ] ; then
+        echo "$(cat "$stateDir/$jobId.state")|$(cat "$stateDir/$jobId.exit" 2> /dev/null || echo 0):0"
+      fi
+    done
+    ;;
+
+  scancel)
+    for jobId in "$@" ; do
+      if [ -e "$stateDir/$jobId.pid" ] ; then
+        echo "CANCELLED" > "$stateDir/$jobId.state"
+        kill -TERM -- -"$(cat "$stateDir/$jobId.pid")" 2> /dev/null
+      fi
+    done
+    ;;
+
+  *)
+    echo "ERROR! Link this script as sbatch, squeue, sacct or scancel." >&2
+    exit 1
+    ;;
+
+esac
+exit 0
+
@@ -1,11 +1,11 @@
 #!/usr/bin/env python3
 
-import sys, os, re, psutil, time, signal, argparse
+import sys, os, re, psutil, time, signal, argparse, hashlib, math, importlib.util, concurrent.futures, traceback
 from os import path
 from PyQt5 import QtWidgets, QtCore, QtGui
 from PyQt5.QtCore import pyqtSlot, pyqtSignal, QSettings, QProcess, QEventLoop, QObject, QTimer
 from PyQt5.QtWidgets import QFileDialog, QApplication
-from PyQt5.uic import loadUi
+from PyQt5.uic import loadUi, compileUi
 from xml.sax.saxutils import escape
 from argparse import RawTextHelpFormatter
 
@@ -16,7 +16,54 @@ uiPath = myPath
 #uiPath = path.join(execPath, "..", "share", "imblproc")
 warnStyle = 'background-color: rgba(255, 0, 0, 128);'
 initFileName = '.initstitch'
+journalName = '.imbl-journal'
 listOfCreatedMemFiles = []
+envScratch = os.environ.get("IMBLSCRATCH", "")
+uiCacheDir = path.join(os.environ.get("XDG_CACHE_HOME", path.join(path.expanduser("~"), ".cache")), "imblproc")
+compiledForms = {}
+lazyModules = {}
+startupTimes = [("interpreter", psutil.Process().create_time()), ("imports", time.time())]
+
+
+def loadCompiledUi(uiFile, baseinstance):
+    # Same as loadUi, but the interface is compiled once into the cache and imported afterwards,
+    # which is much faster than parsing the ui file on every start.
+    if uiFile not in compiledForms:
+        try:
+            with open(uiFile, 'rb') as uif:
+                digest = hashlib.sha1(uif.read() + QtCore.PYQT_VERSION_STR.encode()).hexdigest()[:16]
+            baseName = re.sub(r'\W', '_', path.splitext(path.basename(uiFile))[0])
+            modName = baseName + "_" + digest
+            modFile = path.join(uiCacheDir, modName + ".py")
+            if not path.exists(modFile):
+                os.makedirs(uiCacheDir, exist_ok=True)
+                tmpFile = f"{modFile}.{os.getpid()}"
+                with open(tmpFile, 'w') as pyf:
+                    compileUi(uiFile, pyf)
+                os.replace(tmpFile, modFile)
+            # forms compiled from other versions of the ui file, with their bytecode
+            stale = re.compile(rf"{baseName}_(?!{digest})[0-9a-f]{{16}}(\.py|\..*\.pyc)$")
+            for cdir in uiCacheDir, path.join(uiCacheDir, "__pycache__"):
+                for fname in os.listdir(cdir) if path.isdir(cdir) else []:
+                    if stale.match(fname):
+                        try:
+                            os.remove(path.join(cdir, fname))
+                        except OSError:
+                            pass
+            spec = importlib.util.spec_from_file_location(modName, modFile)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            compiledForms[uiFile] = next( cls for name, cls in vars(module).items() if name.startswith("Ui_") )
+        except Exception as err:
+            print(f"Could not use compiled interface from {uiFile}: {err}", file=sys.stderr)
+            compiledForms[uiFile] = None
+    if not compiledForms[uiFile]:
+        return loadUi(uiFile, baseinstance)
+    form = compiledForms[uiFile]()
+    form.setupUi(baseinstance)
+    for name, obj in vars(form).items():
+        setattr(baseinstance, name, obj)
+    return baseinstance
 
 
 def onBrowse(wdg, desc, forFile=False):
@@ -38,6 +85,7 @@ class Script(QObject) :
     started = pyqtSignal()
     scriptPrefix = "script_"
     procPrefix = "proc_"
+    runs = 0 # counts probes executed with run()
 
 
     def __init__(self, parent=None):
@@ -51,6 +99,11 @@ class Script(QObject) :
         self.proc.stateChanged.connect(self.onState)
         self.time=0
         self.dryRun = False
+        self.governor = None
+        self.collectOut = None # output of this script only, when not None
+        self.collectErr = None
+        self.progress = None # [value, maximum, format] of the progress bar for this script
+        self.counter = 0
 
 
     def setRole(self, role):
@@ -110,7 +163,9 @@ class Script(QObject) :
                 args.append(par)
             else:
                 args += par
-        self.proc.setArguments(args)
+        prefix = self.governor.prefix(self.role()) if self.governor else []
+        self.proc.setProgram(prefix[0] if prefix else self.shell)
+        self.proc.setArguments([*prefix[1:], self.shell, *args] if prefix else args)
         if self.dryRun:
             self.started.emit()
             print(f"Dry run for:\n{self.body()}")
@@ -132,11 +187,21 @@ class Script(QObject) :
             return
         try:
             psproc=psutil.Process(self.proc.pid())
-            for child in psproc.children(recursive=True):
-                child.kill()
-            self.proc.kill()
+            children = psproc.children(recursive=True)
+            for child in children: # gives a chance to clean up, e.g. to cancel batch jobs
+                try:
+                    child.terminate()
+                except psutil.NoSuchProcess: # finished meanwhile
+                    pass
+            _, alive = psutil.wait_procs(children, timeout=3)
+            for child in alive:
+                try:
+                    child.kill()
+                except psutil.NoSuchProcess:
+                    pass
         except Exception:
             pass
+        self.proc.kill()
 
 
     def waitStop(self):
@@ -148,6 +213,8 @@ class Script(QObject) :
 
 
     def evaluate(self, par=None):
+        if not self.fileExec.size():
+            return 0
         tempproc = QProcess(self)
         args = ["-n", self.fileExec.fileName()]
         if par:
@@ -160,7 +227,12 @@ class Script(QObject) :
         return tempproc.exitCode()
 
 
-    def run(body) :
+    def run(body, short=True) :
+        # Short probes go to the shared worker; long commands (copying, removing large volumes)
+        # get a shell of their own, waited for without blocking the event loop.
+        Script.runs += 1
+        if short and (outed := ShellWorker.run(body)) is not None:
+            return outed
         scr = Script()
         scr.setBody(body)
         scr.exec()
@@ -170,6 +242,316 @@ class Script(QObject) :
 
 
 
+class ShellWorker :
+    # Long-lived shell executing the short commands of Script.run, which spares a new shell process
+    # and a temporary file per command. A request is the working directory, the body and the marker
+    # line. The body is evaluated in a subshell with its stdout and stderr redirected into files read
+    # back here; the response is the marker followed by the exit code. Long stages keep their own
+    # Script processes. The response is awaited in an event loop; a command still running after the
+    # patience period retires the worker into a one-off process of that command, and the next
+    # request starts a fresh one. Requests made while the worker is busy get shells of their own.
+
+    driver = 'while IFS= read -r wdir ; do\n' \
+             '  body=""\n' \
+             '  while IFS= read -r line && [ "$line" != "$1" ] ; do\n' \
+             '    body="$body$line\n"\n' \
+             '  done\n' \
+             '  ( cd "$wdir" && eval "$body" ) > "$2" 2> "$3" < /dev/null\n' \
+             '  echo "$1 $?"\n' \
+             'done\n'
+    worker = None
+    disabled = False
+    patience = 2000 # ms before a command is left alone in a retired worker
+    spawned = 0 # workers started
+    served = 0 # commands executed by the workers
+
+
+    def __init__(self):
+        self.marker = f"imblproc_done_{os.urandom(8).hex()}"
+        self.outs = [QtCore.QTemporaryFile(), QtCore.QTemporaryFile()]
+        self.env = dict(os.environ)
+        self.served = 0
+        self.busy = False
+        self.proc = QProcess()
+        self.proc.setStandardErrorFile(QProcess.nullDevice())
+        if all(tmp.open() for tmp in self.outs):
+            self.proc.start(Script.shell, ["-c", self.driver, "imbl-worker", self.marker,
+                                           *(tmp.fileName() for tmp in self.outs)])
+            self.proc.waitForStarted(500)
+        ShellWorker.spawned += 1
+
+
+    def request(self, body):
+        # Returns (exit code, stdout, stderr) as Script.run does or None if the worker failed.
+        if self.proc.state() != QProcess.Running:
+            return None
+        self.proc.write(f"{os.getcwd()}\n{body.strip()}\n{self.marker}\n".encode())
+        self.busy = True
+        q = QEventLoop()
+        self.proc.readyReadStandardOutput.connect(q.quit)
+        self.proc.finished.connect(q.quit)
+        timer = QTimer()
+        timer.setSingleShot(True)
+        timer.timeout.connect(self.retire)
+        timer.start(self.patience)
+        response = b""
+        while not response.endswith(b"\n") and self.proc.state() == QProcess.Running:
+            if not self.proc.bytesAvailable():
+                q.exec()
+            response += self.proc.readAllStandardOutput().data()
+        timer.stop()
+        self.proc.readyReadStandardOutput.disconnect(q.quit)
+        self.proc.finished.disconnect(q.quit)
+        self.busy = False
+        marker, _, code = response.decode().strip().partition(" ")
+        if marker != self.marker or not code.isdigit():
+            return None
+        outed = [int(code)]
+        for tmp in self.outs:
+            with open(tmp.fileName(), 'rb') as outf:
+                outed.append(outf.read().decode(errors='replace'))
+        self.served += 1
+        ShellWorker.served += 1
+        return tuple(outed)
+
+
+    def retire(self):
+        if ShellWorker.worker is self:
+            ShellWorker.worker = None
+
+
+    def close(self):
+        if self.proc.state() != QProcess.NotRunning:
+            self.proc.closeWriteChannel()
+            if not self.proc.waitForFinished(1000):
+                self.proc.kill()
+                self.proc.waitForFinished(1000)
+
+
+    def run(body):
+        # Executes body in the shared worker, restarting it if the environment has changed since it
+        # was started. Returns None if the worker is unusable, so that the caller spawns a shell.
+        app = QtCore.QCoreApplication.instance()
+        if ShellWorker.disabled or app and QtCore.QThread.currentThread() != app.thread():
+            return None
+        worker = ShellWorker.worker
+        if worker and worker.busy:
+            return None
+        if worker and worker.env != dict(os.environ):
+            worker.close()
+            worker = None
+        if not worker:
+            worker = ShellWorker.worker = ShellWorker()
+        if (outed := worker.request(body)) is None:
+            worker.close()
+            worker.retire()
+            if not worker.served: # fresh worker failed: the shell cannot run it
+                ShellWorker.disabled = True
+                print(f"WARNING! Shell worker could not start in {Script.shell}."
+                      " Short commands will run in new shells.", file=sys.stderr)
+        elif ShellWorker.worker is not worker: # retired while the command was running
+            worker.close()
+        return outed
+
+
+    def avoided():
+        return ShellWorker.served - ShellWorker.spawned
+
+
+    def shutdown():
+        if ShellWorker.worker:
+            ShellWorker.worker.close()
+            ShellWorker.worker = None
+
+
+
+class Task(QObject) :
+    # Stage of the pipeline written as a generator coroutine. It yields what it waits for: a Script
+    # (started here, exit code is sent back), a Task or TaskGraph (its result is sent back), or a list
+    # of them waited concurrently (list of results is sent back). Waiting returns control to the Qt
+    # event loop instead of spinning a nested one. The value returned by the coroutine is the result
+    # of the task; as with the scripts, non-zero means failure.
+
+    finished = pyqtSignal(object)
+
+
+    def __init__(self, coroutine, parent=None):
+        super(Task, self).__init__(parent)
+        self.coroutine = coroutine
+        self.running = False
+        self.done = False
+        self.result = None
+        self.waiting = {}   # index: awaited item not finished yet
+        self.results = []
+        self.slots = []     # (signal, slot) connected while waiting
+
+
+    def isRunning(self):
+        return self.running
+
+
+    def start(self):
+        if not self.running and not self.done:
+            self.running = True
+            QTimer.singleShot(0, lambda : self.advance(None))
+        return self
+
+
+    def advance(self, value):
+        if not self.running:
+            return
+        try:
+            awaited = self.coroutine.send(value)
+        except StopIteration as stop:
+            return self.finish(stop.value)
+        except Exception:
+            traceback.print_exc()
+            return self.finish(-1)
+        single = not isinstance(awaited, (list, tuple))
+        items = [] if awaited is None else [awaited] if single else list(awaited)
+        self.results = [None] * len(items)
+        self.waiting = dict(enumerate(items))
+        if not items: # nothing to wait for
+            QTimer.singleShot(0, lambda : self.advance(None if single else []))
+        for idx, item in enumerate(items):
+            if isinstance(item, Script): # exit code as waitStop returns it, also in dry run
+                slot = lambda _, idx=idx, item=item : self.resolve(idx, item.proc.exitCode(), single)
+            else:
+                slot = lambda result, idx=idx : self.resolve(idx, result, single)
+            item.finished.connect(slot)
+            self.slots.append((item.finished, slot))
+            if isinstance(item, Script):
+                if not item.start():
+                    self.resolve(idx, -1, single)
+                elif not item.isRunning(): # empty body or dry run
+                    self.resolve(idx, 0, single)
+            elif item.done:
+                self.resolve(idx, item.result, single)
+            else:
+                item.start()
+
+
+    def resolve(self, idx, result, single):
+        if idx not in self.waiting or not self.running:
+            return
+        del self.waiting[idx]
+        self.results[idx] = result
+        if self.waiting:
+            return
+        self.disconnectSlots()
+        value = self.results[0] if single else self.results
+        QTimer.singleShot(0, lambda : self.advance(value)) # not from within the emitting signal
+
+
+    def disconnectSlots(self):
+        for signal, slot in self.slots:
+            try:
+                signal.disconnect(slot)
+            except TypeError:
+                pass
+        self.slots = []
+
+
+    def cancel(self):
+        # Stops whatever the task waits for and closes the coroutine, which runs its finally clauses.
+        if not self.running:
+            return
+        self.running = False
+        self.disconnectSlots()
+        for item in self.waiting.values():
+            if isinstance(item, Script):
+                item.stop()
+                item.proc.waitForFinished(3000)
+            else:
+                item.cancel()
+        self.waiting = {}
+        try:
+            self.coroutine.close()
+        except ValueError: # cancelled from within the coroutine itself
+            pass
+        self.finish(-1)
+
+
+    def finish(self, result):
+        self.running = False
+        self.done = True
+        self.result = result
+        self.finished.emit(result)
+
+
+
+class TaskGraph(QObject) :
+    # Tasks with explicit dependencies. Each task starts as soon as all tasks it depends on have
+    # succeeded, so independent ones run concurrently, at most maxRunning at once if given.
+    # Failure of any task cancels the rest of the graph, as a failed stage did in the serial
+    # pipeline. Can be waited by a Task as one item.
+
+    finished = pyqtSignal(object)
+
+
+    def __init__(self, maxRunning=0, parent=None):
+        super(TaskGraph, self).__init__(parent)
+        self.maxRunning = maxRunning
+        self.nodes = {}   # name: (factory returning the coroutine, dependencies)
+        self.tasks = {}
+        self.running = False
+        self.done = False
+        self.result = None
+
+
+    def add(self, name, factory, depends=()):
+        self.nodes[name] = (factory, list(depends))
+        return name
+
+
+    def isRunning(self):
+        return self.running
+
+
+    def start(self):
+        if not self.running and not self.done:
+            self.running = True
+            QTimer.singleShot(0, self.schedule)
+        return self
+
+
+    def schedule(self):
+        if not self.running:
+            return
+        failed = [ task.result for task in self.tasks.values() if task.done and task.result ]
+        if failed:
+            return self.cancel(failed[0])
+        if all( name in self.tasks and self.tasks[name].done for name in self.nodes ):
+            return self.finish(0)
+        busy = sum( task.running for task in self.tasks.values() )
+        for name, (factory, depends) in self.nodes.items():
+            if self.maxRunning and busy >= self.maxRunning:
+                break
+            if name in self.tasks or not all( dep in self.tasks and self.tasks[dep].done for dep in depends ):
+                continue
+            task = Task(factory(), self)
+            task.finished.connect(lambda _ : QTimer.singleShot(0, self.schedule))
+            self.tasks[name] = task.start()
+            busy += 1
+
+
+    def cancel(self, result=-1):
+        if not self.running:
+            return
+        self.running = False
+        for task in self.tasks.values():
+            task.cancel()
+        self.finish(result)
+
+
+    def finish(self, result):
+        self.running = False
+        self.done = True
+        self.result = result
+        self.finished.emit(result)
+
+
+
 class UScript(QtWidgets.QWidget) :
 
     editingFinished = pyqtSignal()
@@ -177,15 +559,19 @@ class UScript(QtWidgets.QWidget) :
 
     def __init__(self, parent=None):
         super(QtWidgets.QWidget, self).__init__(parent)
-        self.ui = loadUi(path.join(uiPath, "script.ui"), self)
+        self.ui = loadCompiledUi(path.join(uiPath, "script.ui"), self)
         self.script = Script(self)
+        self.evalTimer = QTimer(self) # defers syntax check until the body settles
+        self.evalTimer.setSingleShot(True)
+        self.evalTimer.setInterval(0)
+        self.evalTimer.timeout.connect(self.updateBody)
         self.ui.body.textChanged.connect(self.script.setBody)
         self.ui.browse.clicked.connect(lambda : onBrowse(self.ui.body, "Command", True))
         self.ui.execute.clicked.connect(self.onStartStop)
         self.ui.body.editingFinished.connect(self.editingFinished.emit)
         self.script.started.connect(self.updateState)
         self.script.finished.connect(self.updateState)
-        self.script.bodySet.connect(self.updateBody)
+        self.script.bodySet.connect(self.evalTimer.start)
         self.updateBody()
 
 
@@ -265,6 +651,8 @@ class ColumnResizer(QObject):
 def hdf5shape(filename, dataset):
     # with locking used, following commands may work very slow if the file was not closed properly
     #Script.run(f"HDF5_USE_FILE_LOCKING=FALSE h5clear -s --increment {filename}")
+    if not path.exists(filename):
+        return None, None, None
     outed = Script.run(f"export HDF5_USE_FILE_LOCKING=FALSE ; "
                        f"h5clear -s --increment {filename} 2>&1 /dev/null ; "
                        f"h5ls {filename}/{dataset}")[1]
@@ -277,6 +665,307 @@ def humanSize(mysize):
     return Script.run(f"numfmt --to=iec <<< {mysize}")[1].rstrip() + "B"
 
 
+def scratchTiers():
+    # Directories of the scratch tiers for interim volumes as listed for imbl-scratch.sh.
+    tiers = os.environ.get("IMBLSCRATCH") or f"/dev/shm:{os.environ.get('TMPDIR') or '/tmp'}"
+    return [ tier for tier in tiers.split(':') if tier ] or ["/dev/shm"]
+
+
+def sharedTiers():
+    # Scratch tiers on network or parallel file systems, seen alike from all nodes of a cluster.
+    sharedFs = ("nfs", "lustre", "gpfs", "beegfs", "cifs", "smb2", "ceph", "panfs", "afs")
+    return [ tier for tier in scratchTiers()
+             if Script.run(f"stat -f -c %T '{tier}'")[1].strip() in sharedFs ]
+
+
+def lazyModule(name):
+    # Modules shared with the scripts (stitchgeom, tileimg). Imported only when needed: tileimg pulls numpy.
+    if name not in lazyModules:
+        spec = importlib.util.spec_from_file_location(name, path.join(myPath, name + ".py"))
+        lazyModules[name] = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(lazyModules[name])
+    return lazyModules[name]
+
+
+def configValue(wdg):
+    if isinstance(wdg, QtWidgets.QLineEdit):
+        return wdg.text()
+    elif isinstance(wdg, QtWidgets.QCheckBox):
+        return wdg.isChecked()
+    elif isinstance(wdg, QtWidgets.QAbstractSpinBox):
+        return wdg.value()
+    elif isinstance(wdg, QtWidgets.QComboBox):
+        return wdg.currentText()
+    elif isinstance(wdg, UScript):
+        return wdg.ui.body.text()
+    elif isinstance(wdg, QtWidgets.QButtonGroup):
+        return wdg.checkedButton().objectName() if wdg.checkedButton() else ""
+
+
+def configType(wdg):
+    if isinstance(wdg, QtWidgets.QCheckBox):
+        return bool
+    elif isinstance(wdg, QtWidgets.QSpinBox):
+        return int
+    elif isinstance(wdg, QtWidgets.QDoubleSpinBox):
+        return float
+    return str
+
+
+# Dependency graph of the pipeline artefacts. Each node is tagged with the hash of the parameters
+# it depends on and of its upstream nodes. Products are relative to the output path for global
+# nodes or to the sub-sample directory otherwise; alternatives are separated by '|' and optional
+# products, whose absence is recorded as such, end with '?'. Downstream nodes depend on the
+# identities of the products of a tracked node, not only on its hash.
+pipelineGraph = {
+    "init" :   { "title" : "initiation",
+                 "upstream" : [],
+                 "params" : ["inPath", "notFnS", "yIndependent", "zIndependent", "ignoreLog",
+                             "inInclude", "inExclude"],
+                 "inputs" : [],
+                 "products" : [initFileName, ".projections"],
+                 "tracked" : False,
+                 "global" : True },
+    "fields" : { "title" : "background and dark fields",
+                 "upstream" : ["init"],
+                 "params" : [],
+                 "inputs" : [],
+                 "products" : ["bg.tif?", "df.tif?", "dg.tif?"], # made by initiation if acquired
+                 "tracked" : True,
+                 "global" : True },
+    "stitch" : { "title" : "stitching",
+                 "upstream" : ["init", "fields"],
+                 "params" : ["iStX", "iStY", "oStX", "oStY", "fStX", "fStY", "maskPath", "fillGaps",
+                             "xBin", "yBin", "rotate", "peakRad", "peakThr", "maskEdge",
+                             "sCropTop", "sCropBottom", "sCropLeft", "sCropRight",
+                             "fCropTop", "fCropBottom", "fCropLeft", "fCropRight",
+                             "allProj", "minProj", "maxProj", "projBin"],
+                 "inputs" : ["maskPath"],
+                 "products" : [".idxsall", "clean.hdf"],
+                 "tracked" : False,
+                 "global" : False },
+    "filter" : { "title" : "phase and ring filters",
+                 "upstream" : ["stitch"],
+                 "params" : ["ring", "ringOrder", "distance", "d2b", "pixelSize", "energy", "zeroPadding"],
+                 "inputs" : [],
+                 "products" : [], # phase and ring filtered volumes are interim
+                 "tracked" : False,
+                 "global" : False },
+    "rec" :    { "title" : "reconstruction",
+                 "upstream" : ["filter"],
+                 "params" : ["autocor", "cor", "ctFilter", "ctFilterOpt", "outMu", "resDataFormat",
+                             "toIntMin", "toIntMax", "resTIFF", "resCompression", "resDigits"],
+                 "inputs" : [],
+                 "products" : ["rec.hdf|rec"],
+                 "tracked" : False,
+                 "global" : False },
+}
+
+
+
+
+def fileIdentity(fileName):
+    # changes whenever the file is replaced or modified; None if it does not exist
+    try:
+        stat = os.stat(fileName)
+        return path.realpath(fileName), stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return None
+
+
+class Tracked:
+    # Piece of UI state derived from some inputs. It is recomputed only if the key made of its
+    # inputs has changed since the last computation. The key is taken after computing because
+    # probes may touch the files they inspect.
+
+    def __init__(self, inputs, compute):
+        self.inputs = inputs
+        self.compute = compute
+        self.key = None
+        self.computations = 0
+
+    def update(self):
+        if self.inputs() == self.key:
+            return False
+        self.compute()
+        self.computations += 1
+        self.key = self.inputs()
+        return True
+
+    def invalidate(self):
+        self.key = None
+
+
+
+class StageCache:
+    # Content-addressed store of intermediate products with least-recently-used eviction.
+
+    def __init__(self, cdir, budget):
+        self.cdir = cdir
+        self.budget = budget
+        os.makedirs(cdir, exist_ok=True)
+
+    def key(self, *parts):
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def path(self, key, ext=".tif"):
+        return path.join(self.cdir, key + ext)
+
+    def has(self, filename):
+        if not path.exists(filename):
+            return False
+        os.utime(filename) # marks recent use
+        return True
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.cdir):
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(entry[1] for entry in entries)
+        for _, size, filename in sorted(entries):
+            if total <= self.budget:
+                break
+            os.remove(filename)
+            total -= size
+
+
+
+class Governor:
+    # Confines process tree of each script to its own cgroup (systemd scope) with limited CPU set,
+    # memory and I/O weight. Falls back to affinity and I/O priority without user systemd.
+    # Pages of tmpfs files (interim volumes in /dev/shm) are charged to the cgroup of the writer, so
+    # they count against the budget, which itself never exceeds the physical memory.
+
+    hasScopes = None
+
+    def __init__(self):
+        self.cpus = ""
+        self.memory = 0 # bytes
+        self.ioWeight = 0
+
+    def isActive(self):
+        return bool(self.cpus or self.memory or self.ioWeight)
+
+    def probe():
+        # Run once, when the governor is configured, rather than on the launch of a script.
+        if Governor.hasScopes is None:
+            Governor.hasScopes = not Script.run("systemd-run --user --scope --quiet true")[0]
+
+    def useScopes(self):
+        return bool(Governor.hasScopes)
+
+    def physicalMemory():
+        try:
+            return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        except (ValueError, OSError):
+            return 0
+
+    def prefix(self, role):
+        if not self.isActive():
+            return []
+        if self.useScopes():
+            unit = re.sub(r'[^a-zA-Z0-9_-]', '_', f"imbl-{role}-{os.getpid()}-{time.time_ns()}")
+            toRet = ["systemd-run", "--user", "--scope", "--quiet", f"--unit={unit}"]
+            if self.cpus:
+                toRet += ["-p", f"AllowedCPUs={self.cpus}"]
+            if self.memory:
+                memory = min(self.memory, Governor.physicalMemory() or self.memory)
+                toRet += ["-p", f"MemoryMax={memory}", "-p", "MemorySwapMax=0"]
+            if self.ioWeight:
+                toRet += ["-p", f"IOWeight={self.ioWeight}"]
+            return toRet
+        toRet = []
+        if self.cpus:
+            toRet += ["taskset", "-c", self.cpus]
+        # no memory limit without scopes: limits of the address space break tools reserving large
+        # virtual mappings; the usage is only monitored
+        if self.ioWeight: # default weight 100 corresponds to the default priority 4
+            level = min(7, max(0, round(4 - math.log2(self.ioWeight / 100))))
+            toRet += ["ionice", "-c2", "-n", str(level)]
+        return toRet
+
+    def cgroup(pid):
+        try:
+            with open(f"/proc/{pid}/cgroup") as cgf:
+                for line in cgf:
+                    if line.startswith("0::"):
+                        return path.join("/sys/fs/cgroup", line[3:].strip().lstrip("/"))
+        except OSError:
+            pass
+        return None
+
+    def oomKills(cgdir):
+        try:
+            with open(path.join(cgdir, "memory.events")) as evf:
+                for line in evf:
+                    if line.startswith("oom_kill "):
+                        return int(line.split()[1])
+        except (OSError, TypeError):
+            pass
+        return 0
+
+    def usage(pid, cache):
+        # returns CPU load in percents of one core and resident memory of the process tree
+        cpu = rss = 0
+        try:
+            root = psutil.Process(pid)
+            tree = [root, *root.children(recursive=True)]
+        except psutil.Error:
+            return cpu, rss
+        for proc in tree:
+            proc = cache.setdefault(proc.pid, proc) # keeps the process to measure CPU between calls
+            try:
+                cpu += proc.cpu_percent()
+                rss += proc.memory_info().rss
+            except psutil.Error:
+                pass
+        return cpu, rss
+
+
+
+class ToolTipFormatter(QObject):
+    # Reformats tool tips on their first show, limiting horizontal box size and adding parameter name.
+    # Done lazily because it is expensive for all widgets and because raw tool tips are used as help
+    # text of the command line.
+
+    minWidth = 400
+    formattedProp = "toolTipFormatted"
+
+    def __init__(self, parent, cfgProp):
+        super(ToolTipFormatter, self).__init__(parent)
+        self.cfgProp = cfgProp
+        self.fm = None
+
+    def format(self, swdg):
+        tip = swdg.toolTip().strip()
+        if not tip or tip[:6] == '<html>' :
+            return
+        if self.fm is None:
+            self.fm = QtGui.QFontMetrics(QtGui.QFont())
+        fm = self.fm
+        addParam = "Parameter name: " + swdg.objectName() if swdg.property(self.cfgProp) is not None else ""
+        minWidth = max(self.minWidth, fm.width(addParam))
+        if len(addParam):
+            addParam = "<br><p>" + addParam + "</p>"
+        tip_width = fm.width(tip)
+        escape(tip)
+        if tip_width <= minWidth :
+            tip += "</p>"
+        else:
+            line_break_index = len(tip) * minWidth // tip_width
+            tip = tip[:line_break_index] + "</p>" + tip[line_break_index:]
+        swdg.setToolTip("<style>p { margin: 0 0 0 0 }</style><p style='white-space:pre'>" +
+                            tip + addParam )
+
+    def eventFilter(self, obj, event):
+        if event.type() == QtCore.QEvent.ToolTip and isinstance(obj, QtWidgets.QWidget) \
+           and not obj.property(self.formattedProp):
+            obj.setProperty(self.formattedProp, True)
+            self.format(obj)
+        return False
+
 
 
 class ScrollToEnd(QObject):
@@ -295,6 +984,104 @@ class ScrollToEnd(QObject):
 
 
 
+class StitchPreview(QtWidgets.QWidget):
+    # Stitched projection composed in memory from the tiles exported by imbl-stitch.sh -e.
+    # Tiles are read once and cached; crop, binning and rotation are applied to the cached
+    # frames, so that changes of the stitching parameters are shown without running ctas.
+
+    maxSide = 1200 # longest side of the composed image; larger canvas is reduced
+
+    def __init__(self, parent=None):
+        super(StitchPreview, self).__init__(parent, QtCore.Qt.Window)
+        self.ui = loadCompiledUi(path.join(uiPath, "preview.ui"), self)
+        self.tiles = {} # projection -> [tile files]
+        self.frames = {} # tile file -> (identity, image)
+        self.prepared = {} # (tile file, crop, binn, rotate, scale) -> image
+        self.geometry = None
+        self.rotate = 0.0
+        self.pixmap = None
+        self.renderTimer = QTimer(self)
+        self.renderTimer.setSingleShot(True)
+        self.renderTimer.setInterval(100)
+        self.renderTimer.timeout.connect(self.render)
+        self.ui.projection.currentIndexChanged.connect(self.renderTimer.start)
+
+
+    def load(self, prefix):
+        tileimg = lazyModule("tileimg")
+        self.tiles = tileimg.findTiles(prefix)
+        toRead = [ tile for tiles in self.tiles.values() for tile in tiles
+                   if self.frames.get(tile, (None,))[0] != fileIdentity(tile) ]
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            for tile, image in zip(toRead, executor.map(tileimg.readTiff, toRead)):
+                self.frames[tile] = (fileIdentity(tile), image)
+                self.prepared = { key: val for key, val in self.prepared.items() if key[0] != tile }
+        current = self.ui.projection.currentText()
+        self.ui.projection.blockSignals(True)
+        self.ui.projection.clear()
+        self.ui.projection.addItems([ str(proj) for proj in self.tiles ])
+        self.ui.projection.setCurrentIndex(max(0, self.ui.projection.findText(current)))
+        self.ui.projection.blockSignals(False)
+        self.renderTimer.start()
+
+
+    def setParameters(self, geometry, rotate):
+        # geometry - arguments of stitchgeom.stitchGeometry as returned by MainWindow.stitchGeometryArgs
+        self.geometry = geometry
+        self.rotate = rotate
+        self.renderTimer.start()
+
+
+    @pyqtSlot()
+    def render(self):
+        if not self.geometry or not self.ui.projection.currentText():
+            return
+        import numpy # loaded with tileimg anyway; not needed before the first preview
+        start = time.time()
+        tileimg = lazyModule("tileimg")
+        files = self.tiles[int(self.ui.projection.currentText())]
+        args = dict(self.geometry)
+        expected = args["tiles"] * (2 if args["flipOrigin"] is not None else 1)
+        if len(files) != expected:
+            self.ui.info.setText(f"Found {len(files)} tiles while stitching needs {expected}: export them again.")
+            self.ui.info.setStyleSheet(warnStyle)
+            return
+        try:
+            geom = lazyModule("stitchgeom").stitchGeometry(**args)
+        except Exception as err:
+            self.ui.info.setText(f"Bad geometry: {err}")
+            self.ui.info.setStyleSheet(warnStyle)
+            return
+        scale = max(1, math.ceil(max(geom["canvas"]) / self.maxSide))
+        keys = [ (tile, tuple(args["crop"]), tuple(args["binn"]), self.rotate, scale) for tile in files ]
+        self.prepared = { key: self.prepared[key] if key in self.prepared else
+                               tileimg.prepareTile(self.frames[key[0]][1], *key[1:])
+                          for key in keys }
+        canvas = tileimg.composite([ self.prepared[key] for key in keys ], geom, scale)
+        low, high = numpy.percentile(canvas, (1, 99))
+        canvas = numpy.clip((canvas - low) * (255 / max(high - low, 1e-12)), 0, 255).astype(numpy.uint8)
+        hight, width = canvas.shape
+        image = QtGui.QImage(canvas.tobytes(), width, hight, width, QtGui.QImage.Format_Grayscale8)
+        self.pixmap = QtGui.QPixmap.fromImage(image)
+        self.showPixmap()
+        self.ui.info.setText(f"{geom['canvas'][0]} x {geom['canvas'][1]}"
+                             + (f", reduced {scale} times" if scale > 1 else "")
+                             + f", {round(1000 * (time.time() - start))} ms")
+        self.ui.info.setStyleSheet("")
+
+
+    def showPixmap(self):
+        if self.pixmap:
+            self.ui.image.setPixmap(self.pixmap.scaled(self.ui.image.size(), QtCore.Qt.KeepAspectRatio,
+                                                       QtCore.Qt.SmoothTransformation))
+
+
+    def resizeEvent(self, event):
+        super(StitchPreview, self).resizeEvent(event)
+        self.showPixmap()
+
+
+
 class MainWindow(QtWidgets.QMainWindow):
 
     configName = ".imbl-ui"
@@ -307,7 +1094,8 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def __init__(self):
         super(MainWindow, self).__init__()
-        self.ui = loadUi(path.join(uiPath, "imbl-ui.ui"), self)
+        self.ui = loadCompiledUi(path.join(uiPath, "imbl-ui.ui"), self)
+        startupTimes.append(("interface", time.time()))
 
         # place Script UI's
         self.scrProc = Script(self)
@@ -328,8 +1116,33 @@ class MainWindow(QtWidgets.QMainWindow):
             script.started.connect(self.onScriptStarted)
             script.finished.connect(self.onScriptFinished)
             script.proc.stateChanged.connect(self.update_termini_state)
-        self.collectOut = None
-        self.collectErr = None
+
+        # background copy of the raw input into local scratch; does not occupy the progress bar
+        self.stageProc = Script(self)
+        self.stageProc.setRole("staging")
+        self.stageProc.finished.connect(self.onStagingFinished)
+
+        # derived state recomputed once per batch of edits and only if its own inputs changed
+        fid = lambda *parts : fileIdentity(path.join(*parts))
+        self.samplesState = Tracked(lambda : ( self.ui.individualIO.isChecked(), self.ui.expPath.text(),
+                                               fid(self.ui.expPath.text(), 'input') ),
+                                    self.refreshSamples)
+        self.scanState = Tracked(lambda : ( self.ui.inPath.text(), self.ui.inInclude.text(),
+                                            self.ui.inExclude.text(), self.ui.ignoreLog.isChecked(),
+                                            fid(self.ui.inPath.text()) ),
+                                 self.refreshScan)
+        self.initState = Tracked(lambda : ( self.ui.individualIO.isChecked(), self.ui.outPath.text(),
+                                            fid(self.ui.outPath.text(), initFileName) ),
+                                 self.refreshInit)
+        self.volumesState = Tracked(lambda : ( path.realpath(self.onStorNamePrefix()),
+                                               fid(self.scratchName("clean.hdf")),
+                                               fid(self.onStorNamePrefix() + "clean.hdf"),
+                                               fid(self.scratchName("rec.hdf")) ),
+                                    self.refreshVolumes)
+        self.stateTimer = QTimer(self)
+        self.stateTimer.setSingleShot(True)
+        self.stateTimer.setInterval(300)
+        self.stateTimer.timeout.connect(self.refreshState)
 
         # prepare UI elements
         self.on_individualIO_toggled()
@@ -351,12 +1164,29 @@ class MainWindow(QtWidgets.QMainWindow):
         loadBtn.setFlat(True)
         loadBtn.clicked.connect(lambda : self.loadConfiguration(""))
         self.ui.statusBar().addPermanentWidget(loadBtn)
+        self.govUsage = QtWidgets.QLabel(self.ui)
+        self.govUsage.setToolTip("CPU load and resident memory of the running scripts.")
+        self.ui.statusBar().addWidget(self.govUsage)
+
+        # resource governor of the scripts and monitor of their usage
+        self.governor = Governor()
+        for script in self.ui.findChildren(Script):
+            script.governor = self.governor
+        self.govTimer = QTimer(self)
+        self.govTimer.setInterval(2000)
+        self.govTimer.timeout.connect(self.monitorUsage)
+        self.govStats = {}
+        self.ui.govCpus.editingFinished.connect(self.update_governor)
+        self.ui.govMem.valueChanged.connect(self.update_governor)
+        self.ui.govIO.valueChanged.connect(self.update_governor)
 
         # prepare list of disabled elements
         self.doYst = False
         self.doZst = False
         self.doFnS = False
-        exceptFromDisabled = [ self.ui.tabWidget.tabBar(), *self.ui.tabConsole.findChildren(QtWidgets.QWidget)]
+        self.flipShift = 0
+        exceptFromDisabled = [ self.ui.tabWidget.tabBar(), self.govUsage,
+                               *self.ui.tabConsole.findChildren(QtWidgets.QWidget)]
         exceptMe = self.ui.tabConsole
         while isinstance(exceptMe, QtWidgets.QWidget):
             exceptFromDisabled.append(exceptMe)
@@ -372,6 +1202,30 @@ class MainWindow(QtWidgets.QMainWindow):
         self.ui.sameBin.toggled.connect(self.onBinChange)
         self.ui.binAdjust.toggled.connect(self.onBinChange)
 
+        # size of the stitched volume follows the stitching geometry
+        for wdg in (self.ui.iStX, self.ui.iStY, self.ui.oStX, self.ui.oStY, self.ui.fStX, self.ui.fStY,
+                    self.ui.sCropTop, self.ui.sCropBottom, self.ui.sCropLeft, self.ui.sCropRight,
+                    self.ui.fCropTop, self.ui.fCropBottom, self.ui.fCropLeft, self.ui.fCropRight,
+                    self.ui.xBin, self.ui.yBin, self.ui.minProj, self.ui.maxProj, self.ui.projBin,
+                    self.ui.iwidth, self.ui.ihight):
+            wdg.valueChanged.connect(self.update_stitched_size)
+        self.ui.allProj.toggled.connect(self.update_stitched_size)
+
+        # preview of the stitching follows its geometry
+        self.preview = None
+        self.stitchGraph = None
+        self.sampleTiles = {} # working directory -> parameters of the exported tiles
+        for wdg in (self.ui.iStX, self.ui.iStY, self.ui.oStX, self.ui.oStY, self.ui.fStX, self.ui.fStY,
+                    self.ui.sCropTop, self.ui.sCropBottom, self.ui.sCropLeft, self.ui.sCropRight,
+                    self.ui.fCropTop, self.ui.fCropBottom, self.ui.fCropLeft, self.ui.fCropRight,
+                    self.ui.xBin, self.ui.yBin, self.ui.rotate):
+            wdg.valueChanged.connect(self.update_preview)
+
+        # region of interest estimates follow the shape of the projections
+        self.projSize = None
+        self.ui.roiSlices.textChanged.connect(self.update_roi_estimate)
+        self.ui.roiBox.textChanged.connect(self.update_roi_estimate)
+
         # connect signals which are not connected by name
         self.ui.notFnS.clicked.connect(self.needReinitiation)
         self.ui.ignoreLog.clicked.connect(self.needReinitiation)
@@ -379,15 +1233,20 @@ class MainWindow(QtWidgets.QMainWindow):
         self.ui.zIndependent.clicked.connect(self.needReinitiation)
         self.ui.inInclude.editingFinished.connect(self.needReinitiation)
         self.ui.inExclude.editingFinished.connect(self.needReinitiation)
-        self.ui.inInclude.editingFinished.connect(self.on_inPath_textChanged)
-        self.ui.inExclude.editingFinished.connect(self.on_inPath_textChanged)
-        self.ui.expUpdate.clicked.connect(self.on_expPath_textChanged)
-        self.ui.ignoreLog.toggled.connect(self.on_inPath_textChanged)
+        self.ui.inInclude.editingFinished.connect(self.scheduleState)
+        self.ui.inExclude.editingFinished.connect(self.scheduleState)
+        self.ui.expUpdate.clicked.connect(lambda : self.samplesState.invalidate() or self.refreshState())
+        self.ui.ignoreLog.toggled.connect(self.scheduleState)
         self.ui.minProj.valueChanged.connect(self.onMinMaxProjectionChanged)
         self.ui.maxProj.valueChanged.connect(self.onMinMaxProjectionChanged)
         self.ui.testSubDir.currentTextChanged.connect(self.update_reconstruction_state)
+        self.ui.tabWidget.currentChanged.connect(lambda :
+            self.ui.tabWidget.currentWidget() is self.ui.tabExec and self.update_stale_state() )
         self.ui.resDataFormat.currentTextChanged.connect( lambda :
             self.ui.mmWdg.setEnabled(self.ui.resDataFormat.currentIndex()) )
+        self.ui.resCompression.currentIndexChanged.connect( lambda :
+            self.ui.resDigits.setEnabled(self.ui.resCompression.currentIndex() == 2) )
+        self.ui.chunkProj.valueChanged.connect(lambda : self.ui.chunkRows.setEnabled(bool(self.ui.chunkProj.value())))
         self.ui.prFile.clicked.connect(lambda :
             QApplication.clipboard().setText(path.realpath(self.ui.prFile.text())))
 
@@ -411,6 +1270,14 @@ class MainWindow(QtWidgets.QMainWindow):
                 swdg.editingFinished.connect(self.saveConfiguration)
             elif isinstance(swdg, QtWidgets.QButtonGroup):
                 swdg.buttonClicked.connect(self.saveConfiguration)
+            # autosave is debounced: a burst of changes results in a single write
+        self.configSnapshots = {} # file name -> (identity, {parameter: value})
+        self.configDirty = False
+        self.autosaveTimer = QTimer(self)
+        self.autosaveTimer.setSingleShot(True)
+        self.autosaveTimer.setInterval(1000)
+        self.autosaveTimer.timeout.connect(self.flushConfiguration)
+        QApplication.instance().aboutToQuit.connect(self.flushConfiguration)
 
         # parse commandline arguments
         parser = argparse.ArgumentParser(description='IMBL processing pipeline.',
@@ -428,6 +1295,15 @@ class MainWindow(QtWidgets.QMainWindow):
         parser.add_argument("--proj-test", action='store_true', help="Launches test of stitching procedure.")
         parser.add_argument("-R", "--rec", action='store_true', help="Launches CT and related processing.")
         parser.add_argument("--rec-test", action='store_true', help="Launches test of CT reconstruction.")
+        parser.add_argument("--rec-quick", action='store_true', help=
+                            "Launches quick-look reconstruction of binned projections.")
+        parser.add_argument("--stale", action='store_true', help="Launches processing of the stale stages only.")
+        parser.add_argument("--startup-benchmark", action='store_true', help=
+                            "Prints time taken by the stages of the startup and exits.")
+        parser.add_argument("--probe-check", action='store_true', help=
+                            "Loads configuration and changes a parameter none of the derived states depends on.\n"
+                            "Checks that loading recomputes each state at most once and the change recomputes\n"
+                            "none. Prints the counts and exits with non-zero status on failure.")
         pgrp = parser.add_mutually_exclusive_group()
         pgrp.add_argument("-H", "--headless", action='store_true', help="Starts pipeline withoput UI." \
                                          " Only makes sense with one of the above processing launchers.")
@@ -465,32 +1341,23 @@ class MainWindow(QtWidgets.QMainWindow):
             parser.add_argument(f"--{name}" , type=str, metavar="STR", choices=listOfItems, help=help)
         args = parser.parse_args()
 
-        # reformat tool tips limiting horizontal box size and adding parameter name.
-        # must happen after CMD parsing because toolTips are used as help text there.
-        minToolTipWidth = 400
-        fm = QtGui.QFontMetrics(QtGui.QFont())
-        for swdg in self.ui.findChildren(QtWidgets.QWidget):
-            tip = swdg.toolTip().strip()
-            if not tip or tip[:6] == '<html>' :
-                continue
-            addParam = "Parameter name: " + swdg.objectName() if swdg.property(self.cfgProp) is not None else ""
-            minWidth = max(minToolTipWidth, fm.width(addParam))
-            if len(addParam):
-                addParam = "<br><p>" + addParam + "</p>"
-            tip_width = fm.width(tip)
-            escape(tip)
-            if tip_width <= minWidth :
-                tip += "</p>"
-            else:
-                line_break_index = len(tip) * minWidth // tip_width
-                tip = tip[:line_break_index] + "</p>" + tip[line_break_index:]
-            swdg.setToolTip("<style>p { margin: 0 0 0 0 }</style><p style='white-space:pre'>" +
-                                tip + addParam )
+        startupTimes.append(("command line", time.time()))
+        self.tipFormatter = ToolTipFormatter(self, self.cfgProp)
+        QApplication.instance().installEventFilter(self.tipFormatter)
 
         # This will run only after QApplication was executed
         def afterStart() :
             self.ui.setEnabled(False)
+            if not args.headless: # show early to load configuration and probe data behind disabled UI
+                self.show()
+                QApplication.processEvents()
+                startupTimes.append(("shown", time.time()))
+            if args.probe_check:
+                failed = self.checkProbes(args.config, vars(args))
+                QtCore.QTimer.singleShot(0, lambda : QApplication.exit(int(failed)))
+                return
             self.loadConfiguration(args.config, vars(args))
+            startupTimes.append(("configuration", time.time()))
             if args.expSample:
                 listOfsamples = [ self.ui.expSample.itemText(i) for i in range(self.ui.expSample.count()) ]
                 if not args.expSample in listOfsamples :
@@ -500,34 +1367,45 @@ class MainWindow(QtWidgets.QMainWindow):
                 didx = self.ui.expSample.findText(args.expSample)
                 if didx >= 0:
                     self.ui.expSample.setCurrentIndex(didx)
-                    self.on_outPath_textChanged()
-            if not args.headless:
-                self.show()
+                    self.refreshState()
             self.ui.setEnabled(True)
-            acted = False
-            if args.init:
-                acted = True
-                self.on_initiate_clicked()
-            if args.proj_test:
-                acted = True
-                self.on_testProj_clicked()
-            if args.proj_one:
-                acted = True
-                self.on_procThis_clicked()
-            if args.proj:
-                acted = True
-                self.on_procAll_clicked()
-            if args.rec_test:
-                acted = True
-                self.on_testSlice_clicked()
-            if args.proj:
-                acted = True
-                self.on_reconstruct_clicked()
+            if args.startup_benchmark:
+                QApplication.processEvents()
+                startupTimes.append(("ready", time.time()))
+                for (_, prev), (stage, stamp) in zip(startupTimes, startupTimes[1:]):
+                    print(f"{stage:<16} {stamp - prev:8.3f}s")
+                print(f"{'total':<16} {startupTimes[-1][1] - startupTimes[0][1]:8.3f}s")
+                print(f"{'probes':<16} {Script.runs:8d}")
+                print(f"{'spawns avoided':<16} {ShellWorker.avoided():8d}")
+                QtCore.QTimer.singleShot(0, self.close)
+                return
+            acted = any(( args.init, args.proj_test, args.proj_one, args.proj, args.rec, args.rec_test,
+                          args.rec_quick, args.stale ))
             if args.headless and not acted:
                 QtCore.QTimer.singleShot(0, self.close)
                 raise SyntaxError("No action launch requested in the headless mode.")
-            if acted and not args.keep_ui:
-                QtCore.QTimer.singleShot(0, self.close)
+            def actions(): # waits for the stages which do not block
+                if args.init:
+                    self.on_initiate_clicked()
+                    yield self.stitchGraph # launched if procAfterInit
+                if args.proj_test:
+                    self.on_testProj_clicked()
+                if args.proj_one:
+                    yield self.onStitch(False)
+                if args.proj:
+                    yield self.onStitch(True)
+                if args.rec_test:
+                    self.on_testSlice_clicked()
+                if args.rec_quick:
+                    self.on_quickLook_clicked()
+                if args.rec:
+                    self.on_reconstruct_clicked()
+                if args.stale:
+                    self.on_procStale_clicked()
+                if not args.keep_ui:
+                    QtCore.QTimer.singleShot(0, self.close)
+            if acted:
+                self.cliTask = Task(actions(), self).start()
         QtCore.QTimer.singleShot(0, afterStart)
 
 
@@ -542,19 +1420,97 @@ class MainWindow(QtWidgets.QMainWindow):
         return -1
 
 
-    def execScrProc(self, role, command, wdir=None):
+    def execScrProc(self, role, command, wdir=None, batch=False):
         if wdir is not None and wdir:
             self.scrProc.proc.setWorkingDirectory(wdir)
         self.scrProc.setRole(role)
+        if batch and (command := self.batchCommand(role, command)) is None:
+            return 1
         self.scrProc.setBody(command)
         return self.scrProc.exec()
 
 
+    def scriptStep(self, script, role, command, batch=False):
+        # Step of a task: runs command in the script of the task as execScrProc does in scrProc.
+        # Used as "yield from", returns the exit code.
+        if batch and (command := self.batchCommand(role, command)) is None:
+            return 1
+        script.setRole(role)
+        script.setBody(command)
+        return (yield script)
+
+
+    def roleStep(self, role):
+        # Step of a task running the user script of the role, as execScrRole does.
+        for script in self.ui.findChildren(Script):
+            if script.role() == role:
+                yield script
+                return
+
+
+    def execSteps(self, steps):
+        # Runs steps of a task blocking, as the stages started from the buttons do.
+        # Returns the value returned by the steps.
+        result = None
+        try:
+            while True:
+                script = steps.send(result)
+                result = -1 if not script.start() else script.waitStop() if script.isRunning() else 0
+        except StopIteration as stop:
+            return stop.value
+
+
+    def batchCommand(self, role, command):
+        # Job of the SLURM backend runs on a cluster node which sees none of the node-local scratch
+        # tiers of this host and keeps nothing in its own: jobs use shared tiers only and are refused
+        # if they read or leave interim volumes in node-local ones. Returns None if refused.
+        if self.ui.execBackend.currentText() != "SLURM":
+            return command
+        shared = sharedTiers()
+        if local := [ tier for tier in scratchTiers()
+                      if tier not in shared and path.join(tier, "imblproc_") in command ] :
+            self.addErrToConsole(f"Job \"{role}\" cannot be run on SLURM: it uses interim volumes in the"
+                                 f" node-local scratch {', '.join(local)}. Uncheck reconstruction in memory,"
+                                 " move the projections to storage or list a shared scratch tier.")
+            return None
+        if not shared and "imbl-stitch.sh" in command and \
+           not ( self.ui.wipeStitched.isChecked() and self.ui.saveStitched.isChecked() ) :
+            self.addErrToConsole(f"Job \"{role}\" cannot be run on SLURM: stitched volume kept in scratch"
+                                 " would stay on the cluster node. Save and wipe the stitched volume"
+                                 " or list a shared scratch tier.")
+            return None
+        if shared:
+            command = f"export IMBLSCRATCH='{':'.join(shared)}'\n{command}"
+        return path.join(execPath, "imbl-submit.sh") + f" -v -J '{role}'" \
+               f" -- {self.ui.batchOptions.text()} << 'IMBL_JOB_BODY'\n{command}\nIMBL_JOB_BODY\n"
+
+
+    def taskScript(self, role, command, wdir):
+        # Script of its own for a concurrent task, reporting to the console as scrProc does.
+        # The task deletes it when done.
+        script = Script(self)
+        script.setRole(role)
+        script.setBody(command)
+        script.governor = self.governor
+        script.dryRun = self.scrProc.dryRun
+        script.proc.setWorkingDirectory(wdir)
+        script.proc.readyReadStandardOutput.connect(self.parseScriptOut)
+        script.proc.readyReadStandardError.connect(self.parseScriptOut)
+        script.started.connect(self.onScriptStarted)
+        script.finished.connect(self.onScriptFinished)
+        script.proc.stateChanged.connect(self.update_termini_state)
+        return script
+
+
     @pyqtSlot()
     def saveConfiguration(self, fileName=etcConfigName):
 
         if self.amLoading:
             return
+        if fileName == self.etcConfigName:
+            self.configDirty = True
+            self.autosaveTimer.start()
+            return
 
         if not fileName:
             newfile, _filter = QFileDialog.getSaveFileName(
@@ -564,25 +1520,59 @@ class MainWindow(QtWidgets.QMainWindow):
                 fileName = newfile
         if not fileName:
             return
+        self.writeConfiguration(fileName)
 
-        config = QSettings(fileName, QSettings.IniFormat)
 
-        def valToSave(wdg):
-            if isinstance(wdg, QtWidgets.QLineEdit):
-                return wdg.text()
-            elif isinstance(wdg, QtWidgets.QCheckBox):
-                return wdg.isChecked()
-            elif isinstance(wdg, QtWidgets.QAbstractSpinBox):
-                return wdg.value()
-            elif isinstance(wdg, QtWidgets.QComboBox):
-                return wdg.currentText()
-            elif isinstance(wdg, UScript):
-                return wdg.ui.body.text()
-            elif isinstance(swdg, QtWidgets.QButtonGroup):
-                return swdg.checkedButton().objectName() if swdg.checkedButton() else ""
-
-        for swdg in self.configObjects:
-            config.setValue(swdg.objectName(), valToSave(swdg))
+    @pyqtSlot()
+    def flushConfiguration(self):
+        self.autosaveTimer.stop()
+        if self.configDirty:
+            self.configDirty = False
+            self.writeConfiguration(self.etcConfigName)
+
+
+    def readConfiguration(self, fileName):
+        # returns parameters stored in the file, re-reading it only if it has changed since last access
+        fileName = path.realpath(fileName)
+        identity = fileIdentity(fileName)
+        if fileName in self.configSnapshots and self.configSnapshots[fileName][0] == identity:
+            return self.configSnapshots[fileName][1]
+        config = QSettings(fileName, QSettings.IniFormat)
+        types = { swdg.objectName(): configType(swdg) for swdg in self.configObjects }
+        values = {}
+        for key in config.allKeys():
+            try:
+                values[key] = config.value(key, type=types.get(key, str))
+            except TypeError:
+                values[key] = config.value(key)
+        self.configSnapshots[fileName] = (identity, values)
+        return values
+
+
+    def writeConfiguration(self, fileName):
+        # writes atomically into temporary file renamed over the target; skips writing if nothing changed
+        fileName = path.realpath(fileName)
+        previous = self.readConfiguration(fileName) if path.exists(fileName) else {}
+        values = { **previous, **{ swdg.objectName(): configValue(swdg) for swdg in self.configObjects } }
+        if values == previous:
+            return
+        tmpName = f"{fileName}.{os.getpid()}.tmp"
+        config = QSettings(tmpName, QSettings.IniFormat)
+        for key, val in values.items():
+            config.setValue(key, val)
+        config.sync()
+        status = config.status()
+        del config
+        try:
+            if status != QSettings.NoError:
+                raise OSError(f"QSettings status {status}")
+            os.replace(tmpName, fileName)
+        except OSError as err:
+            self.addErrToConsole(f"Failed to save configuration into {fileName}: {err}")
+            if path.exists(tmpName):
+                os.remove(tmpName)
+            return
+        self.configSnapshots[fileName] = (fileIdentity(fileName), values)
 
 
     @pyqtSlot()
@@ -600,7 +1590,7 @@ class MainWindow(QtWidgets.QMainWindow):
             return
 
         self.amLoading = True
-        config = QSettings(fileName, QSettings.IniFormat)
+        config = self.readConfiguration(fileName)
 
         def getVal(swdg, type):
             nm = swdg.objectName()
@@ -612,8 +1602,8 @@ class MainWindow(QtWidgets.QMainWindow):
                              f" type {type(vargs[nm])}, where {type} was expected."
                     print(errMsg, file=sys.stderr)
                     self.addErrToConsole(errMsg)
-            elif config.contains(nm):
-                return config.value(nm, type=type)
+            elif nm in config and isinstance(config[nm], type):
+                return config[nm]
             return None
 
         for wdg in self.configObjects:
@@ -639,16 +1629,12 @@ class MainWindow(QtWidgets.QMainWindow):
                 for butt in wdg.buttons():
                     if butt.objectName() == val:
                         butt.setChecked(True)
-            else:
-                continue
-            if wdg is self.ui.outPath:
-                self.on_outPath_textChanged()
 
         self.amLoading = False
-        self.on_outPath_textChanged()
-        self.update_initiate_state()
-        self.update_reconstruction_state()
+        self.initState.invalidate() # loaded values of the init parameters are overridden by the init file
+        self.refreshState()
         self.onBinChange()
+        self.update_governor()
 
 
     def addToConsole(self, text=None, qcolor=None):
@@ -684,15 +1670,16 @@ class MainWindow(QtWidgets.QMainWindow):
     def parseScriptOut(self):
 
         proc = self.sender()
+        script = proc.parent()
         role = proc.objectName().removeprefix(Script.procPrefix)
         outed = proc.readAllStandardOutput().data().decode(sys.getdefaultencoding())
         erred = proc.readAllStandardError().data().decode(sys.getdefaultencoding())
         if not outed and not erred:
             return
-        if self.collectOut is not None:
-            self.collectOut += outed
-        if self.collectErr is not None:
-            self.collectErr += erred
+        if script.collectOut is not None:
+            script.collectOut += outed
+        if script.collectErr is not None:
+            script.collectErr += erred
 
         progg = proggMax = None
         proggTxt = None
@@ -739,27 +1726,47 @@ class MainWindow(QtWidgets.QMainWindow):
                 print(outed.strip('\n'), end=None)
             if erred:
                 print(erred.strip('\n'), end=None, file=sys.stderr)
+        if script.progress is None:
+            script.progress = [0, 0, role]
         if progg is not None:
             if progg < 0:
-                self.counter += 1
-            self.ui.inProgress.setValue(0 if progg < 0 else progg)
-        if proggMax is not None  and  proggMax != self.ui.inProgress.maximum() :
-            self.ui.inProgress.setMaximum(proggMax)
+                script.counter += 1
+            script.progress[0] = 0 if progg < 0 else progg
+        if proggMax is not None:
+            script.progress[1] = proggMax
         if proggTxt:
-            self.ui.inProgress.setFormat( (f"({self.counter+1}) " if self.counter else "")
-                                        + proggTxt + ": %v of %m (%p%)" )
+            script.progress[2] = ( (f"({script.counter+1}) " if script.counter else "")
+                                 + proggTxt + ": %v of %m (%p%)" )
+        self.showProgress()
         self.addOutToConsole(addToOut)
         self.addErrToConsole(addToErr)
 
 
+    def showProgress(self):
+        # Progress of the running scripts: of the only one as it is, of several summed up.
+        tasks = [ scr for scr in self.findChildren(Script)
+                  if scr is not self.stageProc and scr.isRunning() and scr.progress ]
+        if not tasks:
+            return
+        if len(tasks) == 1:
+            value, maximum, form = tasks[0].progress
+        else:
+            value = sum(scr.progress[0] for scr in tasks)
+            maximum = sum(scr.progress[1] for scr in tasks)
+            form = f"{len(tasks)} tasks: %v of %m (%p%)"
+        if maximum != self.ui.inProgress.maximum():
+            self.ui.inProgress.setMaximum(maximum)
+        self.ui.inProgress.setValue(value)
+        self.ui.inProgress.setFormat(form)
+
+
     @pyqtSlot()
     def onScriptStarted(self):
-        self.counter = 0
         script = self.sender()
         role = "\"" + script.role() + "\""
-        self.ui.inProgress.setValue(0)
-        self.ui.inProgress.setMaximum(0)
-        self.ui.inProgress.setFormat(f"Starting script {role}")
+        script.counter = 0
+        script.progress = [0, 0, f"Starting script {role}"]
+        self.showProgress()
         self.ui.inProgress.setVisible(True)
         self.addToConsole(f"Executing script {role} in {path.realpath(script.proc.workingDirectory())}:")
         self.addToConsole(f"{script.body()}", QtCore.Qt.green)
@@ -767,13 +1774,19 @@ class MainWindow(QtWidgets.QMainWindow):
 
     @pyqtSlot(int)
     def onScriptFinished(self):
-        self.ui.inProgress.setVisible(False)
         script = self.sender()
+        script.progress = None
+        self.ui.inProgress.setVisible(any( scr.isRunning() for scr in self.findChildren(Script)
+                                           if scr not in (script, self.stageProc) ))
+        self.showProgress()
         role = "\"" + script.role() + "\""
         exitCode = script.proc.exitCode()
         self.addToConsole(f"Script {role} stopped after {int(script.time)}s with exit code {exitCode}.")
         if exitCode:
             self.addErrToConsole(f"WARNING! Exit code {exitCode} of script {role} indicates error.")
+            if exitCode == 128 + signal.SIGKILL and script.governor and script.governor.memory \
+               and script.governor.useScopes():
+                self.addErrToConsole(f"Script {role} was killed, possibly for exceeding its memory limit.")
 
 
     @pyqtSlot()
@@ -805,8 +1818,52 @@ class MainWindow(QtWidgets.QMainWindow):
         self.ui.inBrowse.setVisible(ind)
         self.ui.outPath.setReadOnly(not ind)
         self.ui.outBrowse.setVisible(ind)
-        self.on_expPath_textChanged()
-        self.on_outPath_textChanged()
+        self.refreshState()
+
+
+    @pyqtSlot()
+    def scheduleState(self):
+        self.stateTimer.start()
+
+
+    @pyqtSlot()
+    def refreshState(self):
+        if self.amLoading:
+            return
+        self.stateTimer.stop()
+        self.samplesState.update()
+        self.scanState.update()
+        self.initState.update()
+        self.update_stitched_size()
+        self.update_reconstruction_state()
+
+
+    def checkProbes(self, fileName, vargs):
+        # Loading configuration recomputes each tracked state at most once; following edit which
+        # none of them depends on must not recompute any of them nor run any probe.
+        # Returns True on failure.
+        states = { "samples": self.samplesState, "scan": self.scanState,
+                   "init": self.initState, "volumes": self.volumesState }
+        QApplication.processEvents()
+        counts = [({ name: state.computations for name, state in states.items() }, Script.runs)]
+        self.loadConfiguration(fileName, vargs)
+        QApplication.processEvents()
+        self.refreshState() # anything scheduled while loading
+        counts.append(({ name: state.computations for name, state in states.items() }, Script.runs))
+        wdg = self.ui.testSliceNum
+        wdg.setValue(wdg.value() + 1 if wdg.value() < wdg.maximum() else wdg.minimum())
+        QApplication.processEvents()
+        self.refreshState()
+        counts.append(({ name: state.computations for name, state in states.items() }, Script.runs))
+        (startC, startP), (loadC, loadP), (editC, editP) = counts
+        print(f"{'':<16} {'load':>8} {'edit':>8}")
+        failed = editP != loadP
+        for name in states:
+            failed |= loadC[name] - startC[name] > 1 or editC[name] != loadC[name]
+            print(f"{name:<16} {loadC[name] - startC[name]:8d} {editC[name] - loadC[name]:8d}")
+        print(f"{'probes':<16} {loadP - startP:8d} {editP - loadP:8d}")
+        print(f"Probe check {'FAILED' if failed else 'passed'}: loaded {fileName}, changed {wdg.objectName()}.")
+        return failed
 
 
     @pyqtSlot()
@@ -814,9 +1871,12 @@ class MainWindow(QtWidgets.QMainWindow):
         onBrowse(self.ui.expPath, "Experiment directory")
 
 
-    @pyqtSlot(bool)
     @pyqtSlot(str)
     def on_expPath_textChanged(self, _=None):
+        self.scheduleState()
+
+
+    def refreshSamples(self):
 
         if self.ui.individualIO.isChecked():
             return
@@ -867,12 +1927,13 @@ class MainWindow(QtWidgets.QMainWindow):
         onBrowse(self.ui.inPath, "Sample directory")
 
 
-    @pyqtSlot()
     @pyqtSlot(str)
-    @pyqtSlot(bool)
     def on_inPath_textChanged(self, _=None):
+        self.scheduleState()
+
+
+    def refreshScan(self):
 
-        QtCore.QCoreApplication.processEvents()  # to update ui.inPath
         self.needReinitiation()
         self.ui.noConfigLabel.hide()
         self.ui.oldConfigLabel.hide()
@@ -964,8 +2025,11 @@ class MainWindow(QtWidgets.QMainWindow):
     @pyqtSlot()
     @pyqtSlot(str)
     def on_outPath_textChanged(self, _=None):
+        self.scheduleState()
+
+
+    def refreshInit(self):
 
-        QtCore.QCoreApplication.processEvents()  # to update ui.outPath
         self.update_initiate_state()
         self.needReinitiation()
 
@@ -1004,7 +2068,9 @@ class MainWindow(QtWidgets.QMainWindow):
 
         if self.ui.individualIO.isChecked():
           self.ui.inPath.setText(ipath)
+          self.scanState.update() # before the stitching gets enabled below
         self.doFnS = scanrange >= 360 and fshift > 0
+        self.flipShift = fshift if self.doFnS else 0
         self.ui.scanRange.setText(str(scanrange))
         self.ui.step.setText(str(step))
         self.ui.notFnS.setChecked(not self.doFnS)
@@ -1063,7 +2129,6 @@ class MainWindow(QtWidgets.QMainWindow):
         for wdg in (self.ui.testProj, self.ui.procThis, self.ui.procAll):
             wdg.setEnabled(True)
         self.ui.procAll.setText("Stitch All")
-        self.update_reconstruction_state()
 
 
     @pyqtSlot()
@@ -1071,7 +2136,13 @@ class MainWindow(QtWidgets.QMainWindow):
         if self.scrProc.isRunning():
             self.scrProc.stop()
             return
+        self.onInitiate()
+        if self.ui.procAfterInit.isChecked():
+            self.ui.procAll.click()
+
 
+    def onInitiate(self):
+        self.stageProc.stop()
         self.ui.initInfo.setEnabled(False)
         self.ui.initiate.setStyleSheet(warnStyle)
         self.ui.initiate.setText('Stop')
@@ -1114,16 +2185,48 @@ class MainWindow(QtWidgets.QMainWindow):
            not path.isdir(opath):
             os.makedirs(opath, exist_ok=True)
         self.execScrRole("initialization")
-        self.execScrProc("Initiating", command)
+        toRet = self.execScrProc("Initiating", command)
+        if not toRet and self.ui.ingestTiff.isChecked():
+            toRet = self.execScrProc("Ingesting frames", path.join(execPath, "imbl-ingest.sh") + " -v"
+                                     f" -k {self.ui.chunkProj.value()},{self.ui.chunkRows.value()}", opath)
+        if not toRet and not self.scrProc.dryRun:
+            self.recordNode("init")
+            self.recordNode("fields")
+        if not toRet and self.ui.stageDir.text().strip():
+            self.startStaging(opath)
 
         self.ui.initInfo.setEnabled(True)
         self.ui.initiate.setStyleSheet('')
         self.ui.initiate.setText('Initiate')
         self.saveConfiguration(path.join(self.ui.outPath.text(), self.configName))
 
-        self.on_outPath_textChanged()
-        if self.ui.procAfterInit.isChecked():
-            self.ui.procAll.click()
+        self.initState.invalidate()
+        self.refreshState()
+        return toRet
+
+
+    def startStaging(self, wdir):
+        self.stageProc.proc.setWorkingDirectory(wdir)
+        self.stageProc.setBody(path.join(execPath, "imbl-stage.sh")
+                               + f" -v -d \"{self.ui.stageDir.text().strip()}\"")
+        self.addToConsole(f"Staging input in background into {self.ui.stageDir.text().strip()}.")
+        if not self.stageProc.start():
+            self.addErrToConsole("WARNING! Failed to start staging of the input.")
+
+
+    @pyqtSlot(int)
+    def onStagingFinished(self, exitCode):
+        proc = self.stageProc.proc
+        outed = proc.readAllStandardOutput().data().decode(sys.getdefaultencoding())
+        erred = proc.readAllStandardError().data().decode(sys.getdefaultencoding())
+        for curL in outed.splitlines():
+            if curL and not re.search(r'^([0-9]+)/([0-9]+)$', curL) and "Starting process" not in curL:
+                self.addToConsole(curL)
+        if erred.strip():
+            self.addErrToConsole(erred.strip())
+        if exitCode:
+            self.addErrToConsole(f"WARNING! Staging of the input failed after {int(self.stageProc.time)}s;"
+                                  " stitching reads the original files.")
 
 
     @pyqtSlot(int)
@@ -1134,26 +2237,63 @@ class MainWindow(QtWidgets.QMainWindow):
             return
         if self.ui.sameBin.isChecked():
             self.ui.yBin.setValue(self.ui.xBin.value())
-        def correctVal(wdg, adj) :
-            cval = wdg.value()
-            # explicit type conversion below needed to address bug
-            # https://bugs.launchpad.net/rapid/+bug/1946407
-            nval = type(cval)(adj*cval)
-            wdg.setValue(nval)
         if self.ui.binAdjust.isChecked() and self.previousBinn :
+            rebinned = lazyModule("stitchgeom").rebinned
             if self.ui.xBin.value() != self.previousBinn[0] :
-                xadj = self.previousBinn[0] / self.ui.xBin.value()
                 for xwdg in [ self.ui.iStX, self.ui.oStX, self.ui.fStX,
                               self.ui.fCropLeft, self.ui.fCropRight, self.ui.cor ] :
-                    correctVal(xwdg, xadj)
+                    xwdg.setValue(rebinned(xwdg.value(), self.previousBinn[0], self.ui.xBin.value()))
             if self.ui.yBin.value() != self.previousBinn[1] :
-                yadj =  self.previousBinn[1] / self.ui.yBin.value()
                 for ywdg in [ self.ui.iStY, self.ui.oStY, self.ui.fStY,
                               self.ui.fCropTop, self.ui.fCropBottom ] :
-                    correctVal(ywdg, yadj)
+                    ywdg.setValue(rebinned(ywdg.value(), self.previousBinn[1], self.ui.yBin.value()))
         self.previousBinn = [ self.ui.xBin.value(), self.ui.yBin.value() ]
 
 
+    def stitchGeometryArgs(self):
+        # Arguments of stitchgeom.stitchGeometry describing the current stitching, except projections.
+        tiles = ( self.ui.zs.value() if self.doZst else 1 ) * ( self.ui.ys.value() if self.doYst else 1 )
+        iSt = (self.ui.iStX.value(), self.ui.iStY.value())
+        oSt = (self.ui.oStX.value(), self.ui.oStY.value())
+        return { "size": (self.ui.iwidth.value(), self.ui.ihight.value()),
+                 "tiles": tiles,
+                 "origin": iSt if self.doZst else oSt,
+                 "secondSize": self.ui.ys.value() if self.doYst and self.doZst else 0,
+                 "secondOrigin": oSt,
+                 "flipOrigin": (self.ui.fStX.value(), self.ui.fStY.value()) if self.doFnS else None,
+                 "crop": (self.ui.sCropTop.value(), self.ui.sCropLeft.value(),
+                          self.ui.sCropBottom.value(), self.ui.sCropRight.value()),
+                 "cropFinal": (self.ui.fCropTop.value(), self.ui.fCropLeft.value(),
+                               self.ui.fCropBottom.value(), self.ui.fCropRight.value()),
+                 "binn": (self.ui.xBin.value(), self.ui.yBin.value()) }
+
+
+    @pyqtSlot()
+    def update_stitched_size(self):
+        if self.amLoading:
+            return
+        if not self.ui.iwidth.value() or not self.ui.ihight.value():
+            self.ui.stitchedSize.setText("")
+            return
+        pjs = self.ui.projections.value() - self.flipShift
+        minProj = 0
+        maxProj = pjs - 1
+        if not self.ui.allProj.isChecked():
+            minProj = self.ui.minProj.value()
+            if self.ui.maxProj.value() != self.ui.maxProj.minimum():
+                maxProj = min(maxProj, self.ui.maxProj.value())
+        try:
+            stitchgeom = lazyModule("stitchgeom")
+            geom = stitchgeom.stitchGeometry(**self.stitchGeometryArgs(), projections = maxProj - minProj + 1,
+                                             zinn = self.ui.projBin.value())
+        except Exception as err:
+            self.ui.stitchedSize.setText(f"unknown: {err}")
+            return
+        zs, ys, xs = geom["shape"]
+        self.ui.stitchedSize.setText(f"{xs} x {ys} x {zs}, {stitchgeom.humanSize(geom['bytes'])}")
+        self.ui.stitchedSize.setStyleSheet(warnStyle if not geom["bytes"] else "")
+
+
     @pyqtSlot()
     def on_maskBrowse_clicked(self):
         onBrowse(self.ui.maskPath, "Mask image.", True)
@@ -1191,8 +2331,7 @@ class MainWindow(QtWidgets.QMainWindow):
             onlyMe = onlyMe.parent()
 
 
-    def common_stitch(self, wdir, actButton, ars=None):
-
+    def stitchParams(self, ars=None):
         prms = " "
         if self.doYst or self.doZst:
             if self.doZst:
@@ -1235,16 +2374,23 @@ class MainWindow(QtWidgets.QMainWindow):
         prms += " -v "
         if ars:
             prms += ars
+        return prms
+
+
+    def common_stitch(self, wdir, actButton, ars=None):
 
+        prms = self.stitchParams(ars)
         actText = actButton.text()
         actButton.setStyleSheet(warnStyle)
         actButton.setText('Stop')
 
         self.execScrRole("stitching")
-        self.collectOut = ""
-        hasFailed = self.execScrProc("Stitching", path.join(execPath, "imbl-stitch.sh") + prms, wdir)
-        toRet = self.collectOut
-        self.collectOut = None
+        self.scrProc.collectOut = ""
+        hasFailed = self.execScrProc("Stitching", path.join(execPath, "imbl-stitch.sh") + prms, wdir,
+                                     batch = actButton not in (self.ui.testProj, self.ui.findOrigins,
+                                                               self.ui.previewStitch))
+        toRet = self.scrProc.collectOut
+        self.scrProc.collectOut = None
 
         actButton.setText(actText)
         actButton.setStyleSheet("")
@@ -1277,7 +2423,7 @@ class MainWindow(QtWidgets.QMainWindow):
                 # phase proc
                 imcomp = path.splitext(imageFile.strip())
                 oImageFile = imcomp[0] + "_phase" + imcomp[1]
-                Script.run(f"cp -f {imageFile} {oImageFile} ")
+                Script.run(f"cp -f {imageFile} {oImageFile} ", short=False)
                 if self.applyPhase(oImageFile):
                     self.execScrProc("Cleaning phase image.", f"rm -f {oImageFile} " )
                 else:
@@ -1285,6 +2431,106 @@ class MainWindow(QtWidgets.QMainWindow):
         self.enableWidgets()
 
 
+    def exportSampleTiles(self, wdir, actButton):
+        # Exports tiles for registration and preview unless they are already exported with the same
+        # parameters. Returns prefix of the tile files or None on failure.
+        prefix = path.join(wdir, "tmp", "TILE_")
+        key = ( self.ui.regProjections.value(), self.ui.allProj.isChecked(), self.ui.minProj.value(),
+                self.ui.maxProj.value(), fileIdentity(path.join(self.ui.outPath.text(), initFileName)) )
+        if self.sampleTiles.get(path.realpath(wdir)) == key and lazyModule("tileimg").findTiles(prefix):
+            return prefix
+        if self.common_stitch(wdir, actButton, f" -e {self.ui.regProjections.value()}") is None:
+            return None
+        self.sampleTiles[path.realpath(wdir)] = key
+        return prefix
+
+
+    @pyqtSlot()
+    def on_findOrigins_clicked(self):
+        if self.scrProc.isRunning():
+            self.scrProc.stop()
+            return
+        if not (self.doYst or self.doZst or self.doFnS):
+            self.addErrToConsole("Nothing to register: there are no tiles to stitch and no flipped half.")
+            return
+
+        self.addToConsole()
+        self.enableWidgets(self.ui.findOrigins)
+        wdir = self.onStorNamePrefix()
+        if self.exportSampleTiles(wdir, self.ui.findOrigins) is None:
+            self.enableWidgets()
+            return
+        tiles = ( self.ui.zs.value() if self.doZst else 1 ) * ( self.ui.ys.value() if self.doYst else 1 )
+        iSt = f"{self.ui.iStX.value()},{self.ui.iStY.value()}"
+        oSt = f"{self.ui.oStX.value()},{self.ui.oStY.value()}"
+        prms = f" -v -n {tiles} -g={iSt if self.doZst else oSt} -G={oSt}"
+        if self.doYst and self.doZst:
+            prms += f" -s {self.ui.ys.value()}"
+        if self.doFnS:
+            prms += " -F"
+        crops = (self.ui.sCropLeft.value(), self.ui.sCropRight.value(),
+                 self.ui.sCropTop.value(), self.ui.sCropBottom.value())
+        if sum(crops):
+            prms += " -c %i-%i,%i-%i " % crops
+        if 1 != self.ui.xBin.value() * self.ui.yBin.value():
+            prms += f" -b {self.ui.xBin.value()},{self.ui.yBin.value()} "
+        if 0.0 != self.ui.rotate.value():
+            prms += f" -r={self.ui.rotate.value()} "
+        actText = self.ui.findOrigins.text()
+        self.ui.findOrigins.setStyleSheet(warnStyle)
+        self.ui.findOrigins.setText('Stop')
+        self.scrProc.collectOut = ""
+        hasFailed = self.execScrProc("Registering tiles", path.join(execPath, "imbl-register.py") + prms, wdir)
+        registered = self.scrProc.collectOut
+        self.scrProc.collectOut = None
+        self.ui.findOrigins.setText(actText)
+        self.ui.findOrigins.setStyleSheet("")
+        if not hasFailed:
+            widgets = { "g": (self.ui.iStX, self.ui.iStY) if self.doZst else (self.ui.oStX, self.ui.oStY),
+                        "G": (self.ui.oStX, self.ui.oStY),
+                        "f": (self.ui.fStX, self.ui.fStY) }
+            for lres in re.finditer(r'^([gGf]) (\S+) (\S+) (\S+)$', registered, re.MULTILINE):
+                opt, xval, yval, confidence = lres.group(1), *( float(val) for val in lres.groups()[1:] )
+                if opt == "G" and not (self.doYst and self.doZst) or opt == "f" and not self.doFnS:
+                    continue
+                widgets[opt][0].setValue(xval)
+                widgets[opt][1].setValue(yval)
+                self.addToConsole(f"Registered origin -{opt} {xval},{yval} with confidence {confidence}.")
+                if confidence < 0.5:
+                    self.addErrToConsole(f"WARNING! Low confidence {confidence} of the origin -{opt}."
+                                          " Check it on the test projection.")
+        self.enableWidgets()
+
+
+    @pyqtSlot()
+    def on_previewStitch_clicked(self):
+        if self.scrProc.isRunning():
+            self.scrProc.stop()
+            return
+        self.addToConsole()
+        self.enableWidgets(self.ui.previewStitch)
+        prefix = self.exportSampleTiles(self.onStorNamePrefix(), self.ui.previewStitch)
+        self.enableWidgets()
+        if prefix is None:
+            return
+        if self.preview is None:
+            self.preview = StitchPreview(self)
+        try:
+            self.preview.load(prefix)
+        except (OSError, ValueError) as err:
+            self.addErrToConsole(f"Failed to load exported tiles: {err}")
+            return
+        self.preview.setParameters(self.stitchGeometryArgs(), self.ui.rotate.value())
+        self.preview.show()
+        self.preview.raise_()
+
+
+    @pyqtSlot()
+    def update_preview(self):
+        if self.preview is not None and self.preview.isVisible():
+            self.preview.setParameters(self.stitchGeometryArgs(), self.ui.rotate.value())
+
+
     @pyqtSlot()
     def on_procThis_clicked(self):
         self.onStitch(False)
@@ -1296,34 +2542,201 @@ class MainWindow(QtWidgets.QMainWindow):
 
 
     def onStitch(self, doAll):
+        # Stitches sub-samples as a task graph which does not block the interface: up to subJobs
+        # of them concurrently, each followed by the extraction of the sample projections and,
+        # if requested, by the reconstruction; reconstructions, heavy on their own, run one after another.
+        # Returns the graph, e.g. for a task to wait for it.
         if self.scrProc.isRunning():
             self.scrProc.stop()
-            return -1
+            return None
+        if self.stitchGraph is not None:
+            self.stitchGraph.cancel()
+            return None
 
         self.saveConfiguration(path.join(self.ui.outPath.text(), self.configName))
         self.addToConsole()
         actBut = self.ui.procAll if doAll else self.ui.procThis
         subOnStart = self.ui.testSubDir.currentIndex()
         pidxs = [subOnStart] if actBut is self.ui.procThis else range(self.ui.testSubDir.count())
-        ars = ( "" if self.ui.wipeStitched.isChecked() else " -w " ) \
-            + ( "" if self.ui.saveStitched.isChecked() else " -s " )
+        self.execScrRole("stitching")
+        prms = self.stitchParams(self.stitchArgs())
+        graph = TaskGraph(self.ui.subJobs.value(), self)
+        lastRec = []
         for curIdx in pidxs:
-            self.ui.testSubDir.setCurrentIndex(curIdx)
-            wdir = self.onStorNamePrefix()
-            self.enableWidgets(actBut)
-            if self.common_stitch(wdir, actBut, ars) is None :
-                break
+            subDir = self.ui.testSubDir.itemText(curIdx)
+            wdir = path.join(self.ui.outPath.text(), subDir, '')
+            stitched = graph.add(f"stitch {subDir}", lambda wdir=wdir, subDir=subDir :
+                                                       self.stitchTask(wdir, subDir, prms))
+            if self.ui.recAfterProj.isChecked():
+                lastRec = [graph.add(f"rec {subDir}", lambda wdir=wdir, subDir=subDir : self.recTask(wdir, subDir),
+                                     [stitched] + lastRec)]
+
+        actText = actBut.text()
+        actBut.setStyleSheet(warnStyle)
+        actBut.setText('Stop')
+        self.enableWidgets(actBut)
+        def onDone(_):
+            self.stitchGraph = None
+            actBut.setText(actText)
+            actBut.setStyleSheet("")
+            self.ui.testSubDir.setCurrentIndex(subOnStart)
+            self.enableWidgets()
+            self.onBinChange()  # to correct state of the yBin
             self.update_reconstruction_state()
-            projFile = path.realpath(self.ui.prFile.text())
+        graph.finished.connect(onDone)
+        self.stitchGraph = graph.start()
+        return graph
+
+
+    def stitchTask(self, wdir, subDir, prms):
+        # Stitches sub-sample in wdir and extracts few projections for a quick look.
+        role = f"Stitching {subDir}".strip()
+        if (command := self.batchCommand(role, path.join(execPath, "imbl-stitch.sh") + prms)) is None:
+            return 1
+        script = self.taskScript(role, command, wdir)
+        try:
+            if (yield script) :
+                return 1
+            self.recordNode("stitch", wdir)
+            projFile = path.realpath(self.projectionsFile(wdir))
             if not path.exists(projFile):
-                self.addErrToConsole(f"Can't find stitched projections.")
-                break
+                self.addErrToConsole(f"Can't find stitched projections in {wdir}.")
+                return 1
             dgln=len(f"{self.ui.maxProj.value()-1}")
+            samples = []
             for ridx in 0, 1, 2, 3, 4:
                 idx = int( self.ui.minProj.value()
                          + ridx * (self.ui.maxProj.value() - self.ui.minProj.value() - 1) / 4 )
-                Script.run(f"ctas v2v {projFile}:/data:{idx} -o {wdir}/clean_{idx:0{dgln}d}.tif")
-            if self.ui.recAfterProj.isChecked() and self.on_reconstruct_clicked():
+                samples.append(f"ctas v2v {projFile}:/data:{idx} -o {wdir}/clean_{idx:0{dgln}d}.tif & ")
+            script.setRole(f"Sample projections {subDir}".strip())
+            script.setBody("".join(samples) + "wait") # samples are independent reads of the same file
+            yield script
+            return 0
+        finally:
+            script.deleteLater()
+
+
+    def recTask(self, wdir, subDir):
+        # Reconstructs sub-sample in wdir in a script of its own.
+        script = self.taskScript(f"Reconstructing {subDir}".strip(), "", wdir)
+        try:
+            return (yield from self.recSteps(script, wdir))
+        finally:
+            script.deleteLater()
+
+
+    def stitchArgs(self):
+        return ( "" if self.ui.wipeStitched.isChecked() else " -w " ) \
+             + ( "" if self.ui.saveStitched.isChecked() else " -s " ) \
+             + ( f" -k {self.ui.chunkProj.value()},{self.ui.chunkRows.value()} "
+                 if self.ui.chunkProj.value() else "" ) \
+             + ( " -Z " if self.ui.compressStitched.isChecked() else "" ) \
+             + ( "" if self.ui.useJournal.isChecked() else " -x " )
+
+
+    def nodeDir(self, node, wdir=None):
+        return self.ui.outPath.text() if pipelineGraph[node]["global"] else wdir or self.onStorNamePrefix()
+
+
+    def nodeHash(self, node):
+        desc = pipelineGraph[node]
+        parts = [ configValue(getattr(self.ui, prm)) for prm in desc["params"] ]
+        for inp in desc["inputs"]:
+            if path.isfile(filename := configValue(getattr(self.ui, inp))):
+                parts.append(fileIdentity(filename))
+        for up in desc["upstream"]:
+            parts.append(self.nodeHash(up))
+            if pipelineGraph[up]["tracked"]:
+                parts.append(self.nodeProducts(up))
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+    def nodeProducts(self, node, wdir=None):
+        # Returns hash of the identities of the node products or None if any of them is missing.
+        identities = []
+        ndir = self.nodeDir(node, wdir)
+        for product in pipelineGraph[node]["products"]:
+            optional = product.endswith('?')
+            found = [ alt for alt in product.removesuffix('?').split('|') if path.exists(path.join(ndir, alt)) ]
+            if not found:
+                if not optional:
+                    return None
+                identities.append(None)
+                continue
+            identities.append(fileIdentity(path.join(ndir, found[0])))
+        return hashlib.sha1(repr(identities).encode()).hexdigest()
+
+
+    def recordNode(self, node, wdir=None):
+        # Records node as completed in the run journal in the format of imbl-journal.sh.
+        try:
+            with open(path.join(self.nodeDir(node, wdir), journalName), "a") as jfile:
+                jfile.write("\t".join( ( time.strftime("%Y-%m-%dT%H:%M:%S"), "done", "graph", node,
+                                        self.nodeHash(node), str(self.nodeProducts(node, wdir)) ) ) + "\n")
+        except OSError:
+            self.addErrToConsole(f"Failed to record {pipelineGraph[node]['title']} in the run journal.")
+
+
+    def isFresh(self, node):
+        record = None
+        try:
+            with open(path.join(self.nodeDir(node), journalName)) as jfile:
+                for line in jfile:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) == 6 and fields[2] == "graph" and fields[3] == node:
+                        record = fields[4:] if fields[1] == "done" else None
+        except OSError:
+            return False
+        return record == [self.nodeHash(node), str(self.nodeProducts(node))]
+
+
+    def staleNodes(self):
+        # Returns nodes to rebuild: stale final nodes and stale upstream nodes they need.
+        # Stale node needed by no one (e.g. wiped clean.hdf of an up to date reconstruction) is interim.
+        fresh = { node: self.isFresh(node) for node in pipelineGraph }
+        needed = []
+        def need(node):
+            if fresh[node] or node in needed:
+                return
+            needed.append(node)
+            for upnode in pipelineGraph[node]["upstream"]:
+                need(upnode)
+        for node in pipelineGraph:
+            if not any( node in desc["upstream"] for desc in pipelineGraph.values() ):
+                need(node)
+        return [ node for node in pipelineGraph if node in needed ]
+
+
+    def update_stale_state(self):
+        stale = self.staleNodes() if path.isdir(self.ui.outPath.text()) else []
+        self.ui.staleInfo.setText( "Stale: " + ", ".join(pipelineGraph[node]["title"] for node in stale)
+                                   if stale else "Everything is up to date.")
+        self.ui.staleInfo.setStyleSheet(warnStyle if stale else "")
+        self.ui.procStale.setEnabled(bool(stale))
+
+
+    @pyqtSlot()
+    def on_procStale_clicked(self):
+        if self.scrProc.isRunning():
+            self.scrProc.stop()
+            return -1
+
+        self.saveConfiguration(path.join(self.ui.outPath.text(), self.configName))
+        self.addToConsole()
+        actBut = self.ui.procStale
+        if { "init", "fields" } & set(self.staleNodes()) and self.onInitiate():
+            return -1
+        subOnStart = self.ui.testSubDir.currentIndex()
+        for curIdx in range(self.ui.testSubDir.count()):
+            self.ui.testSubDir.setCurrentIndex(curIdx)
+            stale = self.staleNodes()
+            self.enableWidgets(actBut)
+            if "stitch" in stale:
+                if self.common_stitch(self.onStorNamePrefix(), actBut, self.stitchArgs()) is None :
+                    break
+                self.recordNode("stitch")
+                self.update_reconstruction_state()
+            if ( "filter" in stale or "rec" in stale ) and self.on_reconstruct_clicked():
                 break
         self.ui.testSubDir.setCurrentIndex(subOnStart)
         self.enableWidgets()
@@ -1334,28 +2747,69 @@ class MainWindow(QtWidgets.QMainWindow):
         return path.join(self.ui.outPath.text(), self.ui.testSubDir.currentText(), '')
 
 
-    def inMemNamePrexix(self):
+    def inMemNamePrexix(self, tier=None, wdir=None):
+        # Prefix of the interim files in the scratch tier, the first listed by default.
+        # Prefixes in all tiers are registered to be wiped.
         global listOfCreatedMemFiles
-        cOpath = path.realpath(self.onStorNamePrefix())
-        toRet = f"/dev/shm/imblproc_{cOpath.replace('/','_')}_"
-        if 'InMemIndicator' in os.environ:
-            print(f"{os.environ['InMemIndicator']}{toRet}")
-        if toRet not in listOfCreatedMemFiles:
-            listOfCreatedMemFiles.append(toRet)
-        return toRet
+        cOpath = path.realpath(wdir or self.onStorNamePrefix())
+        prefixOf = lambda tr : path.join(tr, f"imblproc_{cOpath.replace('/','_')}_")
+        for prefix in map(prefixOf, scratchTiers()):
+            if prefix in listOfCreatedMemFiles:
+                continue
+            if 'InMemIndicator' in os.environ:
+                print(f"{os.environ['InMemIndicator']}{prefix}")
+            listOfCreatedMemFiles.append(prefix)
+        return prefixOf(tier or scratchTiers()[0])
+
+
+    def scratchName(self, name, wdir=None):
+        # Existing interim file in any of the scratch tiers or its name in the first one.
+        names = [ self.inMemNamePrexix(tier, wdir) + name for tier in scratchTiers() ]
+        return next((nm for nm in names if path.exists(nm)), names[0])
+
+
+    def projectionsFile(self, wdir=None):
+        # Stitched projections: interim volume in scratch if any, the one in storage otherwise.
+        memName = self.scratchName("clean.hdf", wdir)
+        return memName if path.exists(memName) else path.join(wdir or self.onStorNamePrefix(), "clean.hdf")
+
+
+    def pickScratch(self, size, name, wdir=None):
+        # Interim file of the sub-sample in wdir (the current one by default) in the fastest scratch tier
+        # with space for size bytes; empty if none fits. Only shared tiers are considered for jobs on SLURM.
+        tiers = ""
+        if self.ui.execBackend.currentText() == "SLURM":
+            if not (shared := sharedTiers()):
+                return ""
+            tiers = f"IMBLSCRATCH='{':'.join(shared)}' "
+        return Script.run(f"{tiers}{path.join(execPath, 'imbl-scratch.sh')} -d '{wdir or self.onStorNamePrefix()}'"
+                          f" pick {size} {name}")[1].strip()
+
+
+    @pyqtSlot()
+    @pyqtSlot(str)
+    def on_scratchTiers_textChanged(self, _=None):
+        if tiers := self.ui.scratchTiers.text().strip() or envScratch:
+            os.environ["IMBLSCRATCH"] = tiers
+        else:
+            os.environ.pop("IMBLSCRATCH", None)
+        self.scheduleState()
 
 
     @pyqtSlot()
     def on_cleanToMemory_clicked(self):
         file_postfix = "clean.hdf"
-        memName = self.inMemNamePrexix() + file_postfix
         diskName = self.onStorNamePrefix() + file_postfix
         if not path.exists(diskName):
             return
+        if not (memName := self.pickScratch(path.getsize(diskName), file_postfix)):
+            self.addErrToConsole(f"No scratch tier has space for cleaned projections file {diskName}."
+                                  " You may try to reconstruct from storage, but it is slow.")
+            return
         self.enableWidgets(self.ui.prFile)
-        if self.execScrProc("Copying projections into memory.", f"  cp '{diskName}' '{memName}' " ) :
-            self.addErrToConsole(f"Filed to copy cleaned projections file {diskName} into memory {memName}."
-                                  " Most probable cause is insufficient free memory."
+        if self.execScrProc("Copying projections into scratch.", f"  cp '{diskName}' '{memName}' " ) :
+            self.addErrToConsole(f"Filed to copy cleaned projections file {diskName} into scratch {memName}."
+                                  " Most probable cause is insufficient free space."
                                   " You may try to reconstruct from storage, but it is slow.")
         else:
             self.update_reconstruction_state()
@@ -1363,8 +2817,13 @@ class MainWindow(QtWidgets.QMainWindow):
 
 
     def update_reconstruction_state(self):
+        self.volumesState.update()
+        self.update_stale_state()
+
+
+    def refreshVolumes(self):
         file_postfix = "clean.hdf"
-        memName = self.inMemNamePrexix() + file_postfix
+        memName = self.scratchName(file_postfix)
         diskName = self.onStorNamePrefix() + file_postfix
         inMem = path.exists(memName)
         self.ui.cleanToMemory.setVisible(not inMem and path.exists(diskName))
@@ -1372,12 +2831,15 @@ class MainWindow(QtWidgets.QMainWindow):
         projFile = path.realpath(projFile)
         x, y, z = hdf5shape(projFile, "data")
         projShape = f"{x} x {y} x {z}" if x and y and z else None
-        recFile = self.inMemNamePrexix() + "rec.hdf"
+        self.projSize = (x, y, z) if projShape else None
+        self.update_roi_estimate()
+        recFile = self.scratchName("rec.hdf")
         x, y, z = hdf5shape(recFile, "data")
         recShape = f"{x} x {y} x {z}" if x and y and z else None
         enableRec = projShape is not None
         self.ui.testSlice.setEnabled(enableRec)
         self.ui.testSliceNum.setEnabled(enableRec)
+        self.ui.quickLook.setEnabled(enableRec)
         self.ui.reconstruct.setEnabled(enableRec)
         if enableRec:
             self.ui.prShape.setText(projShape)
@@ -1391,7 +2853,7 @@ class MainWindow(QtWidgets.QMainWindow):
             os.environ["RECHDF"] = recFile
         else:
             self.ui.prShape.setText("")
-            self.ui.prFile.setText("no projection or reconstruction volumes found in memory.")
+            self.ui.prFile.setText("no projection or reconstruction volumes found in scratch.")
             self.ui.prFile.setEnabled(False)
             os.environ["PROJHDF"] = ""
             os.environ["RECHDF"] = ""
@@ -1454,39 +2916,53 @@ class MainWindow(QtWidgets.QMainWindow):
         self.update_reconstruction_state()
 
 
-    def applyPhase(self, volumeDesc, saveHist=False):
-        if self.ui.distance.value() == 0 or self.ui.d2b.value() == 0.0:
+    def phaseOptions(self, d2b=None, binn=1):
+        d2b = self.ui.d2b.value() if d2b is None else d2b
+        if self.ui.distance.value() == 0 or d2b == 0.0:
+            return ""
+        return  f" -z {self.ui.distance.value()}" \
+                f" -d {d2b}" \
+                f" -r {self.ui.pixelSize.value() * binn}" \
+                f" -w {12.398/self.ui.energy.value()}" \
+                + ( "" if self.ui.zeroPadding.isChecked() else " -p" )
+
+
+    def applyPhase(self, volumeDesc, saveHist=False, d2b=None, binn=1):
+        return self.execSteps(self.phaseSteps(self.scrProc, volumeDesc, saveHist, d2b, binn))
+
+
+    def phaseSteps(self, script, volumeDesc, saveHist=False, d2b=None, binn=1):
+        if not (phaseLine := self.phaseOptions(d2b, binn)):
             return 0
-        self.execScrRole("phase")
-        command = f"ctas ipc {volumeDesc} -e -v " \
-                                f" -z {self.ui.distance.value()}" \
-                                f" -d {self.ui.d2b.value()}" \
-                                f" -r {self.ui.pixelSize.value()}" \
-                                f" -w {12.398/self.ui.energy.value()}" \
-                                + ( "" if self.ui.zerroPadding.isChecked() else " -p" )
+        yield from self.roleStep("phase")
+        command = f"ctas ipc {volumeDesc} -e -v {phaseLine}"
         if saveHist :
             Script.run(f"echo '{command}' >> {self.historyName}")
-        return self.execScrProc( "Retrieving phase", command)
+        return (yield from self.scriptStep(script, "Retrieving phase", command, batch=saveHist))
 
 
+    def applyRing(self, iVol, oVol=None, saveHist=False, ring=None):
+        return self.execSteps(self.ringSteps(self.scrProc, iVol, oVol, saveHist, ring))
 
-    def applyRing(self, iVol, oVol=None, saveHist=False):
-        if self.ui.ring.value() == 0:
+
+    def ringSteps(self, script, iVol, oVol=None, saveHist=False, ring=None):
+        ring = self.ui.ring.value() if ring is None else ring
+        if ring == 0:
             return 0
-        command = f"ctas ring -v -R {self.ui.ring.value()} {iVol} " + \
+        command = f"ctas ring -v -R {ring} {iVol} " + \
                                 (f" -o {oVol}" if oVol else "")
         if saveHist :
             Script.run(f"echo '{command}' >> {self.historyName}")
-        return self.execScrProc( "Applying ring filter", command )
+        return (yield from self.scriptStep(script, "Applying ring filter", command, batch=saveHist))
 
 
-    def applyCT(self, step, istr, ostr, saveHist=False):
+    def ctOptions(self, step, cor=None, fltOpt=None, binn=1):
         fltLine = self.ui.ctFilter.currentText().upper().split()[0]
         if self.canSee(self.ui.ctFilterOpt):
-            fltLine += f":{self.ui.ctFilterOpt.value()}"
+            fltLine += f":{self.ui.ctFilterOpt.value() if fltOpt is None else fltOpt}"
         kontrLine = "FLT" if fltLine == "NONE" else "ABS"
         fltLine = "" if fltLine == "NONE" else f" -f {fltLine}"
-        resLine = f" -r {self.ui.pixelSize.value()} " + \
+        resLine = f" -r {self.ui.pixelSize.value() * binn} " + \
             ( "" if self.ui.outMu.isChecked() else f" -w {12.398/self.ui.energy.value()}" )
         mmLine=""
         dataFormat = self.ui.resDataFormat.currentText()
@@ -1499,32 +2975,79 @@ class MainWindow(QtWidgets.QMainWindow):
                        f" {self.ui.resDataFormat.currentIndex()} of combobox" + \
                        ' "' + {self.ui.resDataFormat.objectName()} + '".'
                      , file=sys.stderr)
-        command =   f"ctas ct -v {istr} " \
-                    f" -o {ostr}" \
-                    f" -k {kontrLine} " \
-                    f" -c {self.ui.cor.value()}" \
-                    f" -a {step}" + \
-                    resLine + fltLine + mmLine
-        self.execScrRole("ct")
+        return  f" -k {kontrLine} " \
+                f" -c {self.ui.cor.value() / binn if cor is None else cor}" \
+                f" -a {step}" + \
+                resLine + fltLine + mmLine
+
+
+    def applyCT(self, step, istr, ostr, saveHist=False, sharded=False, binn=1, rows=None):
+        return self.execSteps(self.ctSteps(self.scrProc, step, istr, ostr, saveHist, sharded, binn, rows))
+
+
+    def ctSteps(self, script, step, istr, ostr, saveHist=False, sharded=False, binn=1, rows=None):
+        # rows: (first, count) of the sinograms along y in istr to reconstruct into the slices
+        # of the output; all sinograms if None.
+        ctLine = self.ctOptions(step, binn=binn)
+        ctJobs = self.ui.ctJobs.value()
+        ctHosts = self.ui.ctHosts.text().strip()
+        useJournal = self.ui.useJournal.isChecked()
+        if sharded and ( ctJobs > 1 or ctHosts ) : # shards are journaled to resume
+            command = path.join(execPath, "imbl-ct.sh") + f" -v -j {ctJobs}" \
+                    + (f" -S {ctHosts}" if ctHosts else "") \
+                    + ("" if useJournal else " -x") \
+                    + (f" -y {rows[0]}:{rows[0]+rows[1]} -O 0 -Y {rows[1]}" if rows else "") \
+                    + f" {istr.removesuffix(':y')} {ostr} -- {ctLine}"
+        else:
+            command = f"ctas ct -v {istr}" + (f"{rows[0]}+{rows[1]}" if rows else "") + f" -o {ostr} {ctLine}"
+        yield from self.roleStep("ct")
         if saveHist :
             Script.run(f"echo '{command}' >> {self.historyName}")
-        toRet = self.execScrProc("Reconstructing", command)
+        toRet = yield from self.scriptStep(script, "Reconstructing", command, batch=sharded)
         if toRet :
             self.addErrToConsole(f"Cleaning after itself on failure: {ostr}*" )
         return toRet
 
 
-    def common_rec(self, isTest):
+    def fusedSteps(self, script, step, projFile, ostr, saveHist=False, blkFile=None):
+        phaseLine = self.phaseOptions()
+        ctHosts = self.ui.ctHosts.text().strip()
+        command = path.join(execPath, "imbl-fused.sh") + f" -v -j {self.ui.ctJobs.value()}" \
+                + (f" -S {ctHosts}" if ctHosts else "") \
+                + ("" if self.ui.useJournal.isChecked() else " -x") \
+                + (f" -R {self.ui.ring.value()}" if self.ui.ring.value() else "") \
+                + (f" -P '{phaseLine}'" if phaseLine else "") \
+                + ("" if self.ui.ringOrder.checkedButton() is self.ui.ringBeforePhase else " -A") \
+                + (f" -T '{blkFile}'" if blkFile else "") \
+                + f" {projFile}:/data {ostr} -- {self.ctOptions(step)}"
+        if phaseLine:
+            yield from self.roleStep("phase")
+        yield from self.roleStep("ct")
+        if saveHist :
+            Script.run(f"echo \"{command}\" >> {self.historyName}")
+        toRet = yield from self.scriptStep(script, "Reconstructing in single pass", command, batch=True)
+        if toRet :
+            self.addErrToConsole(f"Cleaning after itself on failure: {ostr}*" )
+        return toRet
+
 
-        wdir  = self.onStorNamePrefix()
-        self.scrProc.proc.setWorkingDirectory(wdir)
-        projFile = path.realpath(self.ui.prFile.text())
+    def common_rec(self, isTest, d2bs=None):
+        return self.execSteps(self.commonRecSteps(self.scrProc, self.onStorNamePrefix(), isTest, d2bs))
+
+
+    def commonRecSteps(self, script, wdir, isTest, d2bs=None):
+        # Preparation of the sub-sample in wdir for reconstruction in the script.
+        # d2bs: all values of d2b the test is done with, that of the UI by default.
+
+        script.proc.setWorkingDirectory(wdir)
+        projFile = path.realpath(self.projectionsFile(wdir))
         x, y, z = hdf5shape(projFile, "data")
         if not x or not y or not z:
             self.addErrToConsole(f"Can't find projections in file \"{projFile}\". Aborting test.")
             return None
         slice= self.ui.testSliceNum.value()
-        doPhase = self.ui.distance.value() > 0 and self.ui.d2b.value() > 0
+        d2bs = [self.ui.d2b.value()] if d2bs is None else d2bs
+        doPhase = self.ui.distance.value() > 0 and any( d2b > 0 for d2b in d2bs )
         if isTest:
             addToSl = 64 if doPhase else 0
             if slice-addToSl < 0 or slice+addToSl >= y :
@@ -1552,23 +3075,90 @@ class MainWindow(QtWidgets.QMainWindow):
                                       " Calculate it manually to proceed with reconstruction.")
                 return None
             cor = None
-            self.collectOut = ""
-            Script.run(f"mkdir -p \"tmp\"")
-            if self.execScrProc( "Searching for rotation centre",
-                                f"ctas ax {projFile}:/data:0 {projFile}:/data:{ark180}" + \
-                                (f" -o tmp/SAMPLE_cor.tif" if isTest else "")  ) :
+            script.collectOut = ""
+            Script.run(f"mkdir -p \"{path.join(wdir, 'tmp')}\"")
+            try:
+                failed = yield from self.scriptStep(script, "Searching for rotation centre",
+                                path.join(execPath, "imbl-cor.py") + f" -v -a {ark180} {projFile}:/data" + \
+                                (f" -o tmp/SAMPLE_cor.tif" if isTest else "")  )
+                corOut = script.collectOut
+            finally:
+                script.collectOut = None
+            if failed :
                 return None
             try:
-                cor = 0.0 if self.scrProc.dryRun else float(self.collectOut)
+                cor, tilt, confidence = (0.0, 0.0, 1.0) if script.dryRun else \
+                    ( float(val) for val in corOut.strip().splitlines()[-1].split() )
                 self.ui.cor.setValue(cor)
             except Exception:
                 self.addErrToConsole(f"Failed to calculate rotation centre.")
                 return None
-            self.collectOut = None
+            self.addToConsole(f"Rotation centre {cor} (axis tilt {tilt} deg) found with confidence {confidence}.")
+            if confidence < 0.5:
+                self.addErrToConsole(f"WARNING! Low confidence {confidence} of the rotation centre."
+                                      " Check it on the test slice.")
 
         return projFile, slice, y, step, wdir
 
 
+    def testSinogram(self, cache, projFile, slice, d2b=None, ring=None):
+        # Returns sinogram of the slice filtered with given parameters or None on failure.
+        # Products are taken from the cache if their upstream parameters did not change.
+        d2b = self.ui.d2b.value() if d2b is None else d2b
+        ring = self.ui.ring.value() if ring is None else ring
+
+        def produce(product, command):
+            if cache.has(product):
+                return False
+            if command():
+                Script.run(f"rm -f {product}", short=False)
+                return True
+            return False
+
+        rawKey = cache.key(fileIdentity(projFile), slice)
+        rawSino = cache.path(rawKey)
+        if produce(rawSino, lambda : self.execScrProc(f"Saving raw sinogram into {rawSino}",
+                                    f"ctas v2v {projFile}:/data:y{slice} -o {rawSino}") ):
+            return None
+        if self.ui.distance.value() == 0 or d2b == 0.0:
+            if not ring:
+                return rawSino
+            ringSino = cache.path(cache.key(rawKey, "ring", ring))
+            return None if produce(ringSino, lambda : self.applyRing(rawSino, ringSino, ring=ring)) \
+                   else ringSino
+
+        ringBefore = self.ui.ringOrder.checkedButton() is self.ui.ringBeforePhase
+        phaseKey = cache.key(rawKey, "phase", self.ui.distance.value(), d2b, self.ui.pixelSize.value(),
+                             self.ui.energy.value(), self.ui.zeroPadding.isChecked(),
+                             ring if ringBefore else 0)
+        phaseSino = cache.path(phaseKey)
+        if not cache.has(phaseSino):
+            subVol = cache.path(cache.key(rawKey, "subvolume"), ".hdf")
+            if produce(subVol, lambda : self.execScrProc( "Extracting phase subvolume",
+                                f"ctas v2v -v {projFile}:/data -o {subVol}:/data" \
+                                f" -c ,{slice-64}:{slice+64} ") ) :
+                return None
+            workVol = cache.path(phaseKey, ".hdf")
+            failed = self.execScrProc("Copying phase subvolume", f"cp -f {subVol} {workVol}") \
+                     or ringBefore and self.applyRing(f"{workVol}:/data:y", ring=ring) \
+                     or self.applyPhase(f"{workVol}:/data", d2b=d2b) \
+                     or self.execScrProc(f"Saving phase-filtered sinogram into {phaseSino}",
+                                         f"ctas v2v {workVol}:/data:y64 -o {phaseSino}")
+            Script.run(f"rm -f {workVol}" + (f" {phaseSino}" if failed else ""), short=False)
+            if failed:
+                return None
+        if ringBefore or not ring:
+            return phaseSino
+        ringSino = cache.path(cache.key(phaseKey, "ring", ring))
+        return None if produce(ringSino, lambda : self.applyRing(phaseSino, ringSino, ring=ring)) \
+               else ringSino
+
+
+    def testCache(self):
+        return StageCache(path.join(self.onStorNamePrefix(), "tmp", "cache"),
+                          int(self.ui.cacheBudget.value() * 2**30))
+
+
     @pyqtSlot()
     def on_testSlice_clicked(self):
         if self.scrProc.isRunning():
@@ -1579,11 +3169,10 @@ class MainWindow(QtWidgets.QMainWindow):
         self.addToConsole()
         self.ui.testSlice.setStyleSheet(warnStyle)
         self.ui.testSlice.setText('Stop')
-        phaseSubVol = None
+        cache = None
         def onStopMe(errMsg=None):
-            nonlocal phaseSubVol
-            if phaseSubVol:
-                self.execScrProc("Cleaning phase sub-volume", f"rm {phaseSubVol}" )
+            if cache:
+                cache.evict()
             self.ui.testSlice.setStyleSheet("")
             self.ui.testSlice.setText('Test slice')
             self.enableWidgets()
@@ -1600,50 +3189,116 @@ class MainWindow(QtWidgets.QMainWindow):
         projFile, slice, y, step, _ = commres
         dgln=len(f"{y-1}")
         testPrefix = f"tmp/SINO_{slice:0{dgln}d}"
+        cache = self.testCache()
 
-        def saveSino(istr, ostr, role):
-            return self.execScrProc(f"Saving {role} sinogram into {ostr}",
-                                    f"ctas v2v {istr} -o {ostr}")
+        if (recSino := self.testSinogram(cache, projFile, slice)) is None:
+            return onStopMe()
+        rawSino = cache.path(cache.key(fileIdentity(projFile), slice))
+        Script.run(f"cp -f {rawSino} {testPrefix}_raw.tif", short=False)
+        if recSino != rawSino:
+            lastStage = "phase" if self.ui.distance.value() > 0 and self.ui.d2b.value() != 0.0 and \
+                        ( self.ui.ringOrder.checkedButton() is self.ui.ringBeforePhase
+                          or not self.ui.ring.value() ) else "ring"
+            Script.run(f"cp -f {recSino} {testPrefix}_{lastStage}.tif", short=False)
 
-        rawSino = f"{testPrefix}_raw.tif"
-        if saveSino(f"{projFile}:/data:y{slice}", rawSino, "raw"):
+        outPath = f"tmp/SLICE_{slice:0{dgln}d}.tif"
+        if self.applyCT(step, recSino, outPath):
             return onStopMe()
-        recSino = rawSino
 
-        if self.ui.distance.value() > 0 and self.ui.d2b.value() != 0.0:
+        if self.scrProc.dryRun:
+            self.addErrToConsole("Dry run. No reconstruction performed.")
+        return onStopMe()
 
-            phaseSubVol = f"{path.splitext(projFile)[0]}_phase.hdf"
-            if self.execScrProc( "Extracting phase subvolume",
-                                f"ctas v2v -v {projFile}:/data -o {phaseSubVol}:/data" \
-                                f" -c ,{slice-64}:{slice+64} ") :
-                return onStopMe()
 
-            if  self.ui.ringOrder.checkedButton() is self.ui.ringBeforePhase:
-                if self.applyRing(f"{phaseSubVol}:/data:y") or \
-                   saveSino(f"{phaseSubVol}:/data:y64", f"{testPrefix}_ring.tif", "ring-filtered"):
-                    return onStopMe()
+    def sweepValues(self, wdg, default):
+        # parses either range START:STOP[:STEP] or list of values; returns None if malformed.
+        txt = wdg.text().strip()
+        if not txt:
+            return [default]
+        try:
+            if ':' in txt:
+                start, stop, *stp = ( float(val) for val in txt.split(':') )
+                stp = stp[0] if stp else 1.0
+                if stp <= 0 or stop < start:
+                    raise ValueError
+                return [ round(start + idx * stp, 6) for idx in range(int((stop - start) / stp + 1e-6) + 1) ]
+            return [ float(val) for val in txt.replace(',', ' ').split() ]
+        except ValueError:
+            self.addErrToConsole(f"Can't parse sweep values \"{txt}\" of {wdg.objectName()}.")
+            return None
 
-            phaseSino = f"{testPrefix}_phase.tif"
-            if self.applyPhase(f"{phaseSubVol}:/data") or \
-               saveSino(f"{phaseSubVol}:/data:y64", phaseSino, "phase-filtered"):
-                return onStopMe()
-            recSino = phaseSino
 
-            if  self.ui.ringOrder.checkedButton() is self.ui.ringAfterPhase:
-                ringSino = f"{testPrefix}_ring.tif"
-                if self.applyRing(phaseSino, ringSino):
-                    return onStopMe()
-                recSino = ringSino
+    @pyqtSlot()
+    def on_testSweep_clicked(self):
+        if self.scrProc.isRunning():
+            self.scrProc.stop()
+            return -1
 
-        elif self.ui.ring.value() != 0:
-            ringSino = f"{testPrefix}_ring.tif"
-            if self.applyRing(recSino, ringSino):
-                return onStopMe()
-            recSino = ringSino
+        self.enableWidgets(self.ui.testSweep)
+        self.addToConsole()
+        self.ui.testSweep.setStyleSheet(warnStyle)
+        self.ui.testSweep.setText('Stop')
+        cache = None
+        def onStopMe(errMsg=None):
+            if cache:
+                cache.evict()
+            self.ui.testSweep.setStyleSheet("")
+            self.ui.testSweep.setText('Sweep')
+            self.enableWidgets()
+            if errMsg:
+                self.addErrToConsole(errMsg)
+                return -1
+            else:
+                return self.scrProc.proc.exitCode()
 
-        outPath = f"tmp/SLICE_{slice:0{dgln}d}.tif"
-        if self.applyCT(step, recSino, outPath):
+        d2bs = self.sweepValues(self.ui.sweepD2b, self.ui.d2b.value())
+        rings = self.sweepValues(self.ui.sweepRing, self.ui.ring.value())
+        fltOpts = self.sweepValues(self.ui.sweepFilterOpt, self.ui.ctFilterOpt.value()) \
+                  if self.canSee(self.ui.ctFilterOpt) else [None]
+        if None in (d2bs, rings, fltOpts) or (commres := self.common_rec(True, d2bs)) is None:
             return onStopMe()
+        if (cors := self.sweepValues(self.ui.sweepCor, self.ui.cor.value())) is None:
+            return onStopMe()
+        if self.ui.distance.value() == 0:
+            d2bs = [0.0]
+        Script.run(f"mkdir -p \"tmp\"")
+        projFile, slice, y, step, _ = commres
+        dgln=len(f"{y-1}")
+        testPrefix = f"tmp/SWEEP_{slice:0{dgln}d}"
+        cache = self.testCache()
+
+        # sinograms for each combination of upstream parameters are prepared only once
+        sinos = {}
+        for d2b in d2bs:
+            for ring in ( int(ring) for ring in rings ):
+                if (sino := self.testSinogram(cache, projFile, slice, d2b, ring)) is None:
+                    return onStopMe()
+                sinos[(d2b, ring)] = sino
+
+        # all reconstructions of the grid in parallel
+        jobs = ""
+        labels = ""
+        slices = []
+        for (d2b, ring), sino in sinos.items():
+            for cor in cors:
+                for fltOpt in fltOpts:
+                    label = f"d2b={d2b} ring={ring} cor={cor}" + ( "" if fltOpt is None else f" flt={fltOpt}" )
+                    slices.append( f"{testPrefix}_d{d2b}_r{ring}_c{cor}" + \
+                                   ( "" if fltOpt is None else f"_f{fltOpt}" ) + ".tif" )
+                    jobs += f"{sino} {cor} {fltOpt} {slices[-1]}\n"
+                    labels += f"{len(slices)-1} {label}\n"
+        self.addToConsole(f"Reconstructing {len(slices)} combinations of parameters.")
+        self.execScrRole("ct")
+        if self.execScrProc("Reconstructing sweep",
+                            f"parallel --colsep ' ' --eta ctas ct {{1}} -o {{4}} " + \
+                            self.ctOptions(step, "{2}", "{3}") + f" <<EOF\n{jobs}EOF\n") :
+            return onStopMe()
+        Script.run(f"cat > {testPrefix}.txt <<EOF\n{labels}EOF\n")
+        if self.execScrProc("Stacking sweep results",
+                            f"ctas v2v {' '.join(slices)} -o {testPrefix}.hdf:/data && rm -f {' '.join(slices)}") :
+            return onStopMe()
+        self.addToConsole(f"Results of the sweep are stacked in {path.realpath(testPrefix)}.hdf"
+                          f" with labels of the frames listed in {path.realpath(testPrefix)}.txt.")
 
         if self.scrProc.dryRun:
             self.addErrToConsole("Dry run. No reconstruction performed.")
@@ -1651,29 +3306,22 @@ class MainWindow(QtWidgets.QMainWindow):
 
 
     @pyqtSlot()
-    def on_reconstruct_clicked(self):
+    def on_quickLook_clicked(self):
         if self.scrProc.isRunning():
             self.scrProc.stop()
             return -1
 
-        self.saveConfiguration(path.join(self.ui.outPath.text(), self.configName))
+        self.enableWidgets(self.ui.quickLook)
         self.addToConsole()
-        recBut = self.ui.reconstruct
-        self.enableWidgets(recBut)
-        recBut.setStyleSheet(warnStyle)
-        recBut.setText('Stop')
-        delMe = None
+        self.ui.quickLook.setStyleSheet(warnStyle)
+        self.ui.quickLook.setText('Stop')
+        qlProj = None
         def onStopMe(errMsg=None):
-            nonlocal delMe
-            if delMe and path.exists(delMe):
-                self.execScrProc("Cleaning projections volume", f"rm -f {delMe} & " )
-            recBut.setStyleSheet("")
-            recBut.setText('Reconstruct')
-            if self.sender() is recBut:
-                self.enableWidgets()
-                self.update_reconstruction_state()
-            else:
-                recBut.setEnabled(False)
+            if qlProj:
+                Script.run(f"rm -f {qlProj}", short=False)
+            self.ui.quickLook.setStyleSheet("")
+            self.ui.quickLook.setText('Quick look')
+            self.enableWidgets()
             if errMsg:
                 self.addErrToConsole(errMsg)
                 return -1
@@ -1684,60 +3332,276 @@ class MainWindow(QtWidgets.QMainWindow):
             onStopMe()
             return -1
         projFile, _, _, step, wdir = commres
-        if projFile == self.onStorNamePrefix() + "clean.hdf" \
-           and self.ui.saveStitched.isChecked() :
-                interimFile = self.onStorNamePrefix() + "clean_deleteMeWhenDone.hdf"
-                if self.execScrProc("Creating interim projections volume."
-                                    , f"  cp '{projFile}' '{interimFile}' " ) :
-                    return onStopMe(f"Failed to create interim projections volume in {outPath}.")
-                projFile = interimFile
-        delMe = projFile
+        binn = self.ui.quickBin.value()
+        testPrefix = path.join(path.realpath(wdir), "tmp", "QUICK")
+        Script.run(f"mkdir -p \"{path.dirname(testPrefix)}\"")
+        # single streaming pass binning all three dimensions: rows, columns and projections
+        qlProj = f"{testPrefix}_proj.hdf"
+        qlRec = f"{testPrefix}_rec.hdf"
+        # volumes of the previous quick look may differ in size and would not be overwritten whole
+        if self.execScrProc(f"Binning projections by {binn}",
+                            f"rm -f {qlProj} {qlRec} && \n"
+                            f"ctas v2v -v {projFile}:/data -b {binn},{binn},{binn} -o {qlProj}:/data") :
+            return onStopMe()
 
+        # same processing chain with parameters scaled to the binned pixel
+        ring = max(1, round(self.ui.ring.value() / binn)) if self.ui.ring.value() else 0
         if self.ui.ringOrder.checkedButton() is self.ui.ringBeforePhase :
-            if self.applyRing(f"{projFile}:/data:y", saveHist=True) or self.applyPhase(f"{projFile}:/data", True):
-                return onStopMe()
+            failed = self.applyRing(f"{qlProj}:/data:y", ring=ring) \
+                     or self.applyPhase(f"{qlProj}:/data", binn=binn)
         else:
-            if self.applyPhase(f"{projFile}:/data", True) or self.applyRing(f"{projFile}:/data:y", saveHist=True):
-                return onStopMe()
+            failed = self.applyPhase(f"{qlProj}:/data", binn=binn) \
+                     or self.applyRing(f"{qlProj}:/data:y", ring=ring)
+        if failed:
+            return onStopMe()
+        if self.applyCT(step * binn, f"{qlProj}:/data:y", f"{qlRec}:/data", binn=binn):
+            return onStopMe()
+        if self.scrProc.dryRun:
+            self.addErrToConsole("Dry run. No reconstruction performed.")
+            return onStopMe()
+
+        x, y, z = hdf5shape(qlRec, "data")
+        if not x or not y or not z:
+            return onStopMe(f"Can't find quick-look reconstruction in file \"{qlRec}\".")
+        if self.execScrProc("Saving orthogonal slices",
+                            f"ctas v2v {qlRec}:/data:{z//2} -o {testPrefix}_z.tif && \n"
+                            f"ctas v2v {qlRec}:/data:y{y//2} -o {testPrefix}_y.tif && \n"
+                            f"ctas v2v {qlRec}:/data:x{x//2} -o {testPrefix}_x.tif \n") :
+            return onStopMe()
+        self.addToConsole(f"Quick-look reconstruction of projections binned by {binn} is in {qlRec}."
+                          f" Its central orthogonal slices are in {testPrefix}_z.tif, {testPrefix}_y.tif"
+                          f" and {testPrefix}_x.tif.")
+        return onStopMe()
+
+
+    def roiRegion(self, x, y):
+        # Parses region of interest for projections x wide with y rows: slices FIRST:END and in-plane
+        # box X0:X1,Y0:Y1, ends not included. Returns (first, end, x0, x1, y0, y1) with the whole
+        # volume for empty fields or None if malformed.
+        try:
+            first, end = 0, y
+            if txt := self.ui.roiSlices.text().strip():
+                first, end = ( int(val) for val in txt.split(':') )
+            x0, x1, y0, y1 = 0, x, 0, x
+            if txt := self.ui.roiBox.text().strip():
+                (x0, x1), (y0, y1) = ( ( int(val) for val in rng.split(':') ) for rng in txt.split(',') )
+            if not ( 0 <= first < end <= y and 0 <= x0 < x1 <= x and 0 <= y0 < y1 <= x ):
+                raise ValueError
+        except ValueError:
+            return None
+        return first, end, x0, x1, y0, y1
+
+
+    def roiHalo(self):
+        # Rows around the region of interest needed by the phase retrieval, as for the test slice.
+        return 64 if self.phaseOptions() else 0
+
+
+    def estimateRoi(self, x, y, z):
+        # Describes sizes of the volumes and time needed to reconstruct the region of interest.
+        if (roi := self.roiRegion(x, y)) is None:
+            return None
+        first, end, x0, x1, y0, y1 = roi
+        if roi == (0, y, 0, x, 0, x):
+            return f"Whole volume: {humanSize(4*x*x*y)} output."
+        halo = self.roiHalo()
+        rows = min(y, end + halo) - max(0, first - halo)
+        interim = 4*x*z*rows + ( 4*x*x*(end-first) if (x0, x1, y0, y1) != (0, x, 0, x) else 0 )
+        return f"{humanSize(4*(x1-x0)*(y1-y0)*(end-first))} output, {humanSize(interim)} interim," \
+               f" about {math.ceil(100*rows/y)}% of the whole volume time."
+
+
+    @pyqtSlot()
+    def update_roi_estimate(self):
+        if self.projSize is None:
+            self.ui.roiEstimate.setText("")
+            return
+        estimate = self.estimateRoi(*self.projSize)
+        x, y, _ = self.projSize
+        self.ui.roiEstimate.setText(estimate or f"Region is outside of {y} slices of {x} x {x} pixels.")
+        self.ui.roiEstimate.setStyleSheet("" if estimate else warnStyle)
+
+
+    @pyqtSlot()
+    def on_reconstruct_clicked(self):
+        if self.scrProc.isRunning():
+            self.scrProc.stop()
+            return -1
+
+        self.saveConfiguration(path.join(self.ui.outPath.text(), self.configName))
+        self.addToConsole()
+        recBut = self.ui.reconstruct
+        self.enableWidgets(recBut)
+        recBut.setStyleSheet(warnStyle)
+        recBut.setText('Stop')
+        toRet = self.execSteps(self.recSteps(self.scrProc, self.onStorNamePrefix()))
+        recBut.setStyleSheet("")
+        recBut.setText('Reconstruct')
+        if self.sender() is recBut:
+            self.enableWidgets()
+            self.update_reconstruction_state()
+        else:
+            recBut.setEnabled(False)
+        return toRet
+
+
+    def recSteps(self, script, wdir):
+        # Reconstruction of the sub-sample in wdir in the script, as steps of a task.
+        delMe = [] # interim volumes removed when done
+        try:
+            return (yield from self.recVolumeSteps(script, wdir, delMe))
+        finally: # also if the task is cancelled
+            if toRm := [ fl for fl in dict.fromkeys(delMe) if path.exists(fl) ]:
+                self.addToConsole(f"Cleaning interim volumes {' '.join(toRm)}.")
+                Script.run(f"rm -f {' '.join(toRm)} &", short=False)
+
+
+    def recVolumeSteps(self, script, wdir, delMe):
+        # Appends interim volumes to delMe as soon as they are created.
+        def onStopMe(errMsg):
+            self.addErrToConsole(errMsg)
+            return -1
+
+        if (commres := (yield from self.commonRecSteps(script, wdir, False))) is None:
+            return -1
+        projFile, _, _, step, wdir = commres
+        x, y, z = hdf5shape(projFile, "data")
+        if not (x and y and z):
+            return onStopMe(f"Failed to read sizes of projecion file {projFile}")
+        if (roi := self.roiRegion(x, y)) is None:
+            return onStopMe(f"Region of interest is outside of {y} slices of {x} x {x} pixels.")
+        first, end, x0, x1, y0, y1 = roi
+        nofSlices = end - first
+        inBox = (x0, x1, y0, y1) != (0, x, 0, x)
+        rows = None
+        isRoi = roi != (0, y, 0, x, 0, x)
+        recName = "rec_roi" if isRoi else "rec" # region never overwrites reconstruction of the whole volume
+        fused = self.ui.fusedRec.isChecked() and not isRoi # region needs no blocks
+        if isRoi:
+            self.addToConsole(f"Reconstructing region of interest: slices {first}:{end},"
+                              f" box {x0}:{x1},{y0}:{y1}. {self.estimateRoi(x, y, z)}")
+            # only rows of the region padded for the phase retrieval are extracted and filtered
+            halo = self.roiHalo()
+            hstart, hend = max(0, first - halo), min(y, end + halo)
+            roiFile = self.pickScratch(4*x*z*(hend-hstart), "clean_roi.hdf", wdir) \
+                      or wdir + "clean_roi_deleteMeWhenDone.hdf"
+            delMe.append(roiFile)
+            if (yield from self.scriptStep(script, "Extracting region of interest",
+                                f"rm -f '{roiFile}' && \n"
+                                f"ctas v2v -v {projFile}:/data -c ,{hstart}:{hend} -o {roiFile}:/data")) :
+                return onStopMe(f"Failed to extract region of interest into {roiFile}.")
+            projFile = roiFile
+            rows = (first - hstart, nofSlices)
+            # region of the previous run would be mixed with this one otherwise
+            yield from self.scriptStep(script, "Removing previous region of interest",
+                             f"rm -f {path.join(wdir, recName + '.hdf')} {path.join(wdir, recName, 'rec_')}*.tif")
+        else:
+            inPlace = not fused and ( self.ui.ring.value() or self.phaseOptions() )
+            keepProj = projFile == path.realpath(wdir + "clean.hdf") \
+                       and self.ui.saveStitched.isChecked()
+            if keepProj and inPlace :
+                    interimFile = self.pickScratch(path.getsize(projFile), "clean_filtered.hdf", wdir) \
+                                  or wdir + "clean_deleteMeWhenDone.hdf"
+                    delMe.append(interimFile)
+                    if (yield from self.scriptStep(script, "Creating interim projections volume."
+                                                   , f"  cp '{projFile}' '{interimFile}' " )) :
+                        return onStopMe(f"Failed to create interim projections volume {interimFile}.")
+                    projFile = interimFile
+                    keepProj = False
+            if not keepProj : # kept projections are not modified and allow to resume reconstruction
+                delMe.append(projFile)
+
+        if fused:
+            pass # filters are applied on the fly
+        elif self.ui.ringOrder.checkedButton() is self.ui.ringBeforePhase :
+            if (yield from self.ringSteps(script, f"{projFile}:/data:y", saveHist=True)) \
+               or (yield from self.phaseSteps(script, f"{projFile}:/data", True)):
+                return -1
+        else:
+            if (yield from self.phaseSteps(script, f"{projFile}:/data", True)) \
+               or (yield from self.ringSteps(script, f"{projFile}:/data:y", saveHist=True)):
+                return -1
 
         outPath = ""
+        outFile = ""
         if self.ui.recInMem.isChecked():
-            x, y, z = hdf5shape(projFile, "data")
-            if not (x and y and z):
-                return onStopMe(f"Failed to read sizes of projecion file {projFile}")
-            outTest = self.inMemNamePrexix() + "prerec.tif"
-            outFile = self.inMemNamePrexix() + "rec.hdf"
+            recSize = 4*(x1-x0)*(y1-y0)*nofSlices
+            if not (outFile := self.pickScratch(recSize, f"{recName}.hdf", wdir)):
+                return onStopMe("No scratch tier (shared one on SLURM) has space for the reconstructed volume."
+                                " Try to reconstruct directly into storage.")
+            outTest = outFile.removesuffix(f"{recName}.hdf") + "prerec.tif"
             outPath = outFile + ":/data"
-            self.addToConsole(f"Reconstructing into memory: {outPath}.")
-            if self.execScrProc("Creating file for reconstructed volume.",
-                    f"convert -size {x}x{x} -colorspace gray canvas:black {outTest} && \n"
-                    f"ctas v2v {outTest} -o {outPath}::{y} && \n"
-                    f"if (( {4*x*x*y} >  $( du --block-size=1 {outFile} | cut -d$'\t' -f1 ) )) ; then \n"
+            self.addToConsole(f"Reconstructing into scratch: {outPath}.")
+            if (yield from self.scriptStep(script, "Creating file for reconstructed volume.",
+                    f"convert -size {x1-x0}x{y1-y0} -colorspace gray canvas:black {outTest} && \n"
+                    f"ctas v2v {outTest} -o {outPath}::{nofSlices} && \n"
+                    f"if (( {recSize} >  $( du --block-size=1 {outFile} | cut -d$'\t' -f1 ) )) ; then \n"
                     f"  cp --sparse=never {outFile} {outFile}.tmp  && \n"
                     f"  mv {outFile}.tmp {outFile}\n"
                      "fi\n"
-                    f"rm -f {outTest}\n" ) :
+                    f"rm -f {outTest}\n" )) :
                 return onStopMe(f"Failed to create reconstructed volume in {outPath}."
-                                 "Probably not enough memory. Try to reconstruct directly into storage.")
+                                 "Probably not enough space. Try to reconstruct directly into storage.")
         elif self.ui.resTIFF.isChecked():
-            odir = "rec"
+            odir = recName
             Script.run(f"mkdir -p {path.join(wdir,odir)} ")
             outPath = path.join(odir,"rec_@.tif")
         else:
-            outPath = "rec.hdf:/data"
-        if self.applyCT(step, f"{projFile}:/data:y", outPath, True):
-            return onStopMe()
+            outPath = f"{recName}.hdf:/data"
+        slabFile = "" # whole slices of the region before they are cropped to the box
+        if inBox:
+            slabFile = self.pickScratch(4*x*x*nofSlices, "rec_slab.hdf", wdir) \
+                       or wdir + "rec_slab_deleteMeWhenDone.hdf"
+            delMe.append(slabFile)
+            yield from self.scriptStep(script, "Removing previous slab", f"rm -f '{slabFile}'")
+        if fused:
+            # block volume in a known place, so that it is removed even if the script is killed
+            blkFile = self.pickScratch(4*x*z*(256 + 2*self.roiHalo()), "fused_block.hdf", wdir) \
+                      or wdir + "fused_block_deleteMeWhenDone.hdf"
+            delMe.append(blkFile)
+            if (yield from self.fusedSteps(script, step, projFile, outPath, True, blkFile)):
+                return -1
+        elif (yield from self.ctSteps(script, step, f"{projFile}:/data:y",
+                                      f"{slabFile}:/data" if inBox else outPath, True, True, rows=rows)):
+            return -1
+        if inBox:
+            if (yield from self.scriptStep(script, "Cropping region of interest",
+                                           f"ctas v2v -v {slabFile}:/data -c {x0}:{x1},{y0}:{y1} -o {outPath}")):
+                return onStopMe(f"Failed to crop region of interest into {outPath}.")
 
+        toRet = 0
+        resPath = path.join(path.realpath(wdir), f"{recName}.hdf")
         if self.ui.recInMem.isChecked() and not self.ui.recInMemOnly.isChecked():
-            resPath = path.join(path.realpath(wdir),'rec.hdf')
-            self.execScrProc(f"Copying reconstruction to the storage into {resPath}",
-                             f"cp -f {self.inMemNamePrexix()}rec.hdf {resPath}")
-
-        self.execScrRole("finish")
-        if self.scrProc.dryRun:
-            delMe = None
+            if repack := self.recRepack():
+                toRet = yield from self.scriptStep(script,
+                                                   f"Compressing reconstruction to the storage into {resPath}",
+                                                   f"{repack} {outFile}:/data {resPath}:/data")
+            else:
+                toRet = yield from self.scriptStep(script,
+                                                   f"Copying reconstruction to the storage into {resPath}",
+                                                   f"cp -f {outFile} {resPath}")
+        elif outPath == f"{recName}.hdf:/data" and (repack := self.recRepack()):
+            toRet = yield from self.scriptStep(script, f"Compressing reconstruction {resPath}",
+                                               f"{repack} {resPath}:/data")
+
+        yield from self.roleStep("finish")
+        if script.dryRun:
+            delMe.clear()
             self.addErrToConsole("Dry run. No reconstruction performed.")
-        return onStopMe()
+        elif not isRoi: # region is not the product of the pipeline
+            self.recordNode("filter", wdir)
+            self.recordNode("rec", wdir)
+        return toRet
+
+
+    def recRepack(self):
+        # Command compressing reconstructed volume as selected or empty string if uncompressed.
+        mode = self.ui.resCompression.currentIndex()
+        if not mode:
+            return ""
+        zArg = f"lossy={self.ui.resDigits.value()}" if mode == 2 and not self.ui.resDataFormat.currentIndex() \
+               else "lossless"
+        return path.join(execPath, "imbl-repack.sh") + f" -k 1,{2**31-1} -z {zArg}" # whole slices in chunks
 
 
     @pyqtSlot()
@@ -1747,6 +3611,51 @@ class MainWindow(QtWidgets.QMainWindow):
             isrunning = isrunning or script.isRunning()
         self.ui.termini.setVisible(isrunning)
         self.ui.termini.setStyleSheet(warnStyle if isrunning else "")
+        if isrunning and not self.govTimer.isActive():
+            self.govTimer.start()
+        elif not isrunning:
+            self.govTimer.stop()
+            self.govStats = {}
+            self.govUsage.clear()
+
+
+    @pyqtSlot()
+    def update_governor(self):
+        cpus = self.ui.govCpus.text().strip()
+        if cpus and Script.run(f"taskset -c '{cpus}' true")[0]:
+            self.ui.govCpus.setStyleSheet(warnStyle)
+            cpus = ""
+        else:
+            self.ui.govCpus.setStyleSheet("")
+        self.governor.cpus = cpus
+        self.governor.memory = int(self.ui.govMem.value() * 2**30)
+        self.governor.ioWeight = self.ui.govIO.value()
+        if self.governor.isActive():
+            Governor.probe()
+
+
+    @pyqtSlot()
+    def monitorUsage(self):
+        report = []
+        for script in self.ui.findChildren(Script):
+            if not script.isRunning() or not (pid := script.proc.pid()):
+                continue
+            role = script.role()
+            stats = self.govStats.setdefault(pid, {"procs": {}, "oom": None, "warned": False})
+            cpu, rss = Governor.usage(pid, stats["procs"])
+            report.append(f"{role}: CPU {cpu:.0f}%, RAM {rss / 2**30:.1f}GiB")
+            limit = self.governor.memory
+            if limit and rss > 0.9 * limit and not stats["warned"]:
+                stats["warned"] = True
+                self.addErrToConsole(f"WARNING! Script \"{role}\" uses {rss / 2**30:.1f}GiB"
+                                     f" close to its memory limit of {limit / 2**30:.1f}GiB.")
+            if limit and self.governor.useScopes():
+                ooms = Governor.oomKills(Governor.cgroup(pid))
+                if stats["oom"] is not None and ooms > stats["oom"]:
+                    self.addErrToConsole(f"WARNING! Memory limit of script \"{role}\" exceeded:"
+                                         f" {ooms - stats['oom']} process(es) killed.")
+                stats["oom"] = ooms
+        self.govUsage.setText("; ".join(report))
 
 
     @pyqtSlot()
@@ -1766,4 +3675,5 @@ for rmfn in set(listOfCreatedMemFiles):
     toRm += f" {rmfn}*"
 if toRm:
     Script.run(f"rm -f {toRm} &")
+ShellWorker.shutdown()
 sys.exit(exitSts)
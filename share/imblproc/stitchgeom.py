@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+# Geometry of the projection formation: canvas size, tile placement and crop windows of the
+# stitched images and memory footprint of the stitched volume. Shared by the UI and the scripts
+# to know the result without running the ctas proj test.
+#
+# All positions are (X,Y) in pixels. Origins, final crop and flip origin are in binned pixels,
+# as given to ctas proj; source crop is in the original pixels and applied before binning.
+
+import re
+import sys
+import argparse
+
+
+def roundToInt(val):
+    # same as printf "%.0f": round half to even
+    return int(round(float(val)))
+
+
+def parseCrop(crop):
+    # Returns (top, left, bottom, right) from either "T,L,B,R" or "L-R,T-B" form. The form is
+    # chosen by the number of fields, as the values of the former may be negative.
+    if not crop:
+        return (0, 0, 0, 0)
+    if isinstance(crop, (tuple, list)):
+        return tuple(int(val) for val in crop)
+    fields = crop.replace(':', ',').split(',')
+    if len(fields) == 2:
+        def parseRange(rng):
+            if not rng:
+                return (0, 0)
+            match = re.fullmatch(r'\s*(-?\d*)\s*-\s*(-?\d*)\s*', rng)
+            if not match:
+                raise ValueError(f"Wrong crop range \"{rng}\" in \"{crop}\".")
+            return tuple(int(val) if val else 0 for val in match.groups())
+        (left, right), (top, bottom) = parseRange(fields[0]), parseRange(fields[1])
+        return (top, left, bottom, right)
+    vals = [int(val) for val in fields if val.strip()]
+    return tuple((vals + [0, 0, 0, 0])[:4])
+
+
+def parsePair(pair, default=(0, 0)):
+    if pair is None or pair == "":
+        return default
+    if isinstance(pair, (tuple, list)):
+        return tuple(pair)
+    vals = [float(val) for val in pair.replace(':', ',').split(',') if val]
+    if len(vals) == 1:
+        vals *= 2
+    return tuple(int(val) if val.is_integer() else val for val in vals[:2])
+
+
+def formatPair(pair):
+    return ",".join(str(val) for val in parsePair(pair))
+
+
+def rebinned(val, previous, current):
+    # Value in binned pixels after the binning factor changes from previous to current.
+    # Explicit type conversion needed to address bug https://bugs.launchpad.net/rapid/+bug/1946407
+    return type(val)(previous / current * val)
+
+
+def stitchGeometry(size, tiles=1, origin=(0, 0), secondSize=0, secondOrigin=(0, 0), flipOrigin=None,
+                   crop=(0, 0, 0, 0), cropFinal=(0, 0, 0, 0), binn=(1, 1), projections=1, zinn=1):
+    # Returns dictionary with:
+    #   tile - size of the single tile after cropping and binning;
+    #   origins - list of tile positions (X,Y) on the canvas, flipped tiles following the direct ones;
+    #   flipped - list of flags marking flipped tiles;
+    #   windows - list of the parts of the tiles in the final image: x0, y0, x1, y1;
+    #   canvas - size of the final image (X,Y) after the final crop;
+    #   corner - position of the top left corner of the final image in the coordinates of the origins;
+    #   projections - number of the projections;
+    #   shape - shape of the stitched volume (Z,Y,X) as reported by ctas proj --test;
+    #   bytes - memory footprint of the stitched float volume.
+    # Pure python: there are at most few dozens of tiles, not worth the import of numpy.
+    width, hight = size
+    top, left, bottom, right = parseCrop(crop)
+    binx, biny = parsePair(binn, (1, 1))
+    tile = ( (width - left - right) // binx, (hight - top - bottom) // biny )
+    tiles = max(1, tiles)
+    inner = max(1, tiles // secondSize) if secondSize > 1 else tiles
+    org, sorg = parsePair(origin), parsePair(secondOrigin)
+    origins = [ tuple( (idx % inner) * org[ax] + (idx // inner) * sorg[ax] for ax in (0, 1) )
+                for idx in range(tiles) ]
+    flipped = [False] * tiles
+    if flipOrigin is not None:
+        # flipped copy of the whole stitched image mirrored around its vertical axis
+        lox = min(pos[0] for pos in origins)
+        hix = max(pos[0] for pos in origins) + tile[0]
+        forg = parsePair(flipOrigin)
+        origins += [ (lox + hix - pos[0] - tile[0] + forg[0], pos[1] + forg[1]) for pos in origins ]
+        flipped += [True] * tiles
+    lo = tuple( min(pos[ax] for pos in origins) for ax in (0, 1) )
+    hi = tuple( max(pos[ax] for pos in origins) + tile[ax] for ax in (0, 1) )
+    ftop, fleft, fbottom, fright = parseCrop(cropFinal)
+    fcrop = (fleft + fright, ftop + fbottom)
+    canvas = tuple( int(max(0, hi[ax] - lo[ax] - fcrop[ax])) for ax in (0, 1) )
+    corner = (lo[0] + fleft, lo[1] + ftop)
+    def clip(val, ax):
+        return min(max(val, 0), canvas[ax])
+    windows = [ ( clip(pos[0] - corner[0], 0), clip(pos[1] - corner[1], 1),
+                  clip(pos[0] - corner[0] + tile[0], 0), clip(pos[1] - corner[1] + tile[1], 1) )
+                for pos in origins ]
+    projections = max(0, projections) // max(1, zinn)
+    return { "tile": tuple(int(val) for val in tile),
+             "origins": origins,
+             "flipped": flipped,
+             "windows": windows,
+             "canvas": canvas,
+             "corner": tuple(float(val) for val in corner),
+             "projections": projections,
+             "shape": (projections, canvas[1], canvas[0]),
+             "bytes": 4 * projections * canvas[0] * canvas[1] }
+
+
+def ctasOptions(tiles=1, origin=(0, 0), secondSize=0, secondOrigin=(0, 0), flipOrigin=None):
+    # Stitching options of ctas proj for the same arguments as stitchGeometry.
+    opts = []
+    if tiles > 1:
+        opts += ["--origin", formatPair(origin)]
+        if secondSize > 1:
+            opts += ["--second-origin", formatPair(secondOrigin), "--second-size", str(secondSize)]
+    if flipOrigin is not None:
+        opts += ["--flip-origin", formatPair(flipOrigin)]
+    return " ".join(opts)
+
+
+def shiftGeometry(shift, cent=0, crop=(0, 0, 0, 0)):
+    # Crops and shifts of the shift-in-scan projection formation for the direct (D) and
+    # flipped (F) halves of the scan.
+    shiftX, shiftY = parsePair(shift)
+    top, left, bottom, right = parseCrop(crop)
+    centshift = roundToInt(2 * float(cent) - shiftX)
+    norgx = max(0, shiftX, centshift)
+    nendx = min(0, shiftX, centshift)
+    cropTB = abs(shiftY)
+    def cropOf(sft):
+        return f"{norgx - min(0, sft) + left}-{max(0, sft) - nendx + right}," \
+               f"{cropTB + top}-{cropTB + bottom}"
+    return { "centshift": centshift,
+             "cropD": cropOf(shiftX),
+             "cropF": cropOf(centshift),
+             "spshD": f"{shiftX},{shiftY}",
+             "spshF": f"{centshift},{shiftY}" }
+
+
+def humanSize(size):
+    for unit in ["", "K", "M", "G", "T"]:
+        if size < 1024 or unit == "T":
+            return f"{size:.1f}{unit}B" if unit else f"{size}B"
+        size /= 1024
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=
+     'Computes geometry of the projection formation without processing any images.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    stitch = commands.add_parser('stitch', help=
+     'Prints shape "Z Y X" of the stitched volume, same as ctas proj --test, followed by its size in bytes.')
+    stitch.add_argument('size', type=str,
+                        help='Size of the source images W,H.')
+    stitch.add_argument('-n', '--tiles', type=int, default=1,
+                        help='Number of the tiles to stitch.')
+    stitch.add_argument('-g', '--origin', type=str, default="0,0",
+                        help='Origin of the first stitch X,Y.')
+    stitch.add_argument('-G', '--second-origin', type=str, default="0,0",
+                        help='Origin of the second stitch X,Y.')
+    stitch.add_argument('-s', '--second-size', type=int, default=0,
+                        help='Number of the tile groups in the second stitch.')
+    stitch.add_argument('-f', '--flip-origin', type=str, default=None,
+                        help='Origin of the flip-and-stitch X,Y.')
+    stitch.add_argument('-c', '--crop', type=str, default="",
+                        help='Crop of the source images T,L,B,R or L-R,T-B.')
+    stitch.add_argument('-C', '--crop-final', type=str, default="",
+                        help='Crop of the final image T,L,B,R or L-R,T-B.')
+    stitch.add_argument('-b', '--binn', type=str, default="1",
+                        help='Binning factor(s) X[,Y].')
+    stitch.add_argument('-p', '--projections', type=int, default=1,
+                        help='Number of the projections.')
+    stitch.add_argument('-z', '--zinn', type=int, default=1,
+                        help='Projections binning factor.')
+    stitch.add_argument('-o', '--options', action='store_true',
+                        help='Print the stitching options of ctas proj on the first line.')
+    stitch.add_argument('-v', '--verbose', action='store_true',
+                        help='Print position and window of each tile in the final image.')
+
+    shift = commands.add_parser('shift', help=
+     'Prints shell assignments of centshift, cropD, cropF, spshD and spshF for the shift-in-scan.')
+    shift.add_argument('-g', '--shift', type=str, required=True,
+                       help='Spatial shift in pixels X,Y.')
+    shift.add_argument('-c', '--centre', type=float, default=0,
+                       help='Deviation of rotation axis from the center of original image.')
+    shift.add_argument('-C', '--crop', type=str, default="",
+                       help='Crop of the final image T,L,B,R.')
+
+    args = parser.parse_args()
+    try:
+        if args.command == 'stitch':
+            geom = stitchGeometry(parsePair(args.size), args.tiles, args.origin, args.second_size,
+                                  args.second_origin, args.flip_origin, args.crop, args.crop_final,
+                                  args.binn, args.projections, args.zinn)
+            if args.options:
+                print(ctasOptions(args.tiles, args.origin, args.second_size, args.second_origin,
+                                  args.flip_origin))
+            if args.verbose:
+                for org, flp, win in zip(geom["origins"], geom["flipped"], geom["windows"]):
+                    print("# tile {} at {},{}: window {},{} - {},{}".format(
+                          "flipped" if flp else "direct", *org, *win))
+            print(*geom["shape"], geom["bytes"])
+        else:
+            geom = shiftGeometry(args.shift, args.centre, args.crop)
+            for key, val in geom.items():
+                print(f"{key}={val}")
+    except ValueError as err:
+        print(f"ERROR! {err}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Minimal reader of the uncompressed single-channel TIFF images written by ctas, used to load
+# exported tiles without additional image libraries, and helpers to arrange the tiles.
+
+import os
+import re
+import numpy
+
+
+tiffTypes = { 1: 'u1', 2: 'u1', 3: 'u2', 4: 'u4', 5: 'u4', 6: 'i1', 7: 'u1', 8: 'i2', 9: 'i4',
+              10: 'i4', 11: 'f4', 12: 'f8', 16: 'u8', 17: 'i8' }
+tiffSizes = { 1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 16: 8, 17: 8 }
+
+
+def readTiff(fileName):
+    # Returns the first image in the file as 2D float32 array. Raises ValueError if the file is
+    # not a TIFF or uses features which are not supported: compression, tiling or multiple channels.
+    with open(fileName, 'rb') as tfile:
+        data = tfile.read()
+    order = {b'II': '<', b'MM': '>'}.get(data[:2])
+    if order is None or numpy.frombuffer(data, order + 'u2', 1, 2)[0] != 42:
+        raise ValueError(f"{fileName} is not a TIFF file.")
+    ifd = int(numpy.frombuffer(data, order + 'u4', 1, 4)[0])
+    nofTags = int(numpy.frombuffer(data, order + 'u2', 1, ifd)[0])
+    tags = {}
+    for entry in range(ifd + 2, ifd + 2 + 12 * nofTags, 12):
+        tag, typ = (int(val) for val in numpy.frombuffer(data, order + 'u2', 2, entry))
+        count = int(numpy.frombuffer(data, order + 'u4', 1, entry + 4)[0])
+        if typ not in tiffTypes:
+            continue
+        size = tiffSizes[typ] * count
+        offset = entry + 8 if size <= 4 else int(numpy.frombuffer(data, order + 'u4', 1, entry + 8)[0])
+        if typ in (5, 10):
+            count *= 2
+        tags[tag] = numpy.frombuffer(data, order + tiffTypes[typ], count, offset)
+    def tagVal(tag, default=None):
+        if tag not in tags:
+            if default is None:
+                raise ValueError(f"Required TIFF tag {tag} is missing in {fileName}.")
+            return default
+        return int(tags[tag][0])
+    width = tagVal(256)
+    hight = tagVal(257)
+    bits = tagVal(258, 8)
+    if tagVal(259, 1) != 1:
+        raise ValueError(f"Compressed TIFF {fileName} is not supported.")
+    if tagVal(277, 1) != 1 or 273 not in tags:
+        raise ValueError(f"Multi-channel or tiled TIFF {fileName} is not supported.")
+    kind = {1: 'u', 2: 'i', 3: 'f'}.get(tagVal(339, 1), 'u')
+    dtype = numpy.dtype(f"{order}{kind}{bits // 8}")
+    strips = [ data[off:off+cnt] for off, cnt in zip(tags[273], tags.get(279, [width * hight * dtype.itemsize])) ]
+    image = numpy.frombuffer(b''.join(strips), dtype, width * hight).reshape(hight, width)
+    return image.astype(numpy.float32)
+
+
+def findTiles(prefix):
+    # Returns dictionary {projection: [tile files ordered by the tile index]} of the tiles
+    # exported by imbl-stitch.sh -e into files named <prefix><projection>_<tile>.tif.
+    found = {}
+    dirName = os.path.dirname(prefix) or '.'
+    pattern = re.compile(re.escape(os.path.basename(prefix)) + r'([0-9]+)_([0-9]+)\.tif$')
+    for fileName in sorted(os.listdir(dirName)) if os.path.isdir(dirName) else []:
+        if lres := pattern.match(fileName):
+            found.setdefault(int(lres.group(1)), {})[int(lres.group(2))] = os.path.join(dirName, fileName)
+    return { proj: [ tiles[idx] for idx in sorted(tiles) ] for proj, tiles in sorted(found.items()) }
+
+
+def binImage(image, binx=1, biny=1):
+    # Averages blocks of binx x biny pixels; incomplete blocks at the edges are dropped.
+    if binx <= 1 and biny <= 1:
+        return image
+    hight, width = (image.shape[0] // biny) * biny, (image.shape[1] // binx) * binx
+    return image[:hight, :width].reshape(hight // biny, biny, width // binx, binx).mean(axis=(1, 3))
+
+
+def rotateImage(image, angle):
+    # Bilinear rotation by angle in degrees around the centre of the image; keeps the size
+    # and fills the uncovered corners with the mean value.
+    if not angle:
+        return image
+    hight, width = image.shape
+    cos, sin = numpy.cos(numpy.radians(angle)), numpy.sin(numpy.radians(angle))
+    yy, xx = numpy.mgrid[0:hight, 0:width].astype(numpy.float32)
+    yy -= (hight - 1) / 2
+    xx -= (width - 1) / 2
+    xs = cos * xx + sin * yy + (width - 1) / 2
+    ys = - sin * xx + cos * yy + (hight - 1) / 2
+    inside = (xs >= 0) & (xs <= width - 1) & (ys >= 0) & (ys <= hight - 1)
+    x0 = numpy.clip(numpy.floor(xs).astype(int), 0, width - 2)
+    y0 = numpy.clip(numpy.floor(ys).astype(int), 0, hight - 2)
+    fx, fy = xs - x0, ys - y0
+    rotated = ( image[y0, x0] * (1 - fx) * (1 - fy) + image[y0, x0 + 1] * fx * (1 - fy)
+              + image[y0 + 1, x0] * (1 - fx) * fy + image[y0 + 1, x0 + 1] * fx * fy )
+    rotated[~inside] = image.mean()
+    return rotated.astype(numpy.float32)
+
+
+def prepareTile(image, crop=(0, 0, 0, 0), binn=(1, 1), rotate=0.0, scale=1):
+    # Tile as it enters the stitching: rotated, cropped by (top, left, bottom, right) and binned.
+    # With scale > 1 the tile is additionally reduced by that factor; the image is reduced first
+    # then, which is much faster and accurate enough for previews.
+    top, left, bottom, right = crop
+    if scale > 1:
+        redx, redy = binn[0] * scale, binn[1] * scale
+        image = rotateImage(binImage(image, redx, redy), rotate)
+        return image[round(top / redy):image.shape[0] - round(bottom / redy),
+                     round(left / redx):image.shape[1] - round(right / redx)]
+    image = rotateImage(image, rotate)
+    image = image[top:image.shape[0] - bottom, left:image.shape[1] - right]
+    return binImage(image, *binn)
+
+
+def composite(tiles, geom, scale=1):
+    # Places prepared tiles at the origins of the geometry computed by stitchgeom.stitchGeometry;
+    # flipped tiles are mirrored and later tiles overlay earlier ones. Tiles prepared with scale > 1
+    # are placed on the canvas reduced by the same factor.
+    canvas = numpy.full(( max(1, geom["canvas"][1] // scale), max(1, geom["canvas"][0] // scale) ),
+                        numpy.mean([ tile.mean() for tile in tiles ]), dtype=numpy.float32)
+    for tile, org, flp in zip(tiles, geom["origins"], geom["flipped"]):
+        if flp:
+            tile = tile[:, ::-1]
+        ox, oy = ( int(round(val)) for val in (numpy.array(org) - geom["corner"]) / scale )
+        hight, width = tile.shape
+        ys, xs = max(0, oy), max(0, ox)
+        ye, xe = min(canvas.shape[0], oy + hight), min(canvas.shape[1], ox + width)
+        if ye > ys and xe > xs:
+            canvas[ys:ye, xs:xe] = tile[ys - oy:ye - oy, xs - ox:xe - ox]
+    return canvas